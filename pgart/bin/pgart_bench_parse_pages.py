@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# The parse speed of the web pages of the price sites, from the pages in xtra_pages.
+# The page is fed in chunks as from the network, the same way as the fetchers do it, until the table is closed.
+# xtra_pages/<site>_synthetic.html.gz are made up: the table in the layout of the site in a page of filler. They test the
+# parser, the numbers do not tell how fast a real page is. A page recorded with -r, xtra_pages/<site>.html.gz, is used
+# instead when it is there.
+#   pgart_bench_parse_pages.py              all sites, 50 parses each.
+#   pgart_bench_parse_pages.py -n 200 -s entsoe_eu -c 4096
+#   pgart_bench_parse_pages.py -r           records the pages of today from the sites.
+# read kB: the part of the page read before the table was closed. peak kB: the memory of the parse, tracemalloc.
+# text kB: the page as one string, what request.text held before.
+
+import getopt, sys
+import os
+import gzip
+import time
+import tracemalloc
+
+from datetime import datetime
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_http_func as f13
+import pgart_html_func as f15
+import pgart_get_hourly_rates_entsoe_eu as entsoe
+import pgart_get_hourly_rates_herrforsnat_fi as herrforsnat
+import pgart_get_hourly_rates_minspotpris_no as minspotpris
+import pgart_get_monthly_rates_elbruk_se as elbruk
+
+te = f1.get_pgart_env()
+
+
+def get_minspotpris_slots(rows) :
+    # The first day of the page.
+    if len(rows) == 0 :
+        return([])
+
+    slots, found = minspotpris.get_slots_from_rows(rows, rows[0][0][0], 0)
+    return(slots)
+
+
+# site: (url, steps, row_tags, cell_tags, stop, rows => the prices)
+g_sites = {
+           "entsoe_eu": (
+                         lambda : entsoe.get_url_entsoe("SE3", datetime.now(), "PT15M"),
+                         entsoe.page_steps, ("tr",), ("td", "th"), None, entsoe.get_slots_from_rows),
+           "herrforsnat_fi": (
+                              f1.get_url_herrforsnat, herrforsnat.page_steps, ("li",), ("span",),
+                              herrforsnat.is_end_of_list, herrforsnat.get_slots_from_rows),
+           "minspotpris_no": (
+                              f1.get_url_minspotpris, minspotpris.page_steps, ("tr",), ("td", "th"),
+                              minspotpris.is_end_of_table, get_minspotpris_slots),
+           "elbruk_se": (
+                         lambda : f1.get_url_elbruk("SE3"), elbruk.page_steps, ("tr",), ("td", "th"), None,
+                         elbruk.get_recs_from_rows)}
+
+
+def get_args() :
+    argv = sys.argv[1:]     # Bypass my own name
+    options = "n:s:c:r"
+    long_options = ["nr=", "sites=", "chunk=", "record"]
+    nr = 50
+    sites = list(g_sites.keys())
+    chunk_size = f13.stream_chunk_size
+    record = False
+    try:
+        args, values = getopt.getopt(argv, options, long_options)
+        for arg, val in args :
+            if arg in ("-n", "--nr") :
+                nr = int(val)
+            elif arg in ("-s", "--sites") :
+                sites = val.split(",")
+            elif arg in ("-c", "--chunk") :
+                chunk_size = int(val)
+            elif arg in ("-r", "--record") :
+                record = True
+    except (getopt.error, ValueError) as err :
+        print(str(err))
+        print("usage: pgart_bench_parse_pages.py -n <nr parses> -s <site,site...> -c <chunk bytes> -r")
+        exit()
+
+    for site in sites :
+        if site not in g_sites :
+            print("unknown site: "+site+". "+", ".join(g_sites.keys()))
+            exit()
+
+    return(nr, sites, chunk_size, record)
+
+
+def get_fi_page(site, synthetic=False) :
+    return(te["g_pgart_dir"]+"/xtra_pages/"+site+("_synthetic" if synthetic else "")+".html.gz")
+
+
+def get_bench_page(site) :
+    # (the file, "recorded" or "synthetic"). The recorded page when there is one.
+    if os.path.isfile(get_fi_page(site)) :
+        return(get_fi_page(site), "recorded")
+
+    return(get_fi_page(site, True), "synthetic")
+
+
+def record_page(site) :
+    url = g_sites[site][0]()
+    response = f13.get(url)
+    print(site, url, "status:"+str(response.status_code), "bytes:"+str(len(response.content)))
+    if response.status_code == 200 :
+        f = gzip.GzipFile(get_fi_page(site), "wb", mtime=0)
+        f.write(response.content)
+        f.close()
+
+
+def iter_chunks(page, chunk_size, nr_read) :
+    # As the network. nr_read[0]: the bytes read.
+    for i in range(0, len(page), chunk_size) :
+        nr_read[0] += len(page[i:i + chunk_size])
+        yield(page[i:i + chunk_size])
+
+
+def parse_page(site, page, chunk_size) :
+    url, steps, row_tags, cell_tags, stop, get_prices = g_sites[site]
+    nr_read = [0]
+    parser = f15.RowParser(steps, row_tags, cell_tags, stop)
+    rows, found = f15.parse_stream(iter_chunks(page, chunk_size, nr_read), parser)
+    return(rows, found, get_prices(rows), nr_read[0])
+
+
+def bench_site(site, nr, chunk_size) :
+    fi, page_type = get_bench_page(site)
+    f = gzip.open(fi, "rb")
+    page = f.read()
+    f.close()
+
+    t0 = time.perf_counter()
+    for i in range(0, nr) :
+        rows, found, prices, nr_read = parse_page(site, page, chunk_size)
+    ms = (time.perf_counter() - t0) * 1000 / nr
+
+    tracemalloc.start()
+    parse_page(site, page, chunk_size)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    text = page.decode("utf-8", errors="replace")
+    size, peak_text = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del text
+
+    print("{:15s} {:>9s} {:>8d} {:>8d} {:>5d} {:>7d} {:>8.2f} {:>8.1f} {:>8d} {:>8d}  {}".format(
+                                                                                       site, page_type, len(page) // 1024, nr_read // 1024, len(rows),
+                                                                                       len(prices), ms, nr_read / 1024 / 1024 / (ms / 1000),
+                                                                                       peak // 1024, peak_text // 1024, "" if found else "table not closed"))
+
+
+nr, sites, chunk_size, record = get_args()
+if record :
+    for site in sites :
+        record_page(site)
+    exit()
+
+print("chunk bytes:", chunk_size, "parses:", nr)
+print("{:15s} {:>9s} {:>8s} {:>8s} {:>5s} {:>7s} {:>8s} {:>8s} {:>8s} {:>8s}".format(
+                                                                             "site", "page", "page kB", "read kB", "rows", "prices", "ms",
+                                                                             "MB/s", "peak kB", "text kB"))
+for site in sites :
+    bench_site(site, nr, chunk_size)
+
+if any(get_bench_page(site)[1] == "synthetic" for site in sites) :
+    print("synthetic: a made-up page. The numbers show the parser, not the real site. Record the real page with -r.")
+
+exit()
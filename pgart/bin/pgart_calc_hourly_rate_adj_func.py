@@ -7,11 +7,18 @@
 
 # Functions to create an indoor temperature adjustments schedule based on hourly rates.
 
+import json
+import hashlib
+import os
+
 from pathlib import Path
+from datetime import datetime
 
 import pgart_misc_func as f0
+import pgart_env_func as f1
+
+te = f1.get_pgart_env()
 
-g_schedules = []
 
 def get_price_per_hour_range(fi_hourly_rate, start_hr, stop_hr) :
     hr_rates = f0.get_hourly_rates(fi_hourly_rate)
@@ -23,127 +30,161 @@ def get_price_per_hour_range(fi_hourly_rate, start_hr, stop_hr) :
     return(price_per_hour)
 
 
-def add_schedule(a,b,c,d,e,f,g,h,i,j,k,l, first_hour, start_hr, stop_hr):
-    global g_schedules
-    nr_hours = stop_hr - start_hr
-    total = a + b + c + d + e + f + g + h + i +j +k + l
-    if total < nr_hours:        # Too few hours to cover the test range
-        return
-
-    s = []
-    if first_hour == 0:         # Otherwise there would not be any range with a leading 0.
-        s.append(0)
-
-    for n in [ a, b, c, d, e, f, g, h, i, j, k, l ]:
-        if n == 3:
-            s.append(1)
-            s.append(1)
-            s.append(0)
-
-        if n == 2:
-            s.append(1)
-            s.append(0)
-
-    s = s[:nr_hours] # Keep only enough of hours to cover the range.
-    g_schedules.append(s)
-
-
-def create_hour_schedules(start_hr, stop_hr) :
-    first_hour = 0
-    for a in [2, 3]:
-        for b in [2, 3]:
-            for c in [2, 3]:
-                for d in [2, 3]:
-                    for e in [2, 3]:
-                        for f in [2, 3]:
-                            for g in [2, 3]:
-                                for h in [2, 3]:
-                                    for i in [2, 3]:
-                                        for j in [2, 3]:
-                                            for k in [2, 3]:
-                                                for l in [2, 3]:
-                                                    add_schedule(a,b,c,d,e,f,g,h,i,j,k,l, first_hour, start_hr, stop_hr)
-                                                    if first_hour == 0:
-                                                        first_hour = 1
-                                                    else :
-                                                        first_hour = 0
-
-
-def create_no_dup_hour_maps() :
-    i = 0
-    hour_maps = {}
-    for s in g_schedules:
-        i += 1
-        nr_set_hr = 0
-        ss = ""
-        for j in range(len(s)):
-            if s[j] == 1 :
-                nr_set_hr += 1
-
-            if ss == "" :
-                sep = ""
-            else :
-                sep = "."
-
-            ss += sep+str(s[j])
-
-        if hour_maps.get(ss, "0") == "0" :
-            hour_maps[ss] = nr_set_hr
-
-    return(hour_maps)
-
-
-def get_top_hour_map(hour_maps, price_per_hour, start_hr, stop_hr, g_verbose_logging) :
+def get_schedule_states(max_consecutive, min_halt) :
+    # A state tells what the previous hours look like.
+    # ("d", n): the last n hours were decreased. n = 1..max_consecutive.
+    # ("p", n): the last n hours were pause hours. n = 1..min_halt. ("p", min_halt) means "free to decrease again".
+    states = []
+    for n in range(1, max_consecutive + 1) :
+        states.append(("d", n))
+
+    for n in range(1, min_halt + 1) :
+        states.append(("p", n))
+
+    return(states)
+
+
+def get_next_schedule_state(state, switch, max_consecutive, min_halt) :
+    # Returns the state after the next hour, or None if the switch is not allowed.
+    kind, n = state
+    if switch == 1 :
+        if kind == "d" :
+            if n >= max_consecutive :       # Too many consecutive hours with a decrease.
+                return(None)
+            return(("d", n + 1))
+
+        if n < min_halt :                   # The pause after a decrease is not long enough yet.
+            return(None)
+        return(("d", 1))
+
+    if kind == "d" :
+        return(("p", 1))
+
+    return(("p", min(n + 1, min_halt)))
+
+
+def optimize_hour_schedule(price_per_hour, max_consecutive, min_halt) :
+    # Dynamic programming over the hours. Finds the switch list (1=decrease, 0=pause) with the highest
+    # sum of prices for the decreased hours where a decrease lasts at most max_consecutive hours
+    # and is followed by at least min_halt pause hours. O(hours * states).
+    states = get_schedule_states(max_consecutive, min_halt)
+    start_state = ("p", min_halt)           # Free to start with a decrease in the first hour.
+
+    best = {start_state: 0}                 # state => best price so far
+    back_pointers = []                      # One dict per hour: state => (previous state, switch)
+    for price in price_per_hour :
+        new_best = {}
+        back = {}
+        for state, total in best.items() :
+            for switch in [0, 1] :
+                next_state = get_next_schedule_state(state, switch, max_consecutive, min_halt)
+                if next_state is None :
+                    continue
+
+                new_total = total + price * switch
+                if next_state not in new_best or new_total > new_best[next_state] :
+                    new_best[next_state] = new_total
+                    back[next_state] = (state, switch)
+
+        best = new_best
+        back_pointers.append(back)
+
+    if len(price_per_hour) == 0 :
+        return([], 0)
+
+    # Follow the back pointers from the best end state.
+    state = max(states, key=lambda s: best.get(s, float("-inf")))
+    price = best[state]
+    schedule = []
+    for back in reversed(back_pointers) :
+        state, switch = back[state]
+        schedule.append(switch)
+
+    schedule.reverse()
+    return(schedule, round(price, 2))
+
+
+def get_top_hour_map(schedule, price_per_hour, start_hr, stop_hr, g_verbose_logging) :
     top_hour_map_price = {}
     top_hour_map = {}
-    price_per_schedule = {}
-    #print(price_per_hour)
-    #print(hour_maps)
-    for hour_map, nr_set_hr in hour_maps.items() :
-        hrs = hour_map.split(".")
-        price = 0
-        hr_ix = -1
-        for switch in hrs :
-            hr_ix += 1
-            if int(switch) > 0:
-                price += price_per_hour[hr_ix]
-
-        price = round(price, 2)
-        price_per_schedule.update({hour_map: price})
-
-    sorted_price_per_schedule = sorted(price_per_schedule.items(), key=lambda x: float(x[1]), reverse=True)
-
-    f0.print_json_var(g_verbose_logging, 5, "sorted_price_per_schedule: "+str(start_hr)+"-"+ str(stop_hr), sorted_price_per_schedule)
+
+    f0.print_json_var(g_verbose_logging, 5, "top_schedule: "+str(start_hr)+"-"+ str(stop_hr), schedule)
     f0.print_json_var(g_verbose_logging, 4, "price_per_hour", price_per_hour)
 
-    hour_map, price = list(sorted_price_per_schedule)[0]
     for i in range(0,24) :
         top_hour_map[i] = 0
         top_hour_map_price[i] = 0
 
-    hrs = hour_map.split(".")
     hr_ix = -1
-    for switch in hrs :
+    for switch in schedule :
         hr_ix += 1
-        if int(switch) > 0:
+        if switch > 0:
             top_hour_map[hr_ix+start_hr] = 1
             top_hour_map_price[hr_ix+start_hr] = price_per_hour[hr_ix]
         else :
             top_hour_map[hr_ix+start_hr] = 1
             top_hour_map_price[hr_ix+start_hr] = -1 # An hour in the range but the temp must not be decreased. A "paus" hour.
 
-    #print(top_hour_map_price)
-    return(top_hour_map, top_hour_map_price, price)
+    return(top_hour_map, top_hour_map_price)
 
 
-def create_top_hour_adj_maps(fi_hourly_rate, start_hr, stop_hr, g_verbose_logging) :
-    global g_schedules
-    g_schedules = []
+def create_top_hour_adj_maps(fi_hourly_rate, start_hr, stop_hr, max_consecutive, min_halt, g_verbose_logging) :
     price_per_hour = get_price_per_hour_range(fi_hourly_rate, start_hr, stop_hr)
-    create_hour_schedules(start_hr, stop_hr)
-    hour_maps = create_no_dup_hour_maps()
-    top_hour_map, top_hour_map_price, price = get_top_hour_map(hour_maps, price_per_hour, start_hr, stop_hr, g_verbose_logging)
+    schedule, price = optimize_hour_schedule(price_per_hour, int(max_consecutive), int(min_halt))
+    top_hour_map, top_hour_map_price = get_top_hour_map(schedule, price_per_hour, start_hr, stop_hr, g_verbose_logging)
     # This map has the optimal intervals when to decrease temp
     return(top_hour_map, top_hour_map_price, price)
 
 
+def get_plan_cache_key(fi_hourly_rate, start_hr, stop_hr, max_consecutive, min_halt) :
+    # The prices do not change during the day. The content decides, not the file name. Installations in
+    # the same el_area with the same parameters get the same key.
+    f = open(fi_hourly_rate, "rb")
+    content_hash = hashlib.sha256(f.read()).hexdigest()[:16]
+    f.close()
+    return(content_hash+"_"+str(start_hr)+"_"+str(stop_hr)+"_"+str(max_consecutive)+"_"+str(min_halt))
+
+
+def get_plan_cache() :
+    # Only plans from today are kept. The cache is emptied when the date rolls over.
+    dt_now = datetime.strftime(datetime.now(), "%Y-%m-%d")
+    plan_cache = {"date": dt_now, "plans": {}}
+    fi = Path(te["fi_hourly_rate_plan_cache"])
+    if fi.is_file():
+        f = open(te["fi_hourly_rate_plan_cache"], "r", encoding="utf8")
+        try:
+            saved_cache = json.load(f)
+        except ValueError:
+            saved_cache = {}
+        f.close()
+        if saved_cache.get("date", "-") == dt_now :
+            plan_cache = saved_cache
+
+    return(plan_cache)
+
+
+def save_plan_cache(plan_cache) :
+    fi_tmp = te["fi_hourly_rate_plan_cache"]+".tmp"
+    f = open(fi_tmp, "w", encoding="utf8")
+    f.write(json.dumps(plan_cache))
+    f.close()
+    os.replace(fi_tmp, te["fi_hourly_rate_plan_cache"])
+
+
+def get_top_hour_adj_maps(fi_hourly_rate, start_hr, stop_hr, max_consecutive, min_halt, g_verbose_logging) :
+    # As create_top_hour_adj_maps() but the result is taken from the plan cache if possible.
+    key = get_plan_cache_key(fi_hourly_rate, start_hr, stop_hr, max_consecutive, min_halt)
+    plan_cache = get_plan_cache()
+    if key in plan_cache["plans"] :
+        plan = plan_cache["plans"][key]
+        top_hour_map = {int(h): v for h, v in plan["top_hour_map"].items()}      # json keys are strings.
+        top_hour_map_price = {int(h): v for h, v in plan["top_hour_map_price"].items()}
+        f0.print_json_var(g_verbose_logging, 5, "plan_cache: "+key, plan)
+        return(top_hour_map, top_hour_map_price, plan["price"])
+
+    top_hour_map, top_hour_map_price, price = create_top_hour_adj_maps(
+                                                                       fi_hourly_rate, start_hr, stop_hr,
+                                                                       max_consecutive, min_halt, g_verbose_logging)
+    plan_cache["plans"][key] = {"top_hour_map": top_hour_map, "top_hour_map_price": top_hour_map_price, "price": price}
+    save_plan_cache(plan_cache)
+    return(top_hour_map, top_hour_map_price, price)
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# Functions to evaluate the hourly-rate decrease plans for many days at once. Used for backtests.
+# Every allowed decrease/pause pattern for a range is a row of 0/1 in a matrix. The price of every
+# pattern for every day is then one matrix product: (days x hours) @ (hours x patterns).
+# Requires numpy. The control program does not use this module.
+
+import numpy as np
+
+import pgart_calc_hourly_rate_adj_func as f4
+
+
+def create_hour_schedule_patterns(nr_hours, max_consecutive, min_halt) :
+    # All switch lists (1=decrease, 0=pause) allowed by the same rules as f4.optimize_hour_schedule().
+    # Built one hour at a time. The patterns are grouped by the state after the last hour.
+    patterns = {("p", min_halt): np.zeros((1, 0), dtype=np.int8)}
+    for h in range(nr_hours) :
+        new_patterns = {}
+        for state, block in patterns.items() :
+            for switch in [0, 1] :
+                next_state = f4.get_next_schedule_state(state, switch, max_consecutive, min_halt)
+                if next_state is None :
+                    continue
+
+                column = np.full((block.shape[0], 1), switch, dtype=np.int8)
+                new_block = np.hstack((block, column))
+                if next_state in new_patterns :
+                    new_patterns[next_state] = np.vstack((new_patterns[next_state], new_block))
+                else :
+                    new_patterns[next_state] = new_block
+
+        patterns = new_patterns
+
+    return(np.vstack(list(patterns.values())))
+
+
+def get_price_matrix(days, start_hr, stop_hr) :
+    # days: [(yyyymmdd, {hour: price})]. One row per day with the prices for start_hr..stop_hr-1.
+    # Days with missing hours are skipped.
+    days_used = []
+    rows = []
+    for day, hr_rates in days :
+        row = []
+        for h in range(start_hr, stop_hr) :
+            if h not in hr_rates :
+                break
+            row.append(hr_rates[h])
+
+        if len(row) != stop_hr - start_hr :
+            continue
+
+        days_used.append(day)
+        rows.append(row)
+
+    price_matrix = np.array(rows, dtype=np.float64).reshape(len(rows), stop_hr - start_hr)
+    return(days_used, price_matrix)
+
+
+def get_top_schedules(price_matrix, patterns, max_nr_values=20000000) :
+    # The best pattern per day. The (days x patterns) price matrix is done in slices to limit the memory.
+    nr_days = price_matrix.shape[0]
+    best_ix = np.zeros(nr_days, dtype=np.int64)
+    best_price = np.full(nr_days, -np.inf)
+    if nr_days == 0 :
+        return(np.zeros((0, patterns.shape[1]), dtype=np.int8), np.zeros(0))
+
+    slice_len = max(1, max_nr_values // nr_days)
+    for first in range(0, patterns.shape[0], slice_len) :
+        pattern_slice = patterns[first:first + slice_len].astype(np.float64)
+        prices = price_matrix @ pattern_slice.T             # days x patterns
+        ix = np.argmax(prices, axis=1)
+        price = prices[np.arange(nr_days), ix]
+        better = price > best_price
+        best_ix[better] = ix[better] + first
+        best_price[better] = price[better]
+
+    return(patterns[best_ix], np.round(best_price, 2))
+
+
+def get_avoided_costs(price_matrix, top_schedules, rate_above) :
+    # The control program only decreases the temperature in a planned hour if the price is above
+    # hourly_rate_only_decrease_when_rate_above (given in the currency, the prices are in 1/100).
+    used = (top_schedules == 1) & (price_matrix > rate_above * 100)
+    return(np.round((price_matrix * used).sum(axis=1), 2))
+
+
+def evaluate_decrease_plans(days, decr_range, max_consecutive, min_halt, rates_above) :
+    # days: [(yyyymmdd, {hour: price})], from the hourly_rate files or the price store.
+    # decr_range: {start_hr: stop_hr, ...} as from hourly_rate_decrease_hours.
+    # Returns per range: the days used, the plan per day, the plan price per day and
+    # the avoided cost per day for each value in rates_above.
+    results = {}
+    for start_hr, stop_hr in decr_range.items() :
+        days_used, price_matrix = get_price_matrix(days, start_hr, stop_hr)
+        patterns = create_hour_schedule_patterns(stop_hr - start_hr, int(max_consecutive), int(min_halt))
+        top_schedules, top_prices = get_top_schedules(price_matrix, patterns)
+        avoided = {}
+        for rate_above in rates_above :
+            avoided[rate_above] = get_avoided_costs(price_matrix, top_schedules, float(rate_above))
+
+        results[(start_hr, stop_hr)] = (days_used, top_schedules, top_prices, avoided)
+
+    return(results)
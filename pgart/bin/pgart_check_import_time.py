@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# Checks the startup cost of a program with "python3 -X importtime".
+# It fails (exit code 1) when the import takes longer than the budget or when a module that shall be
+# imported only when it is used (requests, smtplib...) is imported at startup.
+#   pgart_check_import_time.py                                  pgart_control_heating, 300 ms.
+#   pgart_check_import_time.py -m pgart_control_heating -b 150 -n 15    and the 15 slowest imports.
+# Run it after a change of the imports. On a Raspberry Pi the budget may have to be higher.
+
+import getopt, sys
+import os
+import subprocess
+
+default_budget_ms = 300
+nr_trials = 3               # The best is used. The first one may compile the .pyc files.
+
+# Imported when they are needed, not when the program is started.
+g_lazy_modules = ["requests", "urllib3", "smtplib", "email.mime.text", "gzip", "pgart_thermia_online_genesis_func"]
+
+
+def get_args() :
+    argv = sys.argv[1:]     # Bypass my own name
+    options = "m:b:n:"
+    long_options = ["module=", "budget=", "nr="]
+    module = "pgart_control_heating"
+    budget_ms = default_budget_ms
+    nr_top = 10
+    try:
+        args, values = getopt.getopt(argv, options, long_options)
+        for arg, val in args :
+            if arg in ("-m", "--module") :
+                module = val
+            elif arg in ("-b", "--budget") :
+                budget_ms = int(val)
+            elif arg in ("-n", "--nr") :
+                nr_top = int(val)
+    except (getopt.error, ValueError) as err :
+        print(str(err))
+        print("usage: pgart_check_import_time.py -m <module> -b <budget ms> -n <nr slowest>")
+        exit(2)
+
+    return(module, budget_ms, nr_top)
+
+
+def get_import_times(module) :
+    # Returns {module: (self_us, cumulative_us)} and the cumulative time of module in us.
+    cmd = [sys.executable, "-X", "importtime", "-c", "import "+module]
+    result = subprocess.run(cmd, cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if result.returncode != 0 :
+        print(result.stderr)
+        exit(2)
+
+    times = {}
+    for rec in result.stderr.splitlines() :
+        # import time:       307 |       2536 |     json
+        if not rec.startswith("import time:") :
+            continue
+
+        buf = rec[len("import time:"):].split('|')
+        if len(buf) != 3 or not buf[0].strip().isdigit() :
+            continue                # The header.
+
+        times[buf[2].strip()] = (int(buf[0]), int(buf[1]))
+
+    return(times, times.get(module, (0, 0))[1])
+
+
+module, budget_ms, nr_top = get_args()
+best_times = None
+best_us = None
+for i in range(nr_trials) :
+    times, total_us = get_import_times(module)
+    if best_us is None or total_us < best_us :
+        best_times = times
+        best_us = total_us
+
+print("{:50s} {:>10s} {:>10s}".format("slowest imports", "self ms", "cum ms"))
+for name, (self_us, cum_us) in sorted(best_times.items(), key=lambda x: x[1][0], reverse=True)[0:nr_top] :
+    print("{:50s} {:>10.1f} {:>10.1f}".format(name, self_us / 1000, cum_us / 1000))
+
+status = 0
+lazy = [x for x in g_lazy_modules if x in best_times and x != module]
+if len(lazy) > 0 :
+    print("\nimported at startup, shall be imported when used: "+", ".join(lazy))
+    status = 1
+
+print("\n"+module+": ms:{:.1f} budget ms:{}".format(best_us / 1000, budget_ms))
+if best_us / 1000 > budget_ms :
+    print("over the budget.")
+    status = 1
+
+exit(status)
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# Folds the hourly_rate_yyyymmdd.txt files of a directory into the price store of a zone, var/price_store/<zone>.bin.
+# A day already in the store is replaced. A file that does not fit its day (the number of hours) is left as it is.
+#   pgart_compact_prices.py                       var/local into the store of el_area.
+#   pgart_compact_prices.py -z SE4 -d var/local/SE4
+#   pgart_compact_prices.py -k 7                  also removes the folded files older than 7 days.
+# pgart_control_heating.py reads today's file, so it is never removed.
+
+import getopt, sys
+import glob
+import os
+
+from datetime import datetime,timedelta
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_read_control_params_func as f7
+import pgart_price_store_func as f14
+
+te = f1.get_pgart_env()
+
+
+def get_args() :
+    argv = sys.argv[1:]     # Bypass my own name
+    options = "z:d:k:"
+    long_options = ["zone=", "dir=", "keep="]
+
+    ret_stat, general_pars, weekday_indoor_temp_hours = f7.get_parameters()
+    if ret_stat != "ok" :
+        print(ret_stat)
+        exit()
+
+    zone = general_pars['el_area']
+    dir = te["g_local_dir"]
+    keep_days = None
+    try:
+        args, values = getopt.getopt(argv, options, long_options)
+        for arg, val in args :
+            if arg in ("-z", "--zone") :
+                zone = val
+            elif arg in ("-d", "--dir") :
+                dir = val
+            elif arg in ("-k", "--keep") :
+                keep_days = int(val)
+    except (getopt.error, ValueError) as err :
+        print(str(err))
+        print("usage: pgart_compact_prices.py -z <zone> -d <dir> -k <keep days>")
+        exit()
+
+    return(zone, dir, keep_days)
+
+
+def remove_old_files(fi_names, keep_days) :
+    # Only the folded files. Today's file and the later ones are kept.
+    oldest = datetime.strftime(datetime.now() - timedelta(max(keep_days, 1)), "%Y%m%d")
+    nr_removed = 0
+    for fi in fi_names :
+        if os.path.basename(fi).split("_")[2].split(".")[0] < oldest :
+            os.remove(fi)
+            nr_removed += 1
+
+    return(nr_removed)
+
+
+zone, dir, keep_days = get_args()
+fi_names = sorted(glob.glob(dir+"/hourly_rate_"+"[0-9]"*8+".txt"))
+folded, skipped = f14.fold_daily_files(zone, fi_names)
+info = zone+" folded:"+str(len(folded))+" skipped:"+str(len(skipped))+" => "+f14.get_fi_store(zone)
+f0.log_action("pgart_compact_prices:\n\t"+info, False)
+print("pgart_compact_prices: "+info)
+for fi in skipped :
+    print("\tdoes not fit its day: "+fi)
+
+if keep_days is not None :
+    print("\tremoved:"+str(remove_old_files(folded, keep_days)))
+
+exit()
@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# Gzips the rotated log generations in var/log. Started in the background by pgart_misc_func.rotate_log_files().
+# The newest generation of each log is left as it is. It can still be written to by the run that rotated it.
+# Read the generations with pgart_misc_func.read_log_lines(), or zcat/zless.
+
+import os
+import gzip
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None        # Windows. No locking.
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_lang_func as f8
+
+g_lang = f8.get_language()
+g_ui_text = f1.ui_texts(g_lang)
+te = f1.get_pgart_env()
+
+
+def compress_log_file(fi) :
+    fi_tmp = fi+".gz.tmp"
+    f_in = open(fi, "rb")
+    f_out = gzip.open(fi_tmp, "wb")
+    shutil.copyfileobj(f_in, f_out)
+    f_out.close()
+    f_in.close()
+    os.replace(fi_tmp, fi+".gz")
+    os.remove(fi)
+
+
+def main() :
+    f0.g_mail_worker_started = True     # Just the logs. Not any mail worker from me.
+    f_lock = open(te["fi_log_compress_lock"], "w")
+    if fcntl is not None :
+        try :
+            fcntl.flock(f_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError :
+            return()                # Another one is compressing.
+
+    if hasattr(os, "nice") :
+        os.nice(10)                 # Do not disturb a control run on a small computer.
+
+    for fi_log in f0.get_rotated_log_files().values() :
+        for fi in f0.get_log_generations(fi_log)[0:-1] :
+            if fi.endswith(".gz") :
+                continue
+
+            size = os.path.getsize(fi)
+            compress_log_file(fi)
+            f0.log_action_1("compress_log_files:\n\t"+fi+".gz kbytes:"+str(int(size/1024))+" => "+str(int(os.path.getsize(fi+".gz")/1024)))
+
+    f_lock.close()
+
+
+main()
@@ -8,14 +8,8 @@
 # This program adjusts the indoor temperature based on rules in pg_control_thermia_heating.conf_se/en. See those files for explanations.
 
 import sys
-import platform
 import os
-import requests
-import json
 import time
-import itertools
-import ipaddress
-import subprocess
 import shutil
 
 from pathlib import Path
@@ -23,77 +17,67 @@ from datetime import date,datetime,timedelta
 
 import pgart_misc_func as f0
 import pgart_env_func as f1
-import pgart_get_smhi_forecasts_func as f2
 import pgart_calc_hourly_rate_adj_func as f4
-import pgart_thermia_online_genesis_func as f5
 import pgart_thermia_modbus_func as f6
 import pgart_read_control_params_func as f7
 import pgart_lang_func as f8
+import pgart_settings_func as f9
+import pgart_history_func as f10
+import pgart_daily_plan_func as f11
+import pgart_prefetch_func as f12
+import pgart_http_func as f13
+import pgart_price_store_func as f14
 
 g_lang = f8.get_language()
 g_ui_text = f1.ui_texts(g_lang)
 te = f1.get_pgart_env()
 
+# Seconds. From the start of acquire_inputs(). Longer than retry_deadline in pgart_misc_func.py.
+g_input_timeouts = {"hourly_rates": 180, "monthly_rates": 180, "sensor": 30, "pump": 120, "forecast": 180}
 
-def save_settings(settings) :
-    f = open(te["fi_settings_status"], "w", encoding="utf8")
-    f.write(json.dumps(settings))
-    f.close()
-
-
-def get_settings() :
-    fi = Path(te["fi_settings_status"])
-    settings = {}
-    if fi.is_file():
-        f = open(te["fi_settings_status"], 'r' , encoding="utf8")
-        settings = json.load(f)
-        f.close()
-    return(settings)
+# Seconds of run_time_budget kept for the phases after the inputs. With less left for the pump the setpoint is kept.
+g_phase_budgets = {"plan": 10, "pump_write": 30}
 
 
 def get_setting(key, nr_fields) :
-    settings = get_settings()
-    fields = []
-    fields.append("-")              # Initial values
+    # Returns the date, the hour and nr_fields values. "-" as date if the setting is missing.
+    rec = f9.get_setting(key)
+    dt = "-"            # Initial values
+    hr = 0
+    value = []
     for i in range(nr_fields) :
-        fields.append("0")
+        value.append(0)
 
-    if key in settings :
-        s = settings[key].split(" ")
+    if rec is not None :
+        dt = rec["date"]
+        hr = rec["hour"]
         i = 0
-        nrs = len(s)
+        nrs = min(len(rec["value"]), nr_fields)
         while i < nrs:
-            fields[i] = s[i]
+            value[i] = rec["value"][i]
             i += 1
-    f0.log_action("Get "+key+":\n\t"+str(fields), False)
-    return(fields)
+    f0.log_action("Get "+key+":\n\t"+str([dt, hr] + value), False)
+    return(dt, hr, value)
 
 
-def update_setting(key, val, log_txt) :
-    dt = datetime.strftime(datetime.now(), "%Y-%m-%d")
-    settings =  get_settings()
-    settings[key] = dt+" "+val
+def update_setting(key, hr, value, log_txt) :
+    f9.update_setting(key, hr, value)
     f0.log_action("Set "+key+":\n\t"+log_txt, False)
-    save_settings(settings)
 
 
 def remove_setting(key, log_txt) :
-    settings = get_settings()
-    if key in settings :
-        settings.pop(key)
-        save_settings(settings)
+    if f9.remove_setting(key) :
         f0.log_action("Del "+key+":\n\t"+log_txt, False)
 
 
 def save_start_update(txt, hr, new_indoor_temp) :
-    val = str(hr)+" "+str(new_indoor_temp)+" "+txt
     log_txt = txt
-    update_setting("start_update", val, log_txt)
+    update_setting("start_update", hr, [new_indoor_temp, txt], log_txt)
 
 
 def get_last_start_update() :
-    dt, hr, temp, s1, s2, s3, s4, s5, s6 = get_setting("start_update", 8)
-    return(dt, int(hr), int(temp))
+    dt, hr, value = get_setting("start_update", 2)
+    return(dt, int(hr), int(value[0]))
 
 
 def remove_start_update(reason) :
@@ -102,14 +86,13 @@ def remove_start_update(reason) :
 
 
 def save_hourly_rate_setting(temp) :
-    val = str(g_hour_now)+" "+str(temp)
     log_txt = g_ui_text["t1a"]+":"+str(temp)
-    update_setting("hourly_rate", val, log_txt)
+    update_setting("hourly_rate", g_hour_now, [temp], log_txt)
 
 
 def get_last_hourly_rate_setting() :
-    dt, hr, temp = get_setting("hourly_rate", 2)
-    return(dt, int(hr), int(temp))
+    dt, hr, value = get_setting("hourly_rate", 1)
+    return(dt, int(hr), int(value[0]))
 
 
 def remove_hourly_rate_setting(reason) :
@@ -118,14 +101,13 @@ def remove_hourly_rate_setting(reason) :
 
 
 def save_top_rate_setting(temp) :
-    val = str(g_hour_now)+" "+str(temp)
     log_txt = g_ui_text["t1a"]+":"+str(temp)
-    update_setting("top_rate", val, log_txt)
+    update_setting("top_rate", g_hour_now, [temp], log_txt)
 
 
 def get_last_top_rate_setting() :
-    dt, hr, temp = get_setting("top_rate", 2)
-    return(dt, int(hr), int(temp))
+    dt, hr, value = get_setting("top_rate", 1)
+    return(dt, int(hr), int(value[0]))
 
 
 def remove_top_rate_setting(reason) :
@@ -135,17 +117,17 @@ def remove_top_rate_setting(reason) :
 
 def save_windchill_setting(evaluation_code, windchill_temp, temp_diff, temp_increase_final) :
     windchill_results = f1.get_windchill_evaluation_texts(g_lang)
-    val = str(g_hour_now)+" "+str(evaluation_code)+" "+str(windchill_temp)+" "+str(temp_diff)+" "+str(temp_increase_final)
+    value = [evaluation_code, windchill_temp, temp_diff, temp_increase_final]
 
     log_txt = windchill_results[str(evaluation_code)]+" windchill_temp:"+str(windchill_temp)+ \
               " diff_real_windchill:"+str(temp_diff)+" pump_incr:"+str(temp_increase_final)
 
-    update_setting("windchill", val, log_txt)
+    update_setting("windchill", g_hour_now, value, log_txt)
 
 
 def get_last_windchill_setting() :
-    dt, hr, a, b, c, temp = get_setting("windchill", 5)
-    return(dt, int(hr), int(temp))
+    dt, hr, value = get_setting("windchill", 4)
+    return(dt, int(hr), int(value[3]))
 
 
 def remove_windchill_setting(reason) :
@@ -154,8 +136,6 @@ def remove_windchill_setting(reason) :
 
 
 def save_indoor_temp_setting(change_types, new_indoor_temp, hr_rate_usage, hr_rate_temp_decrease, windchill_temp_usage, windchill_temp_increase) :
-    val = str(g_hour_now)+" "+str(new_indoor_temp)
-
     if change_types[0] == -1 :
         txt = g_ui_text["t3"]             # Last run failed.
     else :
@@ -187,12 +167,12 @@ def save_indoor_temp_setting(change_types, new_indoor_temp, hr_rate_usage, hr_ra
     log_txt = txt+" "+g_ui_text["t1"]+":"+str(new_indoor_temp)+", hr_rate_temp_decr/incr:"+str(hr_rate_temp_decrease)+ \
               ", windchill_temp_incr/decr:"+str(windchill_temp_increase)
 
-    update_setting("indoor_temp", val, log_txt)
+    update_setting("indoor_temp", g_hour_now, [new_indoor_temp], log_txt)
 
 
 def get_last_indoor_temp_setting() :
-    dt, hr, new_indoor_temp = get_setting("indoor_temp", 2)
-    return(dt, int(hr), int(new_indoor_temp))
+    dt, hr, value = get_setting("indoor_temp", 1)
+    return(dt, int(hr), int(value[0]))
 
 
 def remove_indoor_temp_setting(reason) :
@@ -257,39 +237,22 @@ def save_run_summary(
     f.write(line + "\n")
     f.close()
 
+    f9.add_run_summary(
+                       dt, call_id, actions, ct, outdoor_temp, room_temp, sensor_temp,
+                       current_heating_effect, new_indoor_temp, new_hr_rate_temp_decrease, hr_rate_usage,
+                       windchill_temp_increase, windchill_temp_usage)
 
-def create_hourly_settings_indoor_temp() :
-    if g_week_day_nr in g_weekday_indoor_temp_hours :
-        weekday_active=1
-        set_indoor_temp_hours = g_weekday_indoor_temp_hours[g_week_day_nr]
-    else :
-        weekday_active=0
-        set_indoor_temp_hours = g_general_pars['set_indoor_temp_hours']
+    if g_general_pars['history_store'] == "y" :
+        f10.add_history_row("run_summary", f10.get_summary_row(line))
 
-    # Create a dict of set_indoor_temp_hours=20_14,06_20 => [20: 14, 06: 20]
-    th=set_indoor_temp_hours.split(',')
-    tmp_hours_to_set_new_heating_effect = {}
-    for x in th :
-        buf=x.split('_')
-        tmp_hours_to_set_new_heating_effect.update({int(buf[0]): int(buf[1])})   # Shall be numeric
 
-    return(weekday_active, tmp_hours_to_set_new_heating_effect)
-
-
-def create_range_hourly_rate_temp_decrease() :
-    hourly_rate_decrease_hours = g_general_pars['hourly_rate_decrease_hours']
-    # Create a dict of hourly_rate_decrease_hours=06-20 => ["06": "20"]
-    th=hourly_rate_decrease_hours.split(',')
-    tmp_hours = {}
-    for x in th :
-        buf=x.split('-')
-        tmp_hours.update({int(buf[0]): int(buf[1])})
-
-    return(tmp_hours)
+def create_hourly_settings_indoor_temp() :
+    return(f11.get_hourly_settings_indoor_temp(g_general_pars, g_weekday_indoor_temp_hours, g_week_day_nr))
 
 
 def get_pump_info() :
     if g_general_pars['pump_access_method'] == "a" :        # Use Thermia online_genesis?
+        import pgart_thermia_online_genesis_func as f5      # Imported when used. requests is slow to import.
         # Get the configuration, request_headers, ID-number, heatingEffectRegister and heatingEffect (indoor temperature).
         info, configuration, request_headers = f5.thermia_api_login(g_general_pars['login_id'], g_general_pars['password'], logreq, g_general_pars['max_log_len'])
         f0.log_action("get_pump_info: thermia_api_login:\n\t"+info, False)
@@ -317,6 +280,7 @@ def get_pump_info() :
 
 def set_pump_info(new_indoor_temp, device_id, heating_effect_register, configuration, request_headers) :
     if g_general_pars['pump_access_method'] == "a" :
+        import pgart_thermia_online_genesis_func as f5
         f5.thermia_api_set_indoor_temperature(
                                               request_headers, configuration, device_id, heating_effect_register,
                                               new_indoor_temp, logreq, g_general_pars['max_log_len'])
@@ -328,17 +292,19 @@ def get_indoor_external_sensor_temp() :
     dt = datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M:%S")
     sensor_temp = "-273"
     if g_general_pars['read_external_indoor_sensor'] == "y" :
+        recs = None     # From the file written by a user program.
         if g_general_pars['external_pgm_read_indoor_sensor'] != "," :
             cmd = "/usr/bin/python3 "+te["g_bin_dir"]+"/"+f0.get_exec_str(g_general_pars['external_pgm_read_indoor_sensor'])
+            status = f0.exec_external_pgm("temp_reading", cmd)
         else :
-            cmd = "/usr/bin/python3 "+te["g_bin_dir"]+"/pgart_get_indoor_temp_raspberry_pi.py"
+            status, recs = f0.exec_plugin_pgm("temp_reading", "pgart_get_indoor_temp_raspberry_pi.py", ())
 
-        if not f0.exec_external_pgm("temp_reading", cmd) :
+        if not status :
             txt = "get_indoor_external_sensor_temp:\n\tFailed to create:"+te["fi_indoor_temp_reading"]+" temperature reading not working."
             f0.log_action(txt, False)
             f0.send_mail(dt+" "+txt)
         else :
-            status, info, dt, sensor_temp = f0.get_ext_temp_reading()
+            status, info, dt, sensor_temp = f0.get_ext_temp_reading(recs)
             if not status :
                 print(info)
 
@@ -346,6 +312,7 @@ def get_indoor_external_sensor_temp() :
 
 
 def set_new_indoor_temp() :
+    global g_degraded
     change_types = [0,0,0,0,0,0]
     hr_rate_usage = "-"
     new_hr_rate_temp_decrease = 0
@@ -353,16 +320,33 @@ def set_new_indoor_temp() :
     windchill_temp_usage = "-"
     windchill_temp_increase = 0
 
-    sensor_temp = get_indoor_external_sensor_temp()
-    outdoor_temp, room_temp, current_heating_effect, device_id, heating_effect_register, configuration, request_headers = get_pump_info()  # On error no return.
+    sensor_temp = g_inputs["sensor"]
+    outdoor_temp, room_temp, current_heating_effect, device_id, heating_effect_register, configuration, request_headers = g_inputs["pump"]
     new_indoor_temp = current_heating_effect    # Use the current indoor temperature from the pump as default.
 
-    if g_hour_now in g_hourly_settings_indoor_temp or hr_rates_decrease_active or windchill_increase_active :
-        hr_rate_usage, hr_rate_temp_decrease, last_hr_rate_temp_decrease = get_temp_adj_rates()
-        print("hr_rate_usage:", hr_rate_usage, hr_rate_temp_decrease, last_hr_rate_temp_decrease )
-
-        windchill_temp_usage, windchill_temp_increase, last_windchill_temp_increase = get_temp_adj_windchill_effect(current_heating_effect)
-        print("windchill_temp_usage:", windchill_temp_usage, windchill_temp_increase, last_windchill_temp_increase )
+    call_id = "L"
+    scheduled_hour = g_hour_now in g_hourly_settings_indoor_temp
+    if g_event_inputs is not None :         # run_event(). Only the adjustments with a changed input.
+        call_id = "E"
+        scheduled_hour = False
+
+    g_degraded = get_degraded_reason()
+    if g_degraded != "-" :
+        # Degraded mode. An input that timed out is as one that failed: only the adjustment that needs it is skipped.
+        # The scheduled change is still made. Without time to set the pump, see below.
+        f0.log_action("set_new_indoor_temp:\n\tdegraded mode, "+g_degraded, False)
+
+    if scheduled_hour or hr_rates_decrease_active or windchill_increase_active :
+        hr_rate_temp_decrease = 0
+        last_hr_rate_temp_decrease = 0
+        if g_event_inputs is None or "hourly_rates" in g_event_inputs :
+            hr_rate_usage, hr_rate_temp_decrease, last_hr_rate_temp_decrease = get_temp_adj_rates()
+            print("hr_rate_usage:", hr_rate_usage, hr_rate_temp_decrease, last_hr_rate_temp_decrease )
+
+        last_windchill_temp_increase = 0
+        if g_event_inputs is None or "forecast" in g_event_inputs :
+            windchill_temp_usage, windchill_temp_increase, last_windchill_temp_increase = get_temp_adj_windchill_effect(current_heating_effect)
+            print("windchill_temp_usage:", windchill_temp_usage, windchill_temp_increase, last_windchill_temp_increase )
 
         # Set the temperature but only if it has not been manually set since the last run.
         # If the current_heating_effect is not the same as the saved one a manual change has been done. That is valid until the last run for a day.
@@ -393,12 +377,12 @@ def set_new_indoor_temp() :
 
                     change_types[5] = 1 # Manual change
                     save_run_summary(
-                                     "L1", change_types, outdoor_temp, room_temp, sensor_temp,
+                                     call_id+"1", change_types, outdoor_temp, room_temp, sensor_temp,
                                      current_heating_effect, current_heating_effect, hr_rate_usage, new_hr_rate_temp_decrease,
                                      windchill_temp_usage, windchill_temp_increase)
                     return()
 
-        if g_hour_now in g_hourly_settings_indoor_temp :
+        if scheduled_hour :
             # There is a scheduled change for this hour.
             new_indoor_temp = g_hourly_settings_indoor_temp[g_hour_now]
             last_hr_rate_temp_decrease = 0      # Old values must not impact a new scheduled change.
@@ -497,7 +481,7 @@ def set_new_indoor_temp() :
 
             f0.log_action("set_new_indoor_temp:\n\t"+txt+" "+g_ui_text["t23"], False)
             save_run_summary(
-                             "L2", change_types, outdoor_temp, room_temp, sensor_temp,
+                             call_id+"2", change_types, outdoor_temp, room_temp, sensor_temp,
                              current_heating_effect, new_indoor_temp, hr_rate_usage, new_hr_rate_temp_decrease,
                              windchill_temp_usage, windchill_temp_increase)
             return()
@@ -513,21 +497,125 @@ def set_new_indoor_temp() :
 
     save_start_update(txt, g_hour_now, new_indoor_temp)
 
+    if new_indoor_temp != current_heating_effect and not is_pump_write_time_left() :
+        # Degraded mode. The pump is not set this run. The start_update is kept so the next run tries again.
+        txt = "set_new_indoor_temp:\n\tdegraded mode, "+g_degraded+". The setpoint is kept: "+str(current_heating_effect)+ \
+              ". The next run sets: "+str(new_indoor_temp)
+        f0.log_action(txt, False)
+        f0.send_mail(dt+" "+txt)
+        save_run_summary(
+                         "D2", change_types, outdoor_temp, room_temp, sensor_temp,
+                         current_heating_effect, current_heating_effect, hr_rate_usage, new_hr_rate_temp_decrease,
+                         windchill_temp_usage, windchill_temp_increase)
+        return()
+
     if new_indoor_temp != current_heating_effect :
+        t_phase = time.time()
         set_pump_info(new_indoor_temp, device_id, heating_effect_register, configuration, request_headers)     # On error no return.
+        f0.save_phase_time("pump_write", t_phase)
     else : # No need to access the pump.
        f0.log_action("set_new_indoor_temp:\n\t"+g_ui_text["t18a"]+str(new_indoor_temp), False)
 
     save_indoor_temp_setting(change_types, new_indoor_temp, hr_rate_usage, new_hr_rate_temp_decrease, windchill_temp_usage, windchill_temp_increase)
 
     save_run_summary(
-                     "L3", change_types, outdoor_temp, room_temp, sensor_temp, current_heating_effect,
+                     call_id+"3", change_types, outdoor_temp, room_temp, sensor_temp, current_heating_effect,
                      new_indoor_temp, hr_rate_usage, new_hr_rate_temp_decrease,
                      windchill_temp_usage, windchill_temp_increase)
 
     remove_start_update("Done")    # The start status file is obsolete now.
 
 
+def is_pump_write_time_left() :
+    time_left = f0.get_time_left()
+    return(time_left is None or time_left >= g_phase_budgets["pump_write"])
+
+
+def get_degraded_reason() :
+    # "-" or what is missing this run: an input that an adjustment needs did not come in time, it is then as if it
+    # had failed (hourly_rates False, forecast -2/-3), or too little is left of run_time_budget to set the pump.
+    reasons = []
+    rates_in_use = g_general_pars['use_hourly_rates'] == "y" or int(g_general_pars['hourly_rate_decrease_during_top_hours']) > 0
+    if "hourly_rates" in g_inputs["timeouts"] and rates_in_use :
+        reasons.append("hourly_rates timeout")
+
+    if "forecast" in g_inputs["timeouts"] :
+        reasons.append("forecast timeout")
+
+    if not is_pump_write_time_left() :
+        reasons.append("run_time_budget, "+str(max(0, int(f0.get_time_left())))+"s left")
+
+    if len(reasons) == 0 :
+        return("-")
+
+    return(", ".join(reasons))
+
+
+def save_run_phases(call_id, t_run) :
+    # The time of each phase of this run. For the analysis with pgart_query_history.py -n run_phases.
+    f0.save_phase_time("total", t_run)
+    http_stats = f13.get_reuse_stats()
+    print("phase_ms:", f0.g_phase_times, "degraded:", g_degraded, "http requests, new connections:", http_stats)
+    if g_general_pars['history_store'] == "y" :
+        row = {"dt": datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M"), "hour": g_hour_now, "call_id": call_id, "degraded": g_degraded}
+        for phase, ms in f0.g_phase_times.items() :
+            row[phase+"_ms"] = ms
+
+        row["http_requests"] = sum(x[0] for x in http_stats.values())
+        row["http_connections"] = sum(x[1] for x in http_stats.values())
+        f10.add_history_row("run_phases", row)
+
+
+def get_scheduled_indoor_temp() :
+    return(f11.get_scheduled_indoor_temp(g_hourly_settings_indoor_temp, g_hour_now))
+
+
+def get_plan_slot() :
+    # This hour in today's plan. The plan is built when the day's inputs have changed, else it is looked up.
+    evaluation_code, recs = g_inputs["forecast"]
+    if evaluation_code < 0 :
+        recs = None                 # No forecasts this run.
+    elif recs is None and Path(te["fi_forecast_short"]).is_file() :
+        recs = f0.read_recs(te["fi_forecast_short"])      # From a user program.
+
+    plan, how = f11.get_daily_plan(
+                                   datetime.now(), g_general_pars, g_weekday_indoor_temp_hours,
+                                   te["fi_hourly_rate"], recs, g_verbose_logging)
+    slot = plan["slots"][g_hour_now]
+    print("daily_plan:", how, "target:", slot["target"])
+    f0.print_json_var(g_verbose_logging, 4, "plan_slot", slot)
+    return(slot)
+
+
+def create_forecasts() :
+    # Returns (evaluation_code, recs). 0 when ok. recs is None when the forecasts are in the file from a user program.
+    dt = datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M:%S")
+    recs = None
+    if f12.is_forecast_fresh(g_general_pars) :
+        print("create_forecasts: prefetched "+te["fi_forecast_short"])      # No network I/O in the run.
+        return(0, recs)
+
+    if windchill_use_smhi:
+        status, recs = f0.exec_plugin_pgm(
+                                          "forecast", "pgart_get_smhi_forecasts.py",
+                                          (g_general_pars['my_lat'], g_general_pars['my_lon'], g_general_pars['windchill_wind_force_factor'],
+                                           logreq, g_general_pars['max_log_len']))
+        if not status : # SMHI not available.
+            txt = "get_windchill_temp_adjustment:\n\tFailed to create:"+te["fi_forecast_short"]+" SMHI forecasts not working."
+            f0.log_action(txt, False)
+            f0.send_mail(dt+" "+txt)
+            return(-2, recs)
+    else :
+        cmd =  "/usr/bin/python3  "+te["g_bin_dir"]+"/"+f0.get_exec_str(g_general_pars['external_pgm_create_forecasts'])
+        if not f0.exec_external_pgm("forecast", cmd) :
+            txt = "get_windchill_temp_adjustment:\n\tFailed to create:"+te["fi_forecast_short"]+" forecasts not working."
+            f0.log_action(txt, False)
+            f0.send_mail(dt+" "+txt)
+            return(-3, recs)
+
+    return(0, recs)
+
+
 def get_windchill_temp_adjustment(current_heating_effect) :
     forecast_temp = 0
     forecast_wind = 0
@@ -535,16 +623,10 @@ def get_windchill_temp_adjustment(current_heating_effect) :
     temp_diff = 0
     temp_increase_wanted = 0
     temp_increase_final = 0
-    forecast_temp_wind = {}
     dt = datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M:%S")
 
     # Calculations must be done from the last scheduled temperature. Not the actual temperature which is affected by the last adjustment.
-    k = sorted(g_hourly_settings_indoor_temp.keys()).pop()  # Get the last entry of the day.
-    indoor_temp = g_hourly_settings_indoor_temp[k]          # This will be the temperature between 24 and the first one in the morning.
-    for k in sorted(g_hourly_settings_indoor_temp.keys(), reverse=True) : # Get the last scheduled temperature
-        if g_hour_now >= k :
-            indoor_temp = g_hourly_settings_indoor_temp[k]
-            break
+    indoor_temp = get_scheduled_indoor_temp()
 
     # If the new indoor temperature will be less than windchill_adjust_only_when_set_indoor_temp_is_above => no action
     if indoor_temp < int(g_general_pars['windchill_adjust_only_when_set_indoor_temp_is_above']) :
@@ -554,94 +636,20 @@ def get_windchill_temp_adjustment(current_heating_effect) :
                       False)
         return(1, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final)
 
-    if windchill_use_smhi:
-        cmd = "/usr/bin/python3  "+te['g_bin_dir']+"/pgart_get_smhi_forecasts.py"+\
-              " --lat "+g_general_pars['my_lat']+" --lon "+g_general_pars['my_lon']+\
-              " --windfact "+g_general_pars['windchill_wind_force_factor']+\
-              " --logreq "+str(logreq)+" --maxlog "+g_general_pars['max_log_len']
+    evaluation_code, recs = g_inputs["forecast"]       # Retrieved by acquire_inputs().
+    if evaluation_code < 0 :
+        return(evaluation_code, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final)
 
-        if not f0.exec_external_pgm("forecast", cmd) : # SMHI not available.
-            txt = "get_windchill_temp_adjustment:\n\tFailed to create:"+te["fi_forecast_short"]+" SMHI forecasts not working."
-            f0.log_action(txt, False)
-            f0.send_mail(dt+" "+txt)
-            return(-2, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final)
-    else :
-        cmd =  "/usr/bin/python3  "+te["g_bin_dir"]+"/"+f0.get_exec_str(g_general_pars['external_pgm_create_forecasts'])
-        if not f0.exec_external_pgm("forecast", cmd) :
-            txt = "get_windchill_temp_adjustment:\n\tFailed to create:"+te["fi_forecast_short"]+" forecasts not working."
-            f0.log_action(txt, False)
-            f0.send_mail(dt+" "+txt)
-            return(-3, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final)
-
-    forecast_temp_wind = f2.get_forecasts_from_file( float(g_general_pars['windchill_wind_force_factor']))
-    if len(forecast_temp_wind) == 0 : # SMHI or other returned an empty answer. Let it be
+    # Evaluated in the daily plan from the same forecasts.
+    if g_plan_slot["windchill"] is None :     # The forecast file is missing.
         return(-1, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final)
 
-    f0.print_json_var(g_verbose_logging, 7, "forecast_temp_wind", forecast_temp_wind)
-
-    # Increase the current_heating_effect if the difference between forecast and windchill temperatures is big enough.
-    # (diff greater than windchill_min_apparent_temp_diff for the hour pointed to by windchill_use_forecast_this_nr_hours_ahead)
-    nr_hours_ahead = int(g_general_pars['windchill_use_forecast_this_nr_hours_ahead'])
-
-    # Get the forecast information from the forecast_temp_wind structure for the wanted hour.
-    hr_forecast = g_hour_now + nr_hours_ahead
-    if hr_forecast >=24 :
-        hr_forecast = hr_forecast - 24     # Start at 0 instead of 24 => next day.
-        dt_tomorrow = datetime.strftime(datetime.now() + timedelta(1), "%Y-%m-%d")
-        dt_hr_forecast = dt_tomorrow+"_{:02d}".format(hr_forecast)
-    else :
-        dt_today = datetime.strftime(datetime.now(), "%Y-%m-%d")
-        dt_hr_forecast = dt_today+"_{:02d}".format(hr_forecast)
-
-    # forecast_temp_wind structure:
-    # key = dt_hr_forecast
-    # val = forecast_temp forecast_wind : apparent_temp diff(forecast_temp apparent_temp)
-    # key = 2022-11-24_01
-    # val = 2.7 3.3:-0.5 -3.2
-
-    if not dt_hr_forecast in forecast_temp_wind :
-       return(-4, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final)
-
-    s = forecast_temp_wind[dt_hr_forecast].split(":")    # 2.7 3.3:-0.5 -3.2
-    forecast_temp = float(s[0].split(" ")[0])    # 2.7
-    forecast_wind = float(s[0].split(" ")[1])    # 3.3
-    windchill_temp = float(s[1].split(" ")[0])   # -0.5
-    temp_diff = float(s[1].split(" ")[1])        # -3.2
-
-    # Is the wind cooling enough to maintain an existing increased temperature or to increase the current indoor temperature?
-    if abs(temp_diff) < abs(float(g_general_pars['windchill_min_apparent_temp_diff'])) :
+    evaluation_code, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final = g_plan_slot["windchill"]
+    if evaluation_code == 2 :
        f0.log_action(
                      "get_windchill_temp_adjustment:\n\ttemp_diff:"+str(abs(temp_diff))+
                      " < windchill_min_apparent_temp_diff:"+str(abs(float(g_general_pars['windchill_min_apparent_temp_diff']))),
                      False)
-       return(2, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final)
-
-    # Now. Increase the current_heating_effect by a number based on the temp_diff.
-    # The heat curve on the pump shows that:
-    # - when the outdoor temperature decreases by 1 degree the supply line temperature will increase by roughly 1 degree.
-    # - an increase of the indoor temperature by 1 degree will increase the supply line temperature by 2.5 degrees.
-    # This will give the following rules:
-    # For each -2.5 degree the windchill temperature is below the outdoor temperature the current_heating_effect shall be increased by 1 degree.
-    # This new current_heating_effect must not exceed windchill_max_indoor_temp_increase and the simulated outdoor
-    # temperature must not get below -25 degrees.
-
-    # Get the maximum allowed indoor temperature increase that will still keep the supply line temperature below 60 degrees.
-    max_allowed_increase = 25 - abs(forecast_temp)/2.5
-
-    # Calculate the expected increase of the indoor temperature depending on the difference between the windchill and the outdoor temperatures.
-    temp_increase_wanted = abs(temp_diff)/2.5
-    temp_increase_final = temp_increase_wanted
-
-    evaluation_code = 3
-    # If temp_increase_wanted is above max_allowed_increase the final increase must be reduced.
-    if temp_increase_final > max_allowed_increase :
-        temp_increase_final = max_allowed_increase
-        evaluation_code = 4
-
-    # As above but for windchill_max_indoor_temp_increase.
-    if temp_increase_final > int(g_general_pars['windchill_max_indoor_temp_increase']) :
-        temp_increase_final = int(g_general_pars['windchill_max_indoor_temp_increase'])
-        evaluation_code = 5
 
     return(evaluation_code, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final)
 
@@ -662,6 +670,9 @@ def log_windchill_statistics(indoor_temp, forecast_temp, forecast_wind, windchil
     f.write(line+"\n")
     f.close()
 
+    if g_general_pars['history_store'] == "y" :
+        f10.add_history_row("windchill_stats", f10.get_windchill_row(line))
+
 
 def get_temp_adj_windchill_effect(current_heating_effect) :
     if g_general_pars['use_windchill_compensation'] == "n" :
@@ -699,21 +710,11 @@ def get_temp_adj_top_hourly_rate() :
     hr_rate_temp_decrease = 0
 
     last_dt, last_hr, last_hr_rate_temp_decrease = get_last_top_rate_setting()
-    hr_rates = f0.get_hourly_rates(te["fi_hourly_rate"])
-    sorted_hr_rates = sorted(hr_rates.items(), key=lambda x: float(x[1]), reverse=True)
-    top_hours = {}
-    for i in range(0, int(g_general_pars["hourly_rate_decrease_during_top_hours"]) ) :
-        k, v = list(sorted_hr_rates)[i]
-        top_hours[k] = v
-
-    f0.print_json_var(g_verbose_logging, 4, "hr_rates", hr_rates)
-    f0.print_json_var(g_verbose_logging, 4, "top_hours", top_hours)
-
-    if top_hours.get(g_hour_now, "0") != "0" : # I this hour a top hour?
-        a = float(g_general_pars["hourly_rate_only_decrease_when_rate_above"]) * 100
-        b = top_hours.get(g_hour_now)
-        if a < b : # Decrease temp?
-            hr_rate_temp_decrease = int(g_general_pars['hourly_rate_decrease_nr_grades'])
+
+    # The top hours are in the daily plan. The rate of a top hour, else 0.
+    if g_plan_slot["hr_rate_price"] != 0 : # I this hour a top hour?
+        if g_plan_slot["hr_rate_decrease"] > 0 : # Decrease temp?
+            hr_rate_temp_decrease = g_plan_slot["hr_rate_decrease"]
             save_top_rate_setting(hr_rate_temp_decrease)
             hr_rate_usage = "set_hour"
 
@@ -728,33 +729,21 @@ def get_temp_adj_top_hourly_rate() :
 def get_temp_adj_hourly_rate() :
     hr_rate_usage = "off"
     hr_rate_temp_decrease = 0
-    hour_price = {}
-
-    for i in range(0,24) :
-        hour_price[i] = 0
-
-    decr_range = create_range_hourly_rate_temp_decrease()
-    for start_hr, stop_hr in decr_range.items() :
-        hour_map, tmp_map_price, price = f4.create_top_hour_adj_maps(te["fi_hourly_rate"], start_hr, stop_hr, g_verbose_logging)
-        for i in range(0,24) :
-            if tmp_map_price[i] != 0 :
-                hour_price[i] = tmp_map_price[i]
-
-    f0.print_json_var(g_verbose_logging, 4, "hour_price", hour_price)
+    hour_price = g_plan_slot["hr_rate_price"]      # From the optimized schedule in the daily plan. Per quarter the mean of the hour.
 
     last_dt, last_hr, last_hr_rate_temp_decrease = get_last_hourly_rate_setting()
 
     rate_too_low = False
-    if hour_price[g_hour_now] > 0 :
-        if float(g_general_pars["hourly_rate_only_decrease_when_rate_above"]) * 100 < hour_price[g_hour_now] : # Decrease temp?
-            hr_rate_temp_decrease = int(g_general_pars['hourly_rate_decrease_nr_grades'])
+    if hour_price > 0 :
+        if g_plan_slot["hr_rate_decrease"] > 0 : # Decrease temp?
+            hr_rate_temp_decrease = g_plan_slot["hr_rate_decrease"]
             save_hourly_rate_setting(hr_rate_temp_decrease)
             hr_rate_usage = "set_hour"
         else :
             rate_too_low = True
 
     if hr_rate_usage == "off" :
-        if hour_price[g_hour_now] == -1 :       # A paus hour. Not an hourly rate decrease this hour.
+        if hour_price == -1 :       # A paus hour. Not an hourly rate decrease this hour.
             hr_rate_usage = "hour_rate_paus"
 
         if last_hr_rate_temp_decrease > 0 :                     # Is there an hr_rate_temp_decrease.
@@ -765,7 +754,9 @@ def get_temp_adj_hourly_rate() :
                 hr_rate_usage = "reset_hour"
 
         if rate_too_low :
-            hr_rate_usage += ":rate_too_low="+str(round(hour_price[g_hour_now]/100, 2))
+            hr_rate_usage += ":rate_too_low="+str(round(hour_price/100, 2))
+            if len(g_plan_slot.get("hr_rate_slots", [])) > 1 :     # Per quarter. The highest of them.
+                hr_rate_usage += ":max="+str(round(max(g_plan_slot["hr_rate_slots"])/100, 2))
 
     return(hr_rate_usage, hr_rate_temp_decrease, last_hr_rate_temp_decrease)
 
@@ -803,9 +794,15 @@ def create_monthly_rates() :
                 cre_new = False
 
         if cre_new :
-            cmd = "/usr/bin/python3 "+te["g_bin_dir"]+"/"+f0.get_exec_str(g_general_pars['external_pgm_create_monthly_rates']) \
-                  +" -a "+g_general_pars['el_area']+" -l "+str(logreq)+" -m "+g_general_pars['max_log_len']
-            if not f0.exec_external_pgm("monthly_rates", cmd) :
+            pgm = g_general_pars['external_pgm_create_monthly_rates']
+            if f0.is_plugin_pgm(pgm) :
+                status, recs = f0.exec_plugin_pgm("monthly_rates", pgm, (g_general_pars['el_area'], logreq, g_general_pars['max_log_len']))
+            else :
+                cmd = "/usr/bin/python3 "+te["g_bin_dir"]+"/"+f0.get_exec_str(pgm) \
+                      +" -a "+g_general_pars['el_area']+" -l "+str(logreq)+" -m "+g_general_pars['max_log_len']
+                status = f0.exec_external_pgm("monthly_rates", cmd)
+
+            if not status :
                 txt = "create_monthly_rates:\n\tFailed to create:"+te["fi_monthly_rates"]+" monthly rates not working."
                 f0.log_action(txt, False)
                 f0.send_mail(dt+" "+txt)
@@ -836,85 +833,235 @@ def create_hourly_rates(exit_if_failure) :
     return(True)
 
 
-#### Main ######
+def get_hourly_rates_input() :
+    # Returns hr_rates_decrease_active.
+    hr_rates_decrease_active = False
+    if g_general_pars['use_hourly_rates'] == "y" or int(g_general_pars['hourly_rate_decrease_during_top_hours']) > 0 :
+        if g_general_pars['external_pgm_create_hourly_rates'] != "," :
+            fi = Path(te["fi_hourly_rate"])
+            if not fi.is_file() :
+               cmd = "/usr/bin/python3 "+te["g_bin_dir"]+"/"+f0.get_exec_str(g_general_pars['external_pgm_create_hourly_rates'])
+               hr_rates_decrease_active = f0.exec_external_pgm("hourly_rates", cmd)
+               if hr_rates_decrease_active :     # Also in the price store. The user program does not know it.
+                   f14.add_day(g_general_pars['el_area'], datetime.now(), f0.read_recs(te["fi_hourly_rate"]))
+        else :
+            hr_rates_decrease_active = create_hourly_rates(True)    # Must stop if the rates cannot be loaded.
+
+    else :
+        if g_general_pars['create_hourly_rates'] == "y" :
+            # Just to get the file with rates.
+            create_hourly_rates(False)   # Do not stop if it failes to get them.
+
+    return(hr_rates_decrease_active)
+
+
+def acquire_inputs() :
+    # The rates, the sensor, the pump and the forecasts do not depend on each other. They are read at the same time.
+    # Nothing is decided until all of them are back (or have timed out).
+    jobs = {"hourly_rates": (get_hourly_rates_input, (), g_input_timeouts["hourly_rates"])}
+    if g_general_pars['external_pgm_create_monthly_rates'] != "," :
+        jobs["monthly_rates"] = (create_monthly_rates, (), g_input_timeouts["monthly_rates"])
+
+    if g_month_now in g_set_indoor_temp_months :
+        jobs["sensor"] = (get_indoor_external_sensor_temp, (), g_input_timeouts["sensor"])
+        jobs["pump"] = (get_pump_info, (), g_input_timeouts["pump"])
+        if windchill_increase_active :
+            if get_scheduled_indoor_temp() >= int(g_general_pars['windchill_adjust_only_when_set_indoor_temp_is_above']) :
+                jobs["forecast"] = (create_forecasts, (), g_input_timeouts["forecast"])
+
+    # The inputs may use the run budget except what the plan and the pump need.
+    time_left = f0.get_time_left()
+    if time_left is not None :
+        input_budget = max(0, time_left - g_phase_budgets["plan"] - g_phase_budgets["pump_write"])
+        jobs = {name: (func, args, min(timeout, input_budget)) for name, (func, args, timeout) in jobs.items()}
+
+    results = f0.run_concurrently(jobs)
+
+    if "forced_exit" in [state for state, result in results.values()] :
+        exit()      # Logged and mailed by the thread.
+
+    # A timeout also when the job came back but had given up for lack of time.
+    inputs = {"hourly_rates": False, "sensor": "-273", "forecast": (-4, None), "timeouts": sorted(f0.g_phase_timeouts)}
+    for name, (state, result) in results.items() :
+        if state == "ok" :
+            inputs[name] = result
+        elif name == "pump" :
+            f0.log_action("acquire_inputs:\n\tget_pump_info "+state, True)       # Nothing can be done without the pump.
+        elif name == "hourly_rates" and g_general_pars['external_pgm_create_hourly_rates'] == "," and \
+            (g_general_pars['use_hourly_rates'] == "y" or int(g_general_pars['hourly_rate_decrease_during_top_hours']) > 0) :
+            f0.log_action("acquire_inputs:\n\t"+g_ui_text["t30h"], True)         # As create_hourly_rates(True).
+        elif name == "forecast" :
+            inputs[name] = (-2 if windchill_use_smhi else -3, None)
+
+    return(inputs)
+
+
+def init_run(general_pars, weekday_indoor_temp_hours) :
+    # The parameters and the time of this run.
+    global g_general_pars, g_weekday_indoor_temp_hours, g_verbose_logging, logreq, g_month_now, g_hour_now, g_week_day_nr
+    global g_set_indoor_temp_months
+
+    if general_pars is None :
+        ret_stat, g_general_pars, g_weekday_indoor_temp_hours = f7.get_parameters()
+        if ret_stat != "ok" :
+            f0.log_action("main: "+ret_stat, True)
+    else :
+        g_general_pars = dict(general_pars)     # Changed below. The daemon keeps the original.
+        g_weekday_indoor_temp_hours = weekday_indoor_temp_hours
+
+    f0.set_run_budget(int(g_general_pars['run_time_budget']))
+    f13.reset_reuse_stats()     # The daemon keeps the connections between the runs.
+    f9.set_state_store(g_general_pars['state_store'])
+    f0.set_action_log_format(g_general_pars['action_log_format'])
+
+    g_verbose_logging = []
+    logs = g_general_pars['verbose_logging'].split(',')
+    for log in logs :
+        g_verbose_logging.append(int(log))
+
+    f0.print_json_var(g_verbose_logging, 1, "general_pars", g_general_pars)
+    logreq = 0
+    if 6 in g_verbose_logging :
+        logreq = 1
+    if 7 in g_verbose_logging :
+        logreq = 2      # Also the request bodies.
+
+    g_month_now = int(datetime.strftime(datetime.now(), "%m"))
+    g_hour_now = int(datetime.strftime(datetime.now(), "%H"))
+    g_week_day_nr = int(datetime.today().weekday() + 1)  # 0-6 => 1-7)
+    print("g_hour_now:", g_hour_now)
+
+    g_set_indoor_temp_months = []
+    mons = g_general_pars['set_indoor_temp_months'].split(',')
+    for mon in mons :
+        g_set_indoor_temp_months.append(int(mon))
+
+
+def run_once(general_pars=None, weekday_indoor_temp_hours=None) :
+    # One hourly run. From cron or pgart_control_heating_daemon.py, which passes the parameters it keeps in memory.
+    global dt, windchill_increase_active, windchill_use_smhi, g_weekday_active, g_hourly_settings_indoor_temp
+    global g_inputs, hr_rates_decrease_active, g_event_inputs, g_plan_slot, g_degraded
+
+    t_run = time.time()
+    dt = datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M:%S")
+    f0.log_action("", False)
+    f0.log_action("main: "+g_ui_text["t21"], False)
+
+    init_run(general_pars, weekday_indoor_temp_hours)
+    g_event_inputs = None
+    g_degraded = "-"
 
-dt = datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M:%S")
-f0.log_action("", False)
-f0.log_action("main: "+g_ui_text["t21"], False)
-
-ret_stat, g_general_pars, g_weekday_indoor_temp_hours = f7.get_parameters()
-if ret_stat != "ok" :
-    f0.log_action("main: "+ret_stat, True)
-
-g_verbose_logging = []
-logs = g_general_pars['verbose_logging'].split(',')
-for log in logs :
-    g_verbose_logging.append(int(log))
-
-f0.print_json_var(g_verbose_logging, 1, "general_pars", g_general_pars)
-logreq = 0
-if 6 in g_verbose_logging :
-    logreq = 1
-
-g_month_now = int(datetime.strftime(datetime.now(), "%m"))
-g_hour_now = int(datetime.strftime(datetime.now(), "%H"))
-g_week_day_nr = int(datetime.today().weekday() + 1)  # 0-6 => 1-7)
-print("g_hour_now:", g_hour_now)
-
-g_set_indoor_temp_months = []
-mons = g_general_pars['set_indoor_temp_months'].split(',')
-for mon in mons :
-    g_set_indoor_temp_months.append(int(mon))
-
-if g_week_day_nr == int(g_general_pars['rotate_log_files_this_weekday_nr']) :
-    f0.rotate_log_files(int(g_general_pars["keep_nr_rotated_log_files"]))
-
-hr_rates_decrease_active = False
-if g_general_pars['use_hourly_rates'] == "y" or int(g_general_pars['hourly_rate_decrease_during_top_hours']) > 0 :
-    if g_general_pars['external_pgm_create_hourly_rates'] != "," :
-        fi = Path(te["fi_hourly_rate"])
-        if not fi.is_file() :
-           cmd = "/usr/bin/python3 "+te["g_bin_dir"]+"/"+f0.get_exec_str(g_general_pars['external_pgm_create_hourly_rates'])
-           hr_rates_decrease_active = f0.exec_external_pgm("hourly_rates", cmd)
+    f0.rotate_log_files(int(g_general_pars["keep_nr_rotated_log_files"]), g_general_pars["rotate_log_limits"])
+
+    # Cleanup status files
+    if g_general_pars['use_hourly_rates'] == "y" :
+        g_general_pars['hourly_rate_decrease_during_top_hours'] = 0         # Disable top_hours because hourly rates has priority.
     else :
-        hr_rates_decrease_active = create_hourly_rates(True)    # Must stop if the rates cannot be loaded.
-
-else :
-    if g_general_pars['create_hourly_rates'] == "y" :
-        # Just to get the file with rates.
-        create_hourly_rates(False)   # Do not stop if it failes to get them.
-
-if g_general_pars['external_pgm_create_monthly_rates'] != "," :
-    create_monthly_rates()
-
-# Cleanup status files
-if g_general_pars['use_hourly_rates'] == "y" :
-    g_general_pars['hourly_rate_decrease_during_top_hours'] = 0         # Disable top_hours because hourly rates has priority.
-else :
-    remove_hourly_rate_setting("cleanup_not_active")
-
-if int(g_general_pars['hourly_rate_decrease_during_top_hours'])== 0 :   # Top hour rates adjustment not in use.
-    remove_top_rate_setting("cleanup_not_active")
-
-if g_general_pars['use_windchill_compensation'] == "n" :
-    remove_windchill_setting("cleanup_not_active")
-    windchill_increase_active = False
-else :
-    windchill_increase_active = True
-    windchill_use_smhi = True
-    if g_general_pars['external_pgm_create_forecasts'] != "," :
-        windchill_use_smhi = False
-
-remove_obsolete_indoor_temp_setting()
-
-# Set temp now.
-if g_month_now in g_set_indoor_temp_months:
+        remove_hourly_rate_setting("cleanup_not_active")
+
+    if int(g_general_pars['hourly_rate_decrease_during_top_hours'])== 0 :   # Top hour rates adjustment not in use.
+        remove_top_rate_setting("cleanup_not_active")
+
+    if g_general_pars['use_windchill_compensation'] == "n" :
+        remove_windchill_setting("cleanup_not_active")
+        windchill_increase_active = False
+    else :
+        windchill_increase_active = True
+        windchill_use_smhi = True
+        if g_general_pars['external_pgm_create_forecasts'] != "," :
+            windchill_use_smhi = False
+
+    remove_obsolete_indoor_temp_setting()
+
+    if g_month_now in g_set_indoor_temp_months:
+        g_weekday_active, g_hourly_settings_indoor_temp = create_hourly_settings_indoor_temp()
+
+    t_phase = time.time()
+    g_inputs = acquire_inputs()
+    f0.save_phase_time("inputs", t_phase)
+    hr_rates_decrease_active = g_inputs["hourly_rates"]
+
+    # Set temp now.
+    if g_month_now in g_set_indoor_temp_months:
+        t_phase = time.time()
+        g_plan_slot = get_plan_slot()
+        f0.save_phase_time("plan", t_phase)
+        set_new_indoor_temp()
+    else :
+        f0.log_action("main: "+g_ui_text["t24"], False)
+
+    f9.flush_settings()
+    save_run_phases("L", t_run)
+    f0.set_run_budget(None)
+    f0.log_action("main: "+g_ui_text["t25"], False)
+
+
+def get_event_inputs(changed) :
+    # The changed inputs that an adjustment in use depends on and that are proper.
+    event_inputs = []
+    if "hourly_rates" in changed and \
+        (g_general_pars['use_hourly_rates'] == "y" or int(g_general_pars['hourly_rate_decrease_during_top_hours']) > 0) :
+        if f0.is_hourly_rates_proper()[0] :
+            event_inputs.append("hourly_rates")
+
+    if "forecast" in changed and g_general_pars['use_windchill_compensation'] == "y" :
+        if f0.is_forecast_short_proper()[0] :
+            event_inputs.append("forecast")
+
+    return(event_inputs)
+
+
+def run_event(changed, general_pars, weekday_indoor_temp_hours) :
+    # Between the hourly runs, from pgart_control_heating_daemon.py, when a new hourly_rate or forecast_short file has arrived.
+    # changed: ["hourly_rates", "forecast"]. Only the adjustment that depends on a changed file is evaluated again,
+    # from the file. Nothing is fetched, only the pump is read. The other adjustment is left as it is.
+    # The hour is handled as an hour without a scheduled change. The scheduled change was done by the hourly run.
+    global dt, windchill_increase_active, windchill_use_smhi, g_weekday_active, g_hourly_settings_indoor_temp
+    global g_inputs, hr_rates_decrease_active, g_event_inputs, g_plan_slot, g_degraded
+
+    t_run = time.time()
+    dt = datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M:%S")
+    f0.log_action("", False)
+    f0.log_action("run_event:\n\tchanged:"+",".join(changed), False)
+    g_degraded = "-"
+
+    init_run(general_pars, weekday_indoor_temp_hours)
+    if g_general_pars['use_hourly_rates'] == "y" :
+        g_general_pars['hourly_rate_decrease_during_top_hours'] = 0         # As in run_once().
+
+    if not g_month_now in g_set_indoor_temp_months :
+        f0.log_action("run_event:\n\t"+g_ui_text["t24"], False)
+        return()
+
     g_weekday_active, g_hourly_settings_indoor_temp = create_hourly_settings_indoor_temp()
+    if g_hour_now == sorted(g_hourly_settings_indoor_temp.keys()).pop() :
+        f0.log_action("run_event:\n\tThe last scheduled hour of the day. No adjustments.", False)
+        return()
+
+    g_event_inputs = get_event_inputs(changed)
+    if len(g_event_inputs) == 0 :
+        f0.log_action("run_event:\n\tNot any adjustment depends on a proper changed file.", False)
+        return()
+
+    windchill_increase_active = "forecast" in g_event_inputs
+    windchill_use_smhi = g_general_pars['external_pgm_create_forecasts'] == ","
+    hr_rates_decrease_active = "hourly_rates" in g_event_inputs
+    t_phase = time.time()
+    g_inputs = {"hourly_rates": hr_rates_decrease_active, "sensor": "-273", "pump": get_pump_info(), "forecast": (0, None), "timeouts": []}
+    f0.save_phase_time("pump", t_phase)
+
+    t_phase = time.time()
+    g_plan_slot = get_plan_slot()       # The plan is patched with the new file.
+    f0.save_phase_time("plan", t_phase)
     set_new_indoor_temp()
-else :
-    f0.log_action("main: "+g_ui_text["t24"], False)
+    f9.flush_settings()
+    save_run_phases("E", t_run)
+    f0.set_run_budget(None)
+    f0.log_action("run_event:\n\t"+g_ui_text["t25"], False)
 
-f0.log_action("main: "+g_ui_text["t25"], False)
 
-exit()
+#### Main ######
 
+if __name__ == "__main__" :
+    run_once()
+    exit()
@@ -0,0 +1,302 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# Runs pgart_control_heating.py once an hour, at the minute daemon_run_minute, without cron.
+# The program stays in memory between the runs. The parameters, the Thermia token and the imported modules
+# are kept. The parameters are read again when a config file has been changed or after: kill -HUP <pid>
+# Stop it with: kill <pid>. A run that has started is completed first.
+# The output of each run is appended to var/log/hourly_run.log, as from cron. -s keeps it on stdout.
+# var/daemon_heartbeat.json shows what it is doing and when it runs the next time.
+# Just one daemon is running at a time. Remove the cron line for pgart_control_heating.py when this is used.
+# With daemon_event_mode = y a new hourly_rate or forecast_short file is acted on within seconds, not at the next hour.
+# Only the adjustment that depends on the new file is evaluated again. See run_event() in pgart_control_heating.py.
+# With prefetch = y tomorrow's hourly rates and the forecasts are fetched between the runs. See pgart_prefetch_func.py.
+
+import getopt, sys
+import os
+import json
+import time
+import signal
+import traceback
+
+from datetime import datetime,timedelta
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None        # Windows. No locking.
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_lang_func as f8
+import pgart_read_control_params_func as f7
+import pgart_settings_func as f9
+import pgart_history_func as f10
+import pgart_prefetch_func as f12
+import pgart_control_heating as ch
+
+g_lang = f8.get_language()
+g_ui_text = f1.ui_texts(g_lang)
+te = f1.get_pgart_env()
+
+max_sleep = 30      # Seconds. How often the config files and a stop are checked between the runs.
+event_poll = 5      # Seconds. As max_sleep in daemon_event_mode.
+event_settle = 3    # Seconds. A changed file must have been left alone this long. It could still be written.
+event_min_before_run = 60   # Seconds. A change this close to the hourly run is left to the run.
+
+g_reload = False
+g_stop = False
+g_heartbeat = {"pid": os.getpid(), "started": datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S"), "nr_runs": 0, "nr_events": 0}
+
+
+def get_args() :
+    argv = sys.argv[1:]     # Bypass my own name
+    options = "s"
+    long_options = ["stdout"]
+    use_stdout = False
+    try:
+        args, values = getopt.getopt(argv, options, long_options)
+        for arg, val in args :
+            if arg in ("-s", "--stdout") :
+                use_stdout = True
+    except getopt.error as err :
+        print(str(err))
+        print("usage: pgart_control_heating_daemon.py -s")
+        exit()
+
+    return(use_stdout)
+
+
+def on_sighup(signum, frame) :
+    global g_reload
+    g_reload = True
+
+
+def on_sigterm(signum, frame) :
+    global g_stop
+    g_stop = True
+
+
+def get_config_files() :
+    return([te["fi_par"]+"_"+g_lang, te["fi_mail_params"], te["fi_language"]])
+
+
+def get_config_mtimes() :
+    mtimes = {}
+    for fi in get_config_files() :
+        try :
+            mtimes[fi] = os.path.getmtime(fi)
+        except OSError :
+            mtimes[fi] = 0
+
+    return(mtimes)
+
+
+def get_event_mtimes() :
+    # {input: mtime} of the files that an event is about. 0 when missing. fi_hourly_rate has the date in the name.
+    f1.get_pgart_env()
+    mtimes = {}
+    for name, fi in {"hourly_rates": te["fi_hourly_rate"], "forecast": te["fi_forecast_short"]}.items() :
+        try :
+            mtimes[name] = os.path.getmtime(fi)
+        except OSError :
+            mtimes[name] = 0
+
+    return(mtimes)
+
+
+def get_changed_inputs(event_mtimes) :
+    # The inputs with a new file since event_mtimes. A file changed the last event_settle seconds waits for the next check.
+    changed = []
+    now = time.time()
+    for name, mtime in get_event_mtimes().items() :
+        if mtime != event_mtimes.get(name) and mtime != 0 and now - mtime >= event_settle :
+            changed.append(name)
+            event_mtimes[name] = mtime
+
+    return(changed)
+
+
+def load_config() :
+    # Returns (status, general_pars, weekday_indoor_temp_hours).
+    try :
+        ret_stat, general_pars, weekday_indoor_temp_hours = f7.get_parameters()
+    except SystemExit :
+        ret_stat = "get_parameters: forced exit"
+
+    if ret_stat != "ok" :
+        f0.log_action("daemon load_config:\n\t"+ret_stat, False)
+        f0.flush_action_log()
+        return(False, {}, {})
+
+    f0.g_mail_pars = None       # Read again at the next mail.
+    return(True, general_pars, weekday_indoor_temp_hours)
+
+
+def save_heartbeat(state) :
+    g_heartbeat["state"] = state
+    g_heartbeat["dt"] = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+    fi_tmp = te["fi_daemon_heartbeat"]+".tmp"
+    f = open(fi_tmp, "w", encoding="utf8")
+    json.dump(g_heartbeat, f, indent=4)
+    f.close()
+    os.replace(fi_tmp, te["fi_daemon_heartbeat"])
+
+
+def get_next_run(run_minute) :
+    now = datetime.now()
+    next_run = now.replace(minute=run_minute, second=0, microsecond=0)
+    if next_run <= now :
+        next_run = next_run + timedelta(hours=1)
+
+    return(next_run)
+
+
+def redirect_output(use_stdout) :
+    # As ">> hourly_run.log" in cron. Also for the programs started by os.system(). Opened per run, the log is rotated.
+    if use_stdout :
+        return()
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    fd = os.open(te["fi_hourly_run_log"], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o664)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+
+
+def end_of_run() :
+    # What atexit does after a run from cron.
+    f0.set_run_budget(None)        # Also after a run that did not come to the end.
+    f9.flush_settings()
+    f9.g_settings = None        # Read again. Another program could have changed it.
+    f10.flush_history()
+    f0.flush_action_log()
+    f0.start_mail_queue_worker()
+    f0.g_mail_worker_started = False
+
+
+def run_control(general_pars, weekday_indoor_temp_hours, use_stdout, changed=None) :
+    # The hourly run or, with changed, an event run.
+    f1.get_pgart_env()      # A new day gives a new fi_hourly_rate.
+    redirect_output(use_stdout)
+    run_type = "run" if changed is None else "event"
+    g_heartbeat["last_"+run_type+"_start"] = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+    save_heartbeat("running" if changed is None else "event:"+",".join(changed))
+    status = "ok"
+    try :
+        if changed is None :
+            ch.run_once(general_pars, weekday_indoor_temp_hours)
+        else :
+            ch.run_event(changed, general_pars, weekday_indoor_temp_hours)
+    except SystemExit :
+        status = "forced_exit"      # Already logged by log_action().
+    except Exception :
+        status = "error"
+        txt = traceback.format_exc()
+        print(txt)
+        f0.log_action("daemon run_control:\n\t"+txt, False)
+
+    f5 = sys.modules.get("pgart_thermia_online_genesis_func")      # Only imported when Thermia online is used.
+    if status != "ok" and f5 is not None :
+        f5.forget_login()       # Could be an expired or revoked token.
+
+    end_of_run()
+    sys.stdout.flush()
+    g_heartbeat["last_"+run_type+"_end"] = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+    g_heartbeat["last_"+run_type+"_status"] = status
+    g_heartbeat["nr_"+run_type+"s"] = g_heartbeat.get("nr_"+run_type+"s", 0) + 1
+
+
+def prefetch(jobs, use_stdout) :
+    # Between the runs. The files are for the next run, they are not events.
+    redirect_output(use_stdout)
+    save_heartbeat("prefetch:"+",".join(jobs))
+    try :
+        g_heartbeat["last_prefetch"] = f12.run_prefetch(jobs)
+    except Exception :
+        txt = traceback.format_exc()
+        print(txt)
+        f0.log_action("daemon prefetch:\n\t"+txt, False)
+
+    g_heartbeat["last_prefetch_end"] = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+    f0.flush_action_log()
+    sys.stdout.flush()
+
+
+def main() :
+    global g_reload
+    use_stdout = get_args()
+    f_lock = open(te["fi_daemon_lock"], "w")
+    if fcntl is not None :
+        try :
+            fcntl.flock(f_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError :
+            print("pgart_control_heating_daemon.py is already running.")
+            exit()
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+    signal.signal(signal.SIGINT, on_sigterm)
+    if hasattr(signal, "SIGHUP") :
+        signal.signal(signal.SIGHUP, on_sighup)
+
+    status, general_pars, weekday_indoor_temp_hours = load_config()
+    if not status :
+        exit()
+
+    config_mtimes = get_config_mtimes()
+    event_mtimes = get_event_mtimes()       # What is there now is the hourly run's business.
+    f0.log_action(
+                  "daemon main:\n\tstarted pid:"+str(os.getpid())+" daemon_run_minute:"+general_pars["daemon_run_minute"]+
+                  " daemon_event_mode:"+general_pars["daemon_event_mode"],
+                  False)
+    f0.flush_action_log()
+
+    while not g_stop :
+        next_run = get_next_run(int(general_pars["daemon_run_minute"]))
+        g_heartbeat["next_run"] = datetime.strftime(next_run, "%Y-%m-%d %H:%M:%S")
+        save_heartbeat("waiting")
+        while not g_stop and datetime.now() < next_run :
+            poll = event_poll if general_pars["daemon_event_mode"] == "y" else max_sleep
+            time.sleep(max(0.1, min(poll, (next_run - datetime.now()).total_seconds())))
+            if g_reload or get_config_mtimes() != config_mtimes :
+                g_reload = False
+                config_mtimes = get_config_mtimes()
+                status, new_general_pars, new_weekday_indoor_temp_hours = load_config()
+                if status :         # Otherwise continue with the parameters that worked.
+                    general_pars, weekday_indoor_temp_hours = new_general_pars, new_weekday_indoor_temp_hours
+                    f0.log_action("daemon main:\n\tparameters loaded again.", False)
+                    f0.flush_action_log()
+
+                next_run = get_next_run(int(general_pars["daemon_run_minute"]))
+                g_heartbeat["next_run"] = datetime.strftime(next_run, "%Y-%m-%d %H:%M:%S")
+
+            if general_pars["prefetch"] == "y" and not g_stop :
+                jobs = f12.get_prefetch_jobs(general_pars, next_run)
+                if len(jobs) > 0 :
+                    prefetch(jobs, use_stdout)
+                    event_mtimes = get_event_mtimes()
+
+            if general_pars["daemon_event_mode"] == "y" and not g_stop :
+                changed = get_changed_inputs(event_mtimes)
+                if len(changed) > 0 and (next_run - datetime.now()).total_seconds() > event_min_before_run :
+                    run_control(general_pars, weekday_indoor_temp_hours, use_stdout, changed)
+                    event_mtimes = get_event_mtimes()       # Written by the event run itself is not a new event.
+
+            save_heartbeat("waiting")
+
+        if not g_stop :
+            run_control(general_pars, weekday_indoor_temp_hours, use_stdout)
+            event_mtimes = get_event_mtimes()       # The files fetched by the run are not events.
+
+    save_heartbeat("stopped")
+    f0.log_action("daemon main:\n\tstopped.", False)
+    f_lock.close()
+
+
+if __name__ == "__main__" :
+    main()
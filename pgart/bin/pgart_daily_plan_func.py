@@ -0,0 +1,317 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# The daily plan. What the control will do each hour of a day, worked out once from the parameters,
+# the weekday schedule, the hourly rates and the forecasts. Kept in var/daily_plan.json for today and tomorrow.
+# A plan is built again when the parameters or the hourly rates have changed. When only the forecasts
+# have changed just the windchill part is patched.
+# pgart_control_heating.py looks up the slot of the hour. pgart_show_plan.py shows a plan without running anything.
+# One slot per hour:
+#   scheduled_temp      the temperature of set_indoor_temp_hours in force this hour.
+#   scheduled_change    1 when set_indoor_temp_hours has a change this hour.
+#   hr_rate_price       0 no decrease hour, -1 a paus hour, else the rate. From hourly rates or top hours.
+#                       Per quarter the mean of the hour. The pump is set once an hour.
+#   hr_rate_slots       the prices of the hour, 1 per hour or 4 per quarter. [] without hourly rates.
+#   hr_rate_decrease    the planned decrease.
+#   windchill           [evaluation_code, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff,
+#                        temp_increase_wanted, temp_increase_final] or None when not in use or no forecast.
+#   windchill_increase  the planned increase.
+#   target              scheduled_temp - hr_rate_decrease + windchill_increase. The night hour is not adjusted.
+
+import json
+import hashlib
+import os
+
+from pathlib import Path
+from datetime import datetime,timedelta
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_get_smhi_forecasts_func as f2
+import pgart_calc_hourly_rate_adj_func as f4
+import pgart_price_store_func as f14
+
+te = f1.get_pgart_env()
+
+max_indoor_temp = 25
+
+
+def get_fi_hourly_rate(day) :
+    # The hourly rate file of another day than today. day: datetime.
+    return(f1.get_fi_hourly_rate(day))
+
+
+def get_hourly_settings_indoor_temp(general_pars, weekday_indoor_temp_hours, week_day_nr) :
+    # Returns (weekday_active, {hour: temp}) from set_indoor_temp_hours=20_14,06_20 or the weekday schedule.
+    if week_day_nr in weekday_indoor_temp_hours :
+        weekday_active = 1
+        set_indoor_temp_hours = weekday_indoor_temp_hours[week_day_nr]
+    else :
+        weekday_active = 0
+        set_indoor_temp_hours = general_pars['set_indoor_temp_hours']
+
+    hourly_settings = {}
+    for x in set_indoor_temp_hours.split(',') :
+        buf = x.split('_')
+        hourly_settings.update({int(buf[0]): int(buf[1])})   # Shall be numeric
+
+    return(weekday_active, hourly_settings)
+
+
+def get_scheduled_indoor_temp(hourly_settings, hour) :
+    k = sorted(hourly_settings.keys()).pop()    # Get the last entry of the day.
+    indoor_temp = hourly_settings[k]            # This will be the temperature between 24 and the first one in the morning.
+    for k in sorted(hourly_settings.keys(), reverse=True) : # Get the last scheduled temperature
+        if hour >= k :
+            indoor_temp = hourly_settings[k]
+            break
+
+    return(indoor_temp)
+
+
+def get_range_hourly_rate_temp_decrease(general_pars) :
+    # Create a dict of hourly_rate_decrease_hours=06-20 => {6: 20}
+    decr_range = {}
+    for x in general_pars['hourly_rate_decrease_hours'].split(',') :
+        buf = x.split('-')
+        decr_range.update({int(buf[0]): int(buf[1])})
+
+    return(decr_range)
+
+
+def get_hourly_rate_prices(general_pars, fi_hourly_rate, verbose_logging) :
+    # {hour: price}. 0 not a decrease hour, -1 a paus hour.
+    hour_price = {}
+    for i in range(0,24) :
+        hour_price[i] = 0
+
+    if general_pars['use_hourly_rates'] == "y" :
+        for start_hr, stop_hr in get_range_hourly_rate_temp_decrease(general_pars).items() :
+            hour_map, tmp_map_price, price = f4.get_top_hour_adj_maps(
+                                                                      fi_hourly_rate, start_hr, stop_hr,
+                                                                      general_pars["hourly_rate_only_decrease_for_this_nr_consecutive_hours"],
+                                                                      general_pars["hourly_rate_min_halt_after_decrease"],
+                                                                      verbose_logging)
+            for i in range(0,24) :
+                if tmp_map_price[i] != 0 :
+                    hour_price[i] = tmp_map_price[i]
+
+    elif int(general_pars["hourly_rate_decrease_during_top_hours"]) > 0 :
+        hr_rates = f0.get_hourly_rates(fi_hourly_rate)
+        sorted_hr_rates = sorted(hr_rates.items(), key=lambda x: float(x[1]), reverse=True)
+        for k, v in sorted_hr_rates[0:int(general_pars["hourly_rate_decrease_during_top_hours"])] :
+            hour_price[k] = v
+
+    return(hour_price)
+
+
+def evaluate_windchill(general_pars, day, hour, indoor_temp, forecast_temp_wind) :
+    # The windchill evaluation of an hour. Returns (evaluation_code, indoor_temp, forecast_temp, forecast_wind,
+    # windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final). See get_windchill_evaluation_texts().
+    forecast_temp = 0
+    forecast_wind = 0
+    windchill_temp = 0
+    temp_diff = 0
+    temp_increase_wanted = 0
+    temp_increase_final = 0
+
+    # If the new indoor temperature will be less than windchill_adjust_only_when_set_indoor_temp_is_above => no action
+    if indoor_temp < int(general_pars['windchill_adjust_only_when_set_indoor_temp_is_above']) :
+        return(1, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final)
+
+    if len(forecast_temp_wind) == 0 :   # SMHI or other returned an empty answer.
+        return(-1, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final)
+
+    # The forecast for the hour pointed to by windchill_use_forecast_this_nr_hours_ahead.
+    hr_forecast = hour + int(general_pars['windchill_use_forecast_this_nr_hours_ahead'])
+    if hr_forecast >= 24 :
+        dt_hr_forecast = datetime.strftime(day + timedelta(1), "%Y-%m-%d")+"_{:02d}".format(hr_forecast - 24)     # Next day.
+    else :
+        dt_hr_forecast = datetime.strftime(day, "%Y-%m-%d")+"_{:02d}".format(hr_forecast)
+
+    # forecast_temp_wind: key = 2022-11-24_01 val = forecast_temp forecast_wind:apparent_temp diff(forecast_temp apparent_temp)
+    #                     val = 2.7 3.3:-0.5 -3.2
+    if not dt_hr_forecast in forecast_temp_wind :
+        return(-4, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final)
+
+    s = forecast_temp_wind[dt_hr_forecast].split(":")    # 2.7 3.3:-0.5 -3.2
+    forecast_temp = float(s[0].split(" ")[0])    # 2.7
+    forecast_wind = float(s[0].split(" ")[1])    # 3.3
+    windchill_temp = float(s[1].split(" ")[0])   # -0.5
+    temp_diff = float(s[1].split(" ")[1])        # -3.2
+
+    # Is the wind cooling enough to maintain an existing increased temperature or to increase the current indoor temperature?
+    if abs(temp_diff) < abs(float(general_pars['windchill_min_apparent_temp_diff'])) :
+        return(2, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final)
+
+    # The heat curve on the pump shows that:
+    # - when the outdoor temperature decreases by 1 degree the supply line temperature will increase by roughly 1 degree.
+    # - an increase of the indoor temperature by 1 degree will increase the supply line temperature by 2.5 degrees.
+    # This will give the following rules:
+    # For each -2.5 degree the windchill temperature is below the outdoor temperature the current_heating_effect shall be increased by 1 degree.
+    # This new current_heating_effect must not exceed windchill_max_indoor_temp_increase and the simulated outdoor
+    # temperature must not get below -25 degrees.
+
+    # Get the maximum allowed indoor temperature increase that will still keep the supply line temperature below 60 degrees.
+    max_allowed_increase = 25 - abs(forecast_temp)/2.5
+
+    # Calculate the expected increase of the indoor temperature depending on the difference between the windchill and the outdoor temperatures.
+    temp_increase_wanted = abs(temp_diff)/2.5
+    temp_increase_final = temp_increase_wanted
+
+    evaluation_code = 3
+    # If temp_increase_wanted is above max_allowed_increase the final increase must be reduced.
+    if temp_increase_final > max_allowed_increase :
+        temp_increase_final = max_allowed_increase
+        evaluation_code = 4
+
+    # As above but for windchill_max_indoor_temp_increase.
+    if temp_increase_final > int(general_pars['windchill_max_indoor_temp_increase']) :
+        temp_increase_final = int(general_pars['windchill_max_indoor_temp_increase'])
+        evaluation_code = 5
+
+    return(evaluation_code, indoor_temp, forecast_temp, forecast_wind, windchill_temp, temp_diff, temp_increase_wanted, temp_increase_final)
+
+
+def get_windchill_increase(windchill) :
+    if windchill is None or not windchill[0] in [3, 4, 5] :
+        return(0)
+
+    return(int(round(windchill[7] + 0.001)))  # 0.001 because round off behaviour
+
+
+def get_hash(x) :
+    return(hashlib.sha256(x.encode("utf8")).hexdigest()[:16])
+
+
+def get_plan_key(general_pars, weekday_indoor_temp_hours, day, fi_hourly_rate) :
+    # What the plan is built from, except the forecasts.
+    pars = json.dumps([general_pars, {str(k): v for k, v in weekday_indoor_temp_hours.items()}], sort_keys=True)
+    rates = "-"
+    if Path(fi_hourly_rate).is_file() :
+        f = open(fi_hourly_rate, "r", encoding="utf8")
+        rates = f.read()
+        f.close()
+
+    return(get_hash(pars)+"_"+get_hash(rates)+"_"+str(day.weekday() + 1))
+
+
+def get_forecast_key(forecast_recs) :
+    if forecast_recs is None :
+        return("-")
+
+    return(get_hash("\n".join(forecast_recs)))
+
+
+def get_forecast_temp_wind(general_pars, forecast_recs) :
+    if forecast_recs is None :
+        return({})
+
+    return(f2.get_forecasts(f0.get_forecast_short(forecast_recs), float(general_pars['windchill_wind_force_factor'])))
+
+
+def set_slot_target(slot, is_night_hour) :
+    if is_night_hour :
+        slot["target"] = slot["scheduled_temp"]     # A scheduled night run is not adjusted.
+    else :
+        slot["target"] = min(max_indoor_temp, slot["scheduled_temp"] - slot["hr_rate_decrease"] + slot["windchill_increase"])
+
+
+def patch_windchill(plan, general_pars, forecast_recs) :
+    # Only the windchill part. The forecasts have changed.
+    day = datetime.strptime(plan["date"], "%Y-%m-%d")
+    forecast_temp_wind = {}
+    if general_pars['use_windchill_compensation'] == "y" :
+        forecast_temp_wind = get_forecast_temp_wind(general_pars, forecast_recs)
+
+    for hour in range(0,24) :
+        slot = plan["slots"][hour]
+        slot["windchill"] = None
+        if general_pars['use_windchill_compensation'] == "y" and forecast_recs is not None :
+            slot["windchill"] = list(evaluate_windchill(general_pars, day, hour, slot["scheduled_temp"], forecast_temp_wind))
+
+        slot["windchill_increase"] = get_windchill_increase(slot["windchill"])
+        set_slot_target(slot, hour == plan["night_hour"])
+
+    plan["forecast_key"] = get_forecast_key(forecast_recs)
+
+
+def build_daily_plan(day, general_pars, weekday_indoor_temp_hours, fi_hourly_rate, forecast_recs, verbose_logging=[]) :
+    # day: datetime. forecast_recs: the lines of forecast_short or None.
+    weekday_active, hourly_settings = get_hourly_settings_indoor_temp(general_pars, weekday_indoor_temp_hours, day.weekday() + 1)
+    hour_price = {}
+    for i in range(0,24) :
+        hour_price[i] = 0
+
+    series = (60, [], [])
+    rates_in_use = general_pars['use_hourly_rates'] == "y" or int(general_pars["hourly_rate_decrease_during_top_hours"]) > 0
+    if rates_in_use and Path(fi_hourly_rate).is_file() and f0.is_hourly_rates_proper(f0.read_recs(fi_hourly_rate), day)[0] :
+        hour_price = get_hourly_rate_prices(general_pars, fi_hourly_rate, verbose_logging)
+        series = f14.read_price_series(fi_hourly_rate)
+
+    plan = {
+            "date": datetime.strftime(day, "%Y-%m-%d"), "weekday_active": weekday_active, "rate_minutes": series[0],
+            "night_hour": sorted(hourly_settings.keys()).pop(),
+            "key": get_plan_key(general_pars, weekday_indoor_temp_hours, day, fi_hourly_rate),
+            "slots": []}
+
+    for hour in range(0,24) :
+        hr_rate_decrease = 0
+        if hour_price[hour] > 0 and float(general_pars["hourly_rate_only_decrease_when_rate_above"]) * 100 < hour_price[hour] :
+            hr_rate_decrease = int(general_pars['hourly_rate_decrease_nr_grades'])
+
+        plan["slots"].append({
+                              "hour": hour, "scheduled_temp": get_scheduled_indoor_temp(hourly_settings, hour),
+                              "scheduled_change": 1 if hour in hourly_settings else 0,
+                              "hr_rate_price": hour_price[hour], "hr_rate_slots": f14.get_hour_slots(series, hour),
+                              "hr_rate_decrease": hr_rate_decrease})
+
+    patch_windchill(plan, general_pars, forecast_recs)
+    return(plan)
+
+
+def get_daily_plans() :
+    try :
+        f = open(te["fi_daily_plan"], "r", encoding="utf8")
+        plans = json.load(f)
+        f.close()
+    except (OSError, ValueError) :
+        plans = {}
+
+    return(plans)
+
+
+def save_daily_plan(plan) :
+    # Today and tomorrow are kept.
+    plans = get_daily_plans()
+    plans[plan["date"]] = plan
+    keep = [datetime.strftime(datetime.now() + timedelta(i), "%Y-%m-%d") for i in range(0,2)]
+    plans = {k: v for k, v in plans.items() if k in keep}
+
+    fi_tmp = te["fi_daily_plan"]+".tmp"
+    f = open(fi_tmp, "w", encoding="utf8")
+    json.dump(plans, f, indent=1)
+    f.close()
+    os.replace(fi_tmp, te["fi_daily_plan"])
+
+
+def get_daily_plan(day, general_pars, weekday_indoor_temp_hours, fi_hourly_rate, forecast_recs, verbose_logging=[]) :
+    # The stored plan if it is still valid, patched if only the forecasts have changed, else a new one.
+    # Returns (plan, how): how is stored, patched or built.
+    plan = get_daily_plans().get(datetime.strftime(day, "%Y-%m-%d"))
+    key = get_plan_key(general_pars, weekday_indoor_temp_hours, day, fi_hourly_rate)
+    if plan is not None and plan["key"] == key :
+        if plan["forecast_key"] == get_forecast_key(forecast_recs) :
+            return(plan, "stored")
+
+        patch_windchill(plan, general_pars, forecast_recs)
+        save_daily_plan(plan)
+        return(plan, "patched")
+
+    plan = build_daily_plan(day, general_pars, weekday_indoor_temp_hours, fi_hourly_rate, forecast_recs, verbose_logging)
+    save_daily_plan(plan)
+    return(plan, "built")
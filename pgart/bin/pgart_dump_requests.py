@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# Shows the HTTP exchanges kept in var/log/requests when verbose_logging includes 6.
+# There is one ring file per endpoint with the last exchanges. The oldest is printed first.
+#   pgart_dump_requests.py -l                   the ring files.
+#   pgart_dump_requests.py -e thermia -n 2      the last 2 exchanges of the endpoints matching "thermia".
+
+import getopt, sys
+import glob
+import os
+import json
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_lang_func as f8
+
+g_lang = f8.get_language()
+g_ui_text = f1.ui_texts(g_lang)
+te = f1.get_pgart_env()
+
+
+def get_args() :
+    argv = sys.argv[1:]     # Bypass my own name
+    options = "e:n:l"
+    long_options = ["endpoint=", "nr=", "list"]
+    endpoint = ""
+    nr = f0.request_ring_nr_slots
+    list_only = False
+    try:
+        args, values = getopt.getopt(argv, options, long_options)
+        for arg, val in args :
+            if arg in ("-e", "--endpoint") :
+                endpoint = val
+            elif arg in ("-n", "--nr") :
+                nr = int(val)
+            elif arg in ("-l", "--list") :
+                list_only = True
+    except (getopt.error, ValueError) as err :
+        print(str(err))
+        print("usage: pgart_dump_requests.py -e <part of endpoint> -n <nr exchanges> -l")
+        exit()
+
+    return(endpoint, nr, list_only)
+
+
+def print_exchange(rec) :
+    print("\n"+rec["dt"]+" BEGIN: "+rec["func"])
+    print(rec["method"]+" "+rec["url"]+" status:"+str(rec["status"])+" ms:"+str(rec["elapsed_ms"]))
+    print("\nrequest headers")
+    print(json.dumps(rec["request_headers"], indent=4, ensure_ascii=False))
+    print("\nrequest body")
+    print(rec["request_body"])
+    print("\nresponse headers")
+    print(json.dumps(rec["response_headers"], indent=4, ensure_ascii=False))
+    print("\ncontent bytes:"+str(rec["content_len"]))
+    print(rec["content"])
+    if rec["content_truncated"] :
+        print("... (truncated)")
+
+    print("\n"+rec["dt"]+" END: "+rec["func"])
+
+
+endpoint, nr, list_only = get_args()
+for fi in sorted(glob.glob(te["g_request_ring_dir"]+"/*.ring")) :
+    if endpoint not in os.path.basename(fi) :
+        continue
+
+    recs = f0.read_request_ring(fi)
+    if list_only :
+        last_dt = recs[-1]["dt"] if len(recs) > 0 else "-"
+        print("{:60s} {:>3d} {}".format(os.path.basename(fi), len(recs), last_dt))
+        continue
+
+    print("\n==== "+fi)
+    for rec in recs[max(0, len(recs) - nr):] :
+        print_exchange(rec)
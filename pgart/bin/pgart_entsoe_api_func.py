@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# The day-ahead prices from the REST API of the ENTSO-E Transparency Platform, web-api.tp.entsoe.eu/api.
+# The API needs a security token. Register at transparency.entsoe.eu and ask for "Restful API access".
+# The token is kept in etc/pgart_entsoe_api.conf, not in pgart_control_heating.conf that is printed in the log.
+#   documentType=A44, in_Domain = out_Domain = the EIC code of the zone, periodStart/periodEnd yyyymmddHHMM in UTC.
+# One request per zone for all the days, at most a year. The answer, a Publication_MarketDocument, is parsed while
+# it is downloaded. A Period is cleared when its prices are taken, so the memory does not grow with the days.
+# The slots go straight into the price store. No prices: the answer is an Acknowledgement_MarketDocument with a Reason.
+# pgart_fill_price_store.py fetches a range of days. pgart_get_hourly_rates_entsoe_eu.py uses it when there is a token.
+# pgart_entsoe_api_standin.py answers as the API with the synthetic documents in xtra_pages, for a test.
+
+import os
+import xml.etree.ElementTree as ET
+
+from datetime import datetime,timezone
+from urllib.parse import urlencode
+
+import requests
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_lang_func as f8
+import pgart_http_func as f13
+import pgart_price_store_func as f14
+
+g_lang = f8.get_language()
+g_ui_text = f1.ui_texts(g_lang)
+te = f1.get_pgart_env()
+
+api_url = "https://web-api.tp.entsoe.eu/api"
+api_max_seconds = 365 * 86400       # The API answers at most a year per request.
+api_resolutions = {"PT15M": 15, "PT60M": 60}   # The price store has hours and quarters.
+
+# The EIC codes of the bidding zones. The same as in the URLs of pgart_get_hourly_rates_entsoe_eu.py.
+eic_codes = {
+    "SE1": "10Y1001A1001A44P", "SE2": "10Y1001A1001A45N", "SE3": "10Y1001A1001A46L", "SE4": "10Y1001A1001A47J",
+    "DK1": "10YDK-1--------W", "DK2": "10YDK-2--------M",
+    "NO1": "10YNO-1--------2", "NO2": "10YNO-2--------T", "NO2NSL": "50Y0JVU59B4JWQCU", "NO3": "10YNO-3--------J",
+    "NO4": "10YNO-4--------9", "NO5": "10Y1001A1001A48H",
+    "FI": "10YFI-1--------U", "EE": "10Y1001A1001A39I", "LV": "10YLV-1001A00074", "LT": "10YLT-1001A0008Q"}
+
+g_api_pars = None       # Read once by get_api_params().
+
+
+def get_api_params() :
+    # {"security_token", "api_url"} from etc/pgart_entsoe_api.conf. security_token is "none" without the file.
+    global g_api_pars
+    if g_api_pars is not None :
+        return(g_api_pars)
+
+    pars = {"security_token": "none", "api_url": api_url}
+    if os.path.isfile(te["fi_entsoe_api"]) :
+        f = open(te["fi_entsoe_api"], "r", encoding="utf8")
+        for rec in f :
+            rec = rec.split("#")[0].strip()
+            if rec == "" :
+                continue
+
+            if rec.find("=") == -1 :
+                print(te["fi_entsoe_api"]+" "+rec+" "+g_ui_text["tp5"])
+                continue
+
+            buf = rec.split("=", 1)
+            par = buf[0].strip()
+            if not (par in pars) :
+                print(te["fi_entsoe_api"]+" "+par+" "+g_ui_text["tp10"])
+                continue
+
+            pars[par] = buf[1].strip()
+        f.close()
+
+    g_api_pars = pars
+    return(pars)
+
+
+def is_api_configured() :
+    return(get_api_params()["security_token"] not in ("", "none"))
+
+
+def get_utc_text(t) :
+    # UTC seconds => "202511042300".
+    return(datetime.fromtimestamp(t, timezone.utc).strftime("%Y%m%d%H%M"))
+
+
+def get_utc_seconds(text) :
+    # "2025-11-04T23:00Z" => UTC seconds.
+    return(int(datetime.strptime(text.strip(), "%Y-%m-%dT%H:%MZ").replace(tzinfo=timezone.utc).timestamp()))
+
+
+def get_url_api(zone, t_from, t_to) :
+    pars = get_api_params()
+    query = {
+             "securityToken": pars["security_token"], "documentType": "A44",
+             "in_Domain": eic_codes[zone], "out_Domain": eic_codes[zone],
+             "periodStart": get_utc_text(t_from), "periodEnd": get_utc_text(t_to),
+             "contract_MarketAgreement.type": "A01"}     # Day-ahead. Not the intraday auctions.
+    return(pars["api_url"]+"?"+urlencode(query))
+
+
+def get_tag(elem) :
+    # "{urn:iec62325.351:tc57wg16:451-3:publicationdocument:7:3}Point" => "Point". The version of the namespace changes.
+    return(elem.tag.rsplit("}", 1)[-1])
+
+
+def get_period_slots(period, points) :
+    # A Period => [(UTC start, price)] in cent/kWh. points: {position: EUR/MWh}.
+    # curveType A03: a position that is left out has the same price as the one before it.
+    minutes = api_resolutions[period["resolution"]]
+    start = get_utc_seconds(period["start"])
+    end = get_utc_seconds(period["end"])
+    slots = []
+    price = None
+    for position, t in enumerate(range(start, end, minutes * 60), 1) :
+        price = points.get(position, price)
+        if price is not None :
+            slots.append((t, round(price/10, 3)))    # MWh -> kWh  /1000  Euro -> cent *100
+
+    return(slots)
+
+
+def parse_document(chunks, t_from, t_to) :
+    # The chunks of the answer => ({minutes: {UTC start: price}} from t_from up to t_to, the reason when no prices).
+    # An incremental iterparse: the elements are handled as they are closed and then cleared. chunks is closed.
+    # Raises ET.ParseError when the answer is not XML.
+    parser = ET.XMLPullParser(events=("start", "end"))
+    slots = {}
+    reason = []
+    root = None
+    period = {}
+    points = {}
+    point = {}
+    try :
+        for chunk in chunks :
+            parser.feed(chunk)
+            for event, elem in parser.read_events() :
+                if event == "start" :
+                    if root is None :
+                        root = elem
+                    continue
+
+                tag = get_tag(elem)
+                if tag in ("position", "price.amount") :
+                    point[tag] = elem.text
+                elif tag == "Point" :
+                    points[int(point["position"])] = float(point["price.amount"])
+                    point = {}
+                    elem.clear()
+                elif tag in ("start", "end", "resolution") :
+                    period[tag] = elem.text     # The last start and end before </Period> are of the Period.
+                elif tag == "Period" :
+                    if period.get("resolution") in api_resolutions :
+                        minutes_slots = slots.setdefault(api_resolutions[period["resolution"]], {})
+                        for t, price in get_period_slots(period, points) :
+                            if t_from <= t < t_to :
+                                minutes_slots.setdefault(t, price)      # The first TimeSeries of the slot.
+                    period = {}
+                    points = {}
+                    elem.clear()
+                elif tag == "TimeSeries" :
+                    root.clear()        # The handled TimeSeries are dropped from the document.
+                elif tag == "text" :
+                    reason.append(elem.text or "")      # <Reason><code>999</code><text>No matching data found...
+        parser.close()
+    finally :
+        chunks.close()
+
+    return(slots, " ".join(reason))
+
+
+def fetch_slots(zone, t_from, t_to, logreq, max_log_len) :
+    # One request. Returns (status, {minutes: {UTC start: price}}, info).
+    url = get_url_api(zone, t_from, t_to)
+    try :
+        response, chunks = f13.get_stream(url)
+        try :
+            slots, reason = parse_document(chunks, t_from, t_to)
+        except ET.ParseError :
+            slots, reason = ({}, "")        # 401 without a proper token is a web page.
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError) :
+        return(False, {}, g_ui_text["t29d"])
+
+    f0.log_request("fetch_entsoe_api", response, logreq, max_log_len)
+
+    if response.status_code != 200 or len(slots) == 0 :
+        return(False, {}, g_ui_text["t30j"]+" response:"+str(response.status_code)+" "+reason)
+
+    return(True, slots, "")
+
+
+def fetch_range(zones, day_from, day_to, logreq=0, max_log_len=1000) :
+    # The prices of the zones from the local day day_from to day_to, both included, => the price store.
+    # Returns {zone: (status, nr slots, info)}. A zone without prices for some of the days has what it got.
+    t_from = f14.get_day_bounds(day_from)[0]
+    t_to = f14.get_day_bounds(day_to)[1]
+    result = {}
+    for zone in zones :
+        status = True
+        nr = 0
+        info = ""
+        t = t_from
+        while status and t < t_to :
+            t_end = min(t_to, t + api_max_seconds)
+            status, slots, info = fetch_slots(zone, t, t_end, int(logreq), max_log_len)
+            for minutes, minutes_slots in slots.items() :
+                f14.add_slots(zone, list(minutes_slots.items()), minutes)
+                nr += len(minutes_slots)
+            t = t_end
+
+        result[zone] = (status, nr, info)
+        f0.log_action("fetch_entsoe_api:\n\t"+zone+" "+get_utc_text(t_from)+"-"+get_utc_text(t_to)+" slots:"+str(nr)+" "+info, False)
+
+    return(result)
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# A stand-in for the ENTSO-E REST API, to test pgart_entsoe_api_func.py without a token or a network.
+# It answers GET /api?documentType=A44&in_Domain=<EIC>... with the synthetic document of the zone,
+# xtra_pages/entsoe_api_<zone>_synthetic.xml.gz, when the period overlaps it. Else an Acknowledgement "No matching data found".
+# The documents are made up in the layout of the API, not recorded from it. The prices are not real prices.
+# A missing securityToken gives 401 as the real one.
+#   pgart_entsoe_api_standin.py -p 8765
+#   and in etc/pgart_entsoe_api.conf:
+#   security_token = test
+#   api_url = http://127.0.0.1:8765/api
+#   then e.g. pgart_fill_price_store.py -z SE3,SE4 -f 20251025 -t 20251106
+
+import getopt, sys
+import gzip
+import re
+
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+from urllib.parse import urlparse,parse_qs
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_http_func as f13
+import pgart_entsoe_api_func as f16
+
+te = f1.get_pgart_env()
+
+acknowledgement = """<?xml version="1.0" encoding="utf-8"?>
+<Acknowledgement_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-1:acknowledgementdocument:7:0">
+	<mRID>standin</mRID>
+	<createdDateTime>2025-01-01T00:00:00Z</createdDateTime>
+	<Reason>
+		<code>999</code>
+		<text>No matching data found for Data item Day-ahead Prices [12.1.D] ({0}) and interval {1}.</text>
+	</Reason>
+</Acknowledgement_MarketDocument>
+"""
+
+
+def get_args() :
+    argv = sys.argv[1:]     # Bypass my own name
+    options = "p:"
+    long_options = ["port="]
+    port = 8765
+    try:
+        args, values = getopt.getopt(argv, options, long_options)
+        for arg, val in args :
+            if arg in ("-p", "--port") :
+                port = int(val)
+    except (getopt.error, ValueError) as err :
+        print(str(err))
+        print("usage: pgart_entsoe_api_standin.py -p <port>")
+        exit()
+
+    return(port)
+
+
+def get_document(zone) :
+    # The synthetic document and its period in UTC seconds. None when there is none for the zone.
+    try :
+        f = gzip.open(te["g_pgart_dir"]+"/xtra_pages/entsoe_api_"+zone+"_synthetic.xml.gz", "rb")
+    except OSError :
+        return(None, 0, 0)
+
+    body = f.read()
+    f.close()
+    interval = re.search(rb"<period.timeInterval>\s*<start>(.*?)</start>\s*<end>(.*?)</end>", body)
+    return(body, f16.get_utc_seconds(interval.group(1).decode()), f16.get_utc_seconds(interval.group(2).decode()))
+
+
+class ApiHandler(BaseHTTPRequestHandler) :
+
+    def send_body(self, status, body) :
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml" if body.startswith(b"<?xml") else "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for i in range(0, len(body), f13.stream_chunk_size) :
+            self.wfile.write(body[i:i + f13.stream_chunk_size])
+
+    def do_GET(self) :
+        url = urlparse(self.path)
+        query = {par: val[0] for par, val in parse_qs(url.query).items()}
+        if url.path != "/api" :
+            self.send_body(404, b"<html><body>Not found</body></html>")
+            return()
+
+        if query.get("securityToken", "") == "" :
+            self.send_body(401, b"<html><body><h1>Unauthorized</h1></body></html>")
+            return()
+
+        zones = [zone for zone, eic in f16.eic_codes.items() if eic == query.get("in_Domain")]
+        try :
+            t_from = int(datetime.strptime(query["periodStart"]+"+0000", "%Y%m%d%H%M%z").timestamp())
+            t_to = int(datetime.strptime(query["periodEnd"]+"+0000", "%Y%m%d%H%M%z").timestamp())
+        except (KeyError, ValueError) :
+            self.send_body(400, acknowledgement.format("?", "?").encode())
+            return()
+
+        body, start, end = get_document(zones[0] if len(zones) > 0 else "")
+        if query.get("documentType") != "A44" or body is None or end <= t_from or t_to <= start :
+            interval = f16.get_utc_text(t_from)+"-"+f16.get_utc_text(t_to)
+            self.send_body(200, acknowledgement.format(query.get("in_Domain", "?"), interval).encode())
+            return()
+
+        self.send_body(200, body)       # The whole period. The client takes its part.
+
+
+port = get_args()
+server = ThreadingHTTPServer(("127.0.0.1", port), ApiHandler)
+print("pgart_entsoe_api_standin: http://127.0.0.1:"+str(port)+"/api")
+try :
+    server.serve_forever()
+except KeyboardInterrupt :
+    server.server_close()
+
+exit()
@@ -11,7 +11,6 @@ import json
 import platform
 import os
 import glob
-import requests
 
 from pathlib import Path
 from datetime import date,time,datetime,timedelta
@@ -73,8 +72,11 @@ def get_url_template_smhi() :
     return(url_template_smhi)
 
 
+g_pgart_env = {}        # The same dict for all modules. A new call updates it, like the date in fi_hourly_rate.
+
+
 def get_pgart_env() :
-    pgart_env = {}
+    pgart_env = g_pgart_env
     g_os = platform.system()
     try:
         g_home = os.getenv("HOME")      #debian/ubuntu
@@ -88,12 +90,19 @@ def get_pgart_env() :
     g_local_dir=g_var_dir+'/local'
     g_log_dir=g_var_dir+'/log'
     g_stat_dir=g_var_dir+'/stat'
+    g_mail_spool_dir=g_var_dir+'/spool/mail'
+    g_history_dir=g_var_dir+'/history'
+    g_request_ring_dir=g_log_dir+'/requests'
+    g_http_cache_dir=g_var_dir+'/http_cache'
+    g_price_store_dir=g_var_dir+'/price_store'
 
     fi_action_log=g_log_dir+"/action.log"
+    fi_action_log_json=g_log_dir+"/action_log.jsonl"
     fi_hourly_run_log=g_log_dir+"/hourly_run.log"
     fi_run_summary_log=g_log_dir+"/summary_run.log"
     fi_run_summary_log_explanations=g_local_dir+"/explanations_summary_run_log.txt"
     fi_last_log_rotate=g_var_dir+"/last_log_rotate.txt"
+    fi_log_compress_lock=g_var_dir+"/log_compress.lock"
     fi_monthly_rates=g_local_dir+"/monthly_rates.txt"
     dt = datetime.strftime(datetime.now(), "%Y%m%d")
     fi_hourly_rate=g_local_dir+"/hourly_rate_"+dt+".txt"
@@ -106,9 +115,17 @@ def get_pgart_env() :
 
     fi_par=g_etc_dir+"/pgart_control_heating.conf"
     fi_mail_params=g_etc_dir+"/pgart_mail_params.conf"
+    fi_entsoe_api=g_etc_dir+"/pgart_entsoe_api.conf"
     fi_language=g_etc_dir+"/pgart_language.conf"
     fi_windchill_stats=g_log_dir+"/windchill_stats.log"
     fi_settings_status=g_var_dir+"/settings_status.txt"
+    fi_hourly_rate_plan_cache=g_var_dir+"/hourly_rate_plan_cache.txt"
+    fi_daily_plan=g_var_dir+"/daily_plan.json"
+    fi_state_db=g_var_dir+"/pgart_state.db"
+    fi_mail_sent=g_var_dir+"/spool/mail_sent.txt"
+    fi_mail_queue_lock=g_var_dir+"/spool/mail_queue.lock"
+    fi_daemon_heartbeat=g_var_dir+"/daemon_heartbeat.json"
+    fi_daemon_lock=g_var_dir+"/daemon.lock"
 
     pgart_env["g_bin_dir"] = g_bin_dir
     pgart_env["g_pgart_dir"] = g_pgart_dir
@@ -116,11 +133,18 @@ def get_pgart_env() :
     pgart_env["g_local_dir"] = g_local_dir
     pgart_env["g_log_dir"] = g_log_dir
     pgart_env["g_stat_dir"] = g_stat_dir
+    pgart_env["g_mail_spool_dir"] = g_mail_spool_dir
+    pgart_env["g_history_dir"] = g_history_dir
+    pgart_env["g_request_ring_dir"] = g_request_ring_dir
+    pgart_env["g_http_cache_dir"] = g_http_cache_dir
+    pgart_env["g_price_store_dir"] = g_price_store_dir
     pgart_env["fi_action_log"] = fi_action_log
+    pgart_env["fi_action_log_json"] = fi_action_log_json
     pgart_env["fi_hourly_run_log"] = fi_hourly_run_log
     pgart_env["fi_run_summary_log"] = fi_run_summary_log
     pgart_env["fi_run_summary_log_explanations"] = fi_run_summary_log_explanations
     pgart_env["fi_last_log_rotate"] = fi_last_log_rotate
+    pgart_env["fi_log_compress_lock"] = fi_log_compress_lock
     pgart_env["fi_monthly_rates"] = fi_monthly_rates
     pgart_env["fi_hourly_rate"] = fi_hourly_rate
     pgart_env["fi_indoor_temp_reading"] = fi_indoor_temp_reading
@@ -131,7 +155,15 @@ def get_pgart_env() :
     pgart_env["fi_forecast_temp_wind"] = fi_forecast_temp_wind
     pgart_env["fi_windchill_stats"] = fi_windchill_stats
     pgart_env["fi_settings_status"] = fi_settings_status
+    pgart_env["fi_hourly_rate_plan_cache"] = fi_hourly_rate_plan_cache
+    pgart_env["fi_daily_plan"] = fi_daily_plan
+    pgart_env["fi_state_db"] = fi_state_db
+    pgart_env["fi_mail_sent"] = fi_mail_sent
+    pgart_env["fi_mail_queue_lock"] = fi_mail_queue_lock
+    pgart_env["fi_daemon_heartbeat"] = fi_daemon_heartbeat
+    pgart_env["fi_daemon_lock"] = fi_daemon_lock
     pgart_env["fi_mail_params"] = fi_mail_params
+    pgart_env["fi_entsoe_api"] = fi_entsoe_api
     pgart_env["fi_language"] = fi_language
     pgart_env["fi_par"] = fi_par
 
@@ -142,6 +174,11 @@ def get_pgart_env() :
     return(pgart_env)
 
 
+def get_fi_hourly_rate(day) :
+    # The hourly rate file of any day. day: datetime. fi_hourly_rate is the one of today.
+    return(g_pgart_env["g_local_dir"]+"/hourly_rate_"+datetime.strftime(day, "%Y%m%d")+".txt")
+
+
 def default_config_parameters():
     def_conf_pars = {}
     def_conf_pars["pump_access_method"] = "a"
@@ -174,9 +211,13 @@ def default_config_parameters():
     def_conf_pars["pgm_create_hourly_rates"] = ","
     def_conf_pars["external_pgm_read_indoor_sensor"] = ","
     def_conf_pars["el_area"] = "SE4"
-    def_conf_pars["rotate_log_files_this_weekday_nr"] = "1"
+    def_conf_pars["state_store"] = "file"
+    def_conf_pars["history_store"] = "y"
+    def_conf_pars["rotate_log_files_this_weekday_nr"] = "1"    # Not used. Replaced by rotate_log_limits.
+    def_conf_pars["rotate_log_limits"] = "hourly_run:2048_7,action:1024_7,action_json:1024_7,windchill_stats:512_28,summary_run:512_28"
     def_conf_pars["keep_nr_rotated_log_files"] = "10"
     def_conf_pars["verbose_logging"] = "0"
+    def_conf_pars["action_log_format"] = "text"
     def_conf_pars["max_log_len"] = "10000"
     def_conf_pars["use_hourly_rates"] = "n"
     def_conf_pars["create_hourly_rates"] = "n"
@@ -187,9 +228,20 @@ def default_config_parameters():
     def_conf_pars["hourly_rate_min_halt_after_decrease"] = "1"
     def_conf_pars["hourly_rate_decrease_nr_grades"] = "2"
     def_conf_pars["hourly_rate_decrease_during_top_hours"] = "0"
+    def_conf_pars["daemon_run_minute"] = "2"
+    def_conf_pars["daemon_event_mode"] = "n"
+    def_conf_pars["run_time_budget"] = "300"
+    def_conf_pars["prefetch"] = "y"
+    def_conf_pars["prefetch_hourly_rates_from_hour"] = "13"
+    def_conf_pars["prefetch_forecast_minutes_before"] = "5"
+    def_conf_pars["forecast_max_age"] = "20"
     def_conf_pars["mail_user"] = "none"
     def_conf_pars["gmail_app_pwd"] = "x"
     def_conf_pars["mail_subject"] = "pgart_t"
+    def_conf_pars["smtp_host"] = "smtp.gmail.com"
+    def_conf_pars["smtp_port"] = "587"
+    def_conf_pars["mail_dedup_minutes"] = "60"
+    def_conf_pars["smtp_login_without_tls"] = "n"
 
     return(def_conf_pars)
 
@@ -217,9 +269,13 @@ def valid_config_parameters():
     valid_conf_pars["external_pgm_read_indoor_sensor"] = "exec_path"
     valid_conf_pars["pgm_create_hourly_rates"] = "txt:4-40"
     valid_conf_pars["el_area"] = "txt_single:SE1,SE2,SE3,SE4,ost,sor,vest,midt,nord,finland,*"
+    valid_conf_pars["state_store"] = "txt_single:file,sqlite"
+    valid_conf_pars["history_store"] = "txt_single:y,n"
     valid_conf_pars["rotate_log_files_this_weekday_nr"] = "int_single:1-7"
     valid_conf_pars["keep_nr_rotated_log_files"] = "int_single:2-10"
-    valid_conf_pars["verbose_logging"] = "int_range:0-6"
+    valid_conf_pars["rotate_log_limits"] = "log_limits"
+    valid_conf_pars["verbose_logging"] = "int_range:0-7"
+    valid_conf_pars["action_log_format"] = "txt_single:text,json,both"
     valid_conf_pars["max_log_len"] = "int_range:1-10000000"
     valid_conf_pars["use_hourly_rates"] = "txt_single:y,n"
     valid_conf_pars["create_hourly_rates"] = "txt_single:y,n"
@@ -229,9 +285,20 @@ def valid_config_parameters():
     valid_conf_pars["hourly_rate_min_halt_after_decrease"] = "int_single:1-3"
     valid_conf_pars["hourly_rate_decrease_nr_grades"] = "int_single:1-5"
     valid_conf_pars["hourly_rate_decrease_during_top_hours"] = "int_single:0-24"
+    valid_conf_pars["daemon_run_minute"] = "int_single:0-59"
+    valid_conf_pars["daemon_event_mode"] = "txt_single:y,n"
+    valid_conf_pars["run_time_budget"] = "int_single:60-3000"
+    valid_conf_pars["prefetch"] = "txt_single:y,n"
+    valid_conf_pars["prefetch_hourly_rates_from_hour"] = "int_single:0-23"
+    valid_conf_pars["prefetch_forecast_minutes_before"] = "int_single:1-30"
+    valid_conf_pars["forecast_max_age"] = "int_single:0-120"
     valid_conf_pars["mail_user"] = "mailaddress"
-    valid_conf_pars["gmail_app_pwd"] = "txt:16-16"
+    valid_conf_pars["gmail_app_pwd"] = "txt:1-64"
     valid_conf_pars["mail_subject"] = "txt:1-30"
+    valid_conf_pars["smtp_host"] = "txt:1-100"
+    valid_conf_pars["smtp_port"] = "int_range:1-65535"
+    valid_conf_pars["mail_dedup_minutes"] = "int_range:0-1440"
+    valid_conf_pars["smtp_login_without_tls"] = "txt_single:y,n"
 
     return(valid_conf_pars)
 
@@ -261,7 +328,17 @@ def get_windchill_evaluation_texts(lang_id):
     return(windchill_results)
 
 
+g_ui_texts = {}     # lang_id: the texts. Built once, the modules share them.
+
+
 def ui_texts(lang_id) :
+    if not lang_id in g_ui_texts :
+        g_ui_texts[lang_id] = build_ui_texts(lang_id)
+
+    return(g_ui_texts[lang_id])
+
+
+def build_ui_texts(lang_id) :
     if lang_id == "en" :
         lang_ix = 1
     else :
@@ -513,6 +590,10 @@ def ui_texts(lang_id) :
     ["Kunde inte hämta priserna från elprisetjustnu.se. Förmodligen nätverksfel.",
     "Failed to get prices from elprisetjustnu.se. Network problem."]
 
+    ui_text["t29d"] = \
+    ["Kunde inte hämta priserna från ENTSO-E:s API. Förmodligen nätverksfel.",
+    "Failed to get prices from the ENTSO-E API. Network problem."]
+
     ui_text["t30"] = \
     ["Kunde inte hämta priserna från elbruk.se.",
     "Failed to get prices from elbruk.se."]
@@ -549,6 +630,10 @@ def ui_texts(lang_id) :
     ["pgart_control_heating_se/en. Bara schemastyrning konfigurerad. Den fungerar trots att timpriserna inte kunde hämtas.",
     "pgart_control_heating_se/en. Only schema control. It works even if the hourly rates could not be retrieved."]
 
+    ui_text["t30j"] = \
+    ["ENTSO-E:s API gav inga priser.",
+    "The ENTSO-E API gave no prices."]
+
     ui_text["t31"] = \
     ["Requestet är för stort för loggning:",
     "The request is too big to be logged:"]
@@ -709,6 +794,10 @@ def ui_texts(lang_id) :
     ["Timmen ska vara 0-23",
     "The hour must be 0-23"]
 
+    ui_text["th3c"] = \
+    ["Minuten ska vara 00, 15, 30 eller 45",
+    "The minute must be 00, 15, 30 or 45"]
+
     ui_text["th3b"] = \
     ["Månaden ska vara 1-12",
     "The month must be 1-12"]
@@ -718,8 +807,12 @@ def ui_texts(lang_id) :
     "Wrong format. Must be a number with a dot, like: 1.23"]
 
     ui_text["th5"] = \
-    ["Det ska vara 24 timprisrader i filen.",
-    "There shall be 24 hourly_rate lines in the file."]
+    ["Det ska vara en timprisrad per timme i dygnet, 24, eller per kvart, 96. 23/92 och 25/100 när sommartiden börjar och slutar.",
+    "There shall be one hourly_rate line per hour of the day, 24, or per quarter, 96. 23/92 and 25/100 when daylight saving time starts and ends."]
+
+    ui_text["th5c"] = \
+    ["Alla rader ska vara per timme, 14:38.28, eller alla per kvart, 14:15:38.28",
+    "All the lines shall be per hour, 14:38.28, or all per quarter, 14:15:38.28"]
 
     ui_text["th5b"] = \
     ["Det ska vara minst 1 rad i filen.",
@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# This program is kind of experimental. It replays saved hourly_rate_yyyymmdd.txt files to help
+# choosing hourly_rate_decrease_hours and hourly_rate_only_decrease_when_rate_above.
+# All days are evaluated at once by pgart_calc_hourly_rate_batch_func.py. Requires numpy.
+
+# One directory per el_area, like: var/local/SE3,var/local/SE4. Default is var/local.
+# Or the days of the price store, one el_area per zone: -z SE3,SE4. See pgart_compact_prices.py.
+
+import getopt, sys
+import glob
+import os
+
+from datetime import datetime
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_read_control_params_func as f7
+import pgart_lang_func as f8
+import pgart_price_store_func as f14
+
+try:
+    import pgart_calc_hourly_rate_batch_func as f4b
+except ImportError:
+    print("pgart_experimental_backtest_hourly_rates.py requires numpy. apt install python3-numpy")
+    exit()
+
+g_lang = f8.get_language()
+g_ui_text = f1.ui_texts(g_lang)
+te = f1.get_pgart_env()
+
+
+def get_args() :
+    argv = sys.argv[1:]     # Bypass my own name
+    options = "f:t:d:z:r:a:"
+    long_options = ["fromymd=", "toymd=", "dirs=", "zones=", "ranges=", "above="]
+
+    ret_stat, general_pars, weekday_indoor_temp_hours = f7.get_parameters()
+    if ret_stat != "ok" :
+        print(ret_stat)
+        exit()
+
+    dt_from = "19700101"      # Whatever there is around
+    dt_to = "20371231"
+    dirs = te["g_local_dir"]
+    zones = ""
+    ranges = general_pars["hourly_rate_decrease_hours"]
+    above = general_pars["hourly_rate_only_decrease_when_rate_above"]
+    try:
+        args, values = getopt.getopt(argv, options, long_options)
+        for arg, val in args :
+            if arg in ("-f", "--fromymd") :
+                dt_from = val
+            elif arg in ("-t", "--toymd") :
+                dt_to = val
+            elif arg in ("-d", "--dirs") :
+                dirs = val
+            elif arg in ("-z", "--zones") :
+                zones = val
+            elif arg in ("-r", "--ranges") :
+                ranges = val
+            elif arg in ("-a", "--above") :
+                above = val
+    except getopt.error as err :
+        print(str(err))
+        print("usage: pgart_experimental_backtest_hourly_rates.py -f <yyyymmdd> -t <yyyymmdd> -d <dir,dir...> -z <zone,zone...> -r <8-14,19-22> -a <1.50,2.00...>")
+        exit()
+
+    decr_range = {}
+    for x in "".join(ranges.split()).split(',') :
+        buf = x.split('-')
+        decr_range.update({int(buf[0]): int(buf[1])})
+
+    rates_above = "".join(str(above).split()).split(',')
+    if zones != "" :
+        return(dt_from, dt_to, [], zones.split(','), decr_range, rates_above, general_pars)
+
+    return(dt_from, dt_to, dirs.split(','), [], decr_range, rates_above, general_pars)
+
+
+def find_files_hourly_rate(dir, dt_from, dt_to) :
+    fi_hourly_rates = []
+    for fi in glob.glob(dir+"/hourly_rate_"+'*'+".txt") :
+        fi_dt = os.path.basename(fi).split("_")[2].split(".")[0]
+        if fi_dt >= dt_from and fi_dt <= dt_to :
+            fi_hourly_rates.append(fi)
+
+    fi_hourly_rates.sort()
+    return(fi_hourly_rates)
+
+
+def get_days_from_files(dir, dt_from, dt_to) :
+    # [(yyyymmdd, {hour: price})]
+    days = []
+    for fi in find_files_hourly_rate(dir, dt_from, dt_to) :
+        days.append((os.path.basename(fi).split("_")[2].split(".")[0], f0.get_hourly_rates(fi)))
+
+    return(days)
+
+
+def get_days_from_store(zone, dt_from, dt_to) :
+    return(f14.get_days_rates(zone, datetime.strptime(dt_from, "%Y%m%d"), datetime.strptime(dt_to, "%Y%m%d")))
+
+
+def print_backtest(source, results, rates_above) :
+    print("\n"+source)
+    for (start_hr, stop_hr), (days_used, top_schedules, top_prices, avoided) in results.items() :
+        w = stop_hr - start_hr
+        print("range: "+str(start_hr)+"-"+str(stop_hr)+" days: "+str(len(days_used)))
+        line = "{:8s} {:{w}s} {:>9s}".format("date", "plan", "price", w=w)
+        for rate_above in rates_above :
+            line += " {:>9s}".format(">"+rate_above)
+        print(line)
+
+        for i in range(len(days_used)) :
+            plan = "".join(str(s) for s in top_schedules[i])
+            line = "{:8s} {:{w}s} {:>9.2f}".format(days_used[i], plan, top_prices[i], w=w)
+            for rate_above in rates_above :
+                line += " {:>9.2f}".format(avoided[rate_above][i])
+            print(line)
+
+        line = "{:8s} {:{w}s} {:>9.2f}".format("sum", "", top_prices.sum(), w=w)
+        for rate_above in rates_above :
+            line += " {:>9.2f}".format(avoided[rate_above].sum())
+        print(line)
+
+
+dt_from, dt_to, dirs, zones, decr_range, rates_above, general_pars = get_args()
+sources = [(dir, get_days_from_files(dir, dt_from, dt_to)) for dir in dirs]
+sources += [("price_store: "+zone, get_days_from_store(zone, dt_from, dt_to)) for zone in zones]
+for source, days in sources :
+    results = f4b.evaluate_decrease_plans(
+                                          days, decr_range,
+                                          general_pars["hourly_rate_only_decrease_for_this_nr_consecutive_hours"],
+                                          general_pars["hourly_rate_min_halt_after_decrease"],
+                                          rates_above)
+    print_backtest(source, results, rates_above)
+
+exit()
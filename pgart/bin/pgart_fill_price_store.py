@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# Fetches the day-ahead prices of a range of days from the ENTSO-E REST API into the price store, var/price_store/<zone>.bin.
+# One request per zone for the whole range. Needs the security token in etc/pgart_entsoe_api.conf.
+#   pgart_fill_price_store.py                                     today and tomorrow of el_area.
+#   pgart_fill_price_store.py -z SE3,SE4 -f 20250101 -t 20251231  a year of two zones, e.g. for pgart_experimental_backtest_hourly_rates.py -z.
+#   pgart_fill_price_store.py -l 1                                the exchange in var/log/requests, without the token.
+
+import getopt, sys
+
+from datetime import datetime,timedelta
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_read_control_params_func as f7
+import pgart_entsoe_api_func as f16
+
+te = f1.get_pgart_env()
+
+
+def get_args() :
+    argv = sys.argv[1:]     # Bypass my own name
+    options = "z:f:t:l:"
+    long_options = ["zones=", "from=", "to=", "logreq="]
+
+    ret_stat, general_pars, weekday_indoor_temp_hours = f7.get_parameters()
+    if ret_stat != "ok" :
+        print(ret_stat)
+        exit()
+
+    zones = [general_pars['el_area']]
+    day_from = datetime.now()
+    day_to = day_from + timedelta(1)
+    logreq = 0
+    try:
+        args, values = getopt.getopt(argv, options, long_options)
+        for arg, val in args :
+            if arg in ("-z", "--zones") :
+                zones = val.split(",")
+            elif arg in ("-f", "--from") :
+                day_from = datetime.strptime(val, "%Y%m%d")
+            elif arg in ("-t", "--to") :
+                day_to = datetime.strptime(val, "%Y%m%d")
+            elif arg in ("-l", "--logreq") :
+                logreq = int(val)
+    except (getopt.error, ValueError) as err :
+        print(str(err))
+        print("usage: pgart_fill_price_store.py -z <zone,zone...> -f <yyyymmdd> -t <yyyymmdd> -l <0|1>")
+        exit()
+
+    for zone in zones :
+        if zone not in f16.eic_codes :
+            print("unknown zone: "+zone+". "+", ".join(f16.eic_codes.keys()))
+            exit()
+
+    if not f16.is_api_configured() :
+        print("security_token missing: "+te["fi_entsoe_api"])
+        exit()
+
+    return(zones, day_from, day_to, logreq)
+
+
+zones, day_from, day_to, logreq = get_args()
+result = f16.fetch_range(zones, day_from, day_to, logreq, 2000)
+print("pgart_fill_price_store: "+datetime.strftime(day_from, "%Y%m%d")+"-"+datetime.strftime(day_to, "%Y%m%d"))
+for zone, (status, nr, info) in result.items() :
+    print("\t"+zone+" slots:"+str(nr)+" "+info)
+
+exit()
@@ -22,27 +22,32 @@ from datetime import date,datetime,timedelta
 import pgart_misc_func as f0
 import pgart_env_func as f1
 import pgart_lang_func as f8
+import pgart_http_func as f13
 
 te = f1.get_pgart_env()
 
+fetches_tomorrow = True     # Published at about 13:00.
 
-def save_hr_rate(json_justnu) :
-    f = open(te["fi_hourly_rate"], "w", encoding="utf8")
+
+def get_hr_rate_recs(json_justnu) :
+    # 24 entries per day, or 96 since the market went to 15 minutes.
+    slots = []
     for hr_rt in json_justnu:
         #{'SEK_per_kWh': 0.82607, 'EUR_per_kWh': 0.07291, 'EXR': 11.330006, 'time_start': '2023-03-15T23:00:00+01:00', 'time_end': '2023-03-16T00:00:00+01:00'}
         rate = hr_rt['SEK_per_kWh']
         rate = round(rate*100, 2)       # öre
-        ix = hr_rt['time_start'].find("T")      # 2023-03-15T23:00:00+01:00
-        h = hr_rt['time_start'][ix+1] + hr_rt['time_start'][ix+2]
-        f.write(h+":"+str(rate)+"\n")
+        ix = hr_rt['time_start'].find("T")      # 2023-03-15T23:15:00+01:00
+        slots.append((int(hr_rt['time_start'][ix+1:ix+3]), int(hr_rt['time_start'][ix+4:ix+6]), rate))
 
-    f.close()
-    return(True)
+    return(f0.get_hourly_rate_recs(slots))
 
 
-def create_hourly_rates_justnu(el_area, logreq, max_log_len):
+def create_hourly_rates_justnu(el_area, logreq, max_log_len, day=None):
     # "https://www.elprisetjustnu.se/api/v1/prices/2023/03-15_SE4.json"
-    dt = datetime.strftime(datetime.now(), "%Y/%m-%d")
+    if day is None :
+        day = datetime.now()
+
+    dt = datetime.strftime(day, "%Y/%m-%d")
     area_nr = f1.exit_if_el_area_missing("se", el_area)
 
     url_justnu = "https://www.elprisetjustnu.se/api/v1/prices/"+dt+"_"+el_area+".json"
@@ -50,43 +55,38 @@ def create_hourly_rates_justnu(el_area, logreq, max_log_len):
     json_justnu = ""
 
     try:
-        response = requests.get(url_justnu)
-    except requests.exceptions.ConnectionError:
+        response = f13.get(url_justnu, cache=True)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         info ="create_hourly_rates_justnu:\n\t"+g_ui_text["t29c"]
         f0.log_action(info, False)
-        return(False)
+        return(False, [])
 
     f0.log_request("requests_get", response, logreq, max_log_len)
 
     if response.status_code != 200 :
         info = "create_hourly_rates_justnu:\n\t"+g_ui_text["t30e"]+" response:"+str(response.status_code)
         f0.log_action(info, False)
-        return(False)
+        return(False, [])
 
     json_justnu = json.loads(response.content)
 
-    save_hr_rate(json_justnu)
-    return(True)
+    return(True, get_hr_rate_recs(json_justnu))
+
+
+def fetch(el_area, logreq, max_log_len, day=None) :
+    # Called by pgart_misc_func.exec_plugin_pgm(). Returns (status, the lines of the hourly rate file). day: a prefetch.
+    return(create_hourly_rates_justnu(el_area, logreq, max_log_len, day))
 
 
 g_lang = f8.get_language()
 g_ui_text = f1.ui_texts(g_lang)
-max_nr_get_request_trials = 2
 
-el_area, logreq, max_log_len = f0.get_args_fi_cre_hourly_rates("pgart_get_hourly_rates_herrforsnat_fi.py")
-print(el_area, logreq, max_log_len)
+if __name__ == "__main__" :
+    el_area, logreq, max_log_len = f0.get_args_fi_cre_hourly_rates("pgart_get_hourly_rates_elprisetjustnu_se.py")
+    print(el_area, logreq, max_log_len)
 
-nr_trials = 1
-more = True
-while more :
-    if create_hourly_rates_justnu(el_area, logreq, max_log_len) :
+    status, recs = f0.run_plugin_fetch("hourly_rates", fetch, (el_area, logreq, max_log_len))
+    if status :
         f0.print_hourly_rates()
-        sys.stdout.flush()
-        exit()
     else :
-        if nr_trials == max_nr_get_request_trials :
-            print("-ok")
-            exit()
-        time.sleep(55)       # Try once more after a while.
-
-    nr_trials += 1
+        print("-ok")
@@ -6,6 +6,7 @@
 # pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
 
 # This program retrieves the hourly prices from transparency.entsoe.eu
+# With a security token in etc/pgart_entsoe_api.conf from the REST API, see pgart_entsoe_api_func.py. Else from the web page.
 # "home"/pgart/var/local/hourly_rate_yyyymmdd.txt
 
 import sys
@@ -21,16 +22,24 @@ from datetime import date,datetime,timedelta
 import pgart_misc_func as f0
 import pgart_env_func as f1
 import pgart_lang_func as f8
+import pgart_http_func as f13
+import pgart_html_func as f15
+import pgart_price_store_func as f14
+import pgart_entsoe_api_func as f16
 
 g_lang = f8.get_language()
 g_ui_text = f1.ui_texts(g_lang)
 te = f1.get_pgart_env()
 
+fetches_tomorrow = True     # Published at about 13:00 CET.
+
 # transparency.entsoe.eu URLs for the Bidding Zones in the Nordic and Baltic countries.
 url_start = "https://transparency.entsoe.eu/transmission-domain/r2/dayAheadPrices/show?name=&defaultValue=false&viewType=TABLE&areaType=BZN&atch=false&dateTime.dateTime="
 url_timezone = {}
 url_biddingZone = {}
 url_timezone_long = {}
+page_steps = [("tag", "div", "id", "dv-data-table"), ("tag", "tbody", None, None)]     # The table of pgart_html_func.
+url_resolutions = ["PT15M", "PT60M"]    # The day-ahead market is per quarter from 2025-10-01. The hours before that.
 
 """
 -------------------------------------------------------------------------------------------------
@@ -185,28 +194,71 @@ url_biddingZone["LT"] = "CTY|10YLT-1001A0008Q!BZN|10YLT-1001A0008Q&resolution.va
 url_timezone_long["LT"] = "dateTime.timezone=EET_EEST&dateTime.timezone_input=EET+(UTC+2)+/+EEST+(UTC+3)"
 
 
-def create_hourly_rates_entsoe(el_area, logreq, max_log_len):
-    dt = datetime.strftime(datetime.now(), "%d.%m.%Y")
-    url_entsoe  = url_start \
-                  + str(dt) + "+00:00|" \
-                  + url_timezone[el_area] \
-                  + "|DAY&biddingZone.values=" + url_biddingZone[el_area]  \
-                  + url_timezone_long[el_area]
+def get_url_entsoe(el_area, day, resolution) :
+    dt = datetime.strftime(day, "%d.%m.%Y")
+    return(url_start
+           + str(dt) + "+00:00|"
+           + url_timezone[el_area]
+           + "|DAY&biddingZone.values=" + url_biddingZone[el_area].replace("PT60M", resolution)
+           + url_timezone_long[el_area])
 
-    print(url_entsoe)
-    try:
-        request = requests.get(url_entsoe)
-    except requests.exceptions.ConnectionError:
-        info ="create_hourly_rates_entsoe:\n\t"+g_ui_text["t29"]
+
+def create_hourly_rates_entsoe(el_area, logreq, max_log_len, day=None):
+    # Per quarter if the day has it, else per hour.
+    if day is None :
+        day = datetime.now()
+
+    if f16.is_api_configured() :
+        return(create_hourly_rates_entsoe_api(el_area, logreq, max_log_len, day))
+
+    for resolution in url_resolutions :
+        status, recs = create_hourly_rates_entsoe_resolution(el_area, logreq, max_log_len, day, resolution)
+        if not status or len(recs) > 0 :
+            break
+
+    if status and len(recs) == 0 :
+        info = "create_hourly_rates_entsoe:\n\t"+g_ui_text["t30f"]
         f0.log_action(info, False)
-        return(False)
+        return(False, [])
 
-    f0.log_request("requests_get", request, logreq, max_log_len)
+    return(status, recs)
 
-    if request.status_code != 200 :
-        info = "create_hourly_rates_entsoe:\n\t"+g_ui_text["t30f"]+" response:"+str(request.status_code)
+
+def create_hourly_rates_entsoe_api(el_area, logreq, max_log_len, day) :
+    # The day from the API goes into the price store. The lines of the file are read back from it.
+    status, nr, info = f16.fetch_range([el_area], day, day, logreq, max_log_len)[el_area]
+    if not status :
+        f0.log_action("create_hourly_rates_entsoe:\n\t"+info, False)
+        return(False, [])
+
+    slots = f14.get_day_slots(el_area, day)
+    if slots is None :
+        info = "create_hourly_rates_entsoe:\n\t"+g_ui_text["t30j"]+" slots:"+str(nr)
         f0.log_action(info, False)
-        return(False)
+        return(False, [])
+
+    return(True, f0.get_hourly_rate_recs(slots))
+
+
+def get_slots_from_rows(rows) :
+    # The rows of the table => [(hour, minute, price)].
+    # [("00:00 - 01:00", {..}), ("59.83", {..})]. The price is "-" or missing in a resolution the day does not have.
+    slots = []
+    for row in rows :
+        if len(row) < 2 or not f0.is_float(row[1][0]) :
+            continue
+
+        hour, minute = f0.get_slot_label(row[0][0])
+        rate = round(float(row[1][0])/10, 3)    # MWh -> kWh  /1000  Euro -> cent *100
+        slots.append((hour, minute, rate))
+
+    return(slots)
+
+
+def create_hourly_rates_entsoe_resolution(el_area, logreq, max_log_len, day, resolution):
+    # Returns (True, []) when the table has no prices in this resolution.
+    url_entsoe = get_url_entsoe(el_area, day, resolution)
+    print(url_entsoe)
 
     """
     <div id="dv-data-table" class="table-container">
@@ -218,76 +270,46 @@ def create_hourly_rates_entsoe(el_area, logreq, max_log_len):
                     <td class="dv-value-cell"><span onclick="showDetail('eu.entsoe.emfip.transmission_domain.r2.presentation.entity.DayAheadPricesMongoEntity', '640f10df623a7286783ce949', '2023-03-14T23:00:00.000Z', 'PRICE', 'CET');" class="data-view-detail-link">59.83</span></td>
 
                 </tr>
-
-                <tr>
-                    <td rowspan="1" class="first">01:00 - 02:00</td>
-
-                    <td class="dv-value-cell"><span onclick="showDetail('eu.entsoe.emfip.transmission_domain.r2.presentation.entity.DayAheadPricesMongoEntity', '6410626168dcf1a5565e4f78', '2023-03-15T00:00:00.000Z', 'PRICE', 'CET');" class="data-view-detail-link">56.95</span></td>
-
-                </tr>
         </tbody>
+    The page is read until </tbody>.
     """
+    try:
+        request, chunks = f13.get_stream(url_entsoe, cache=True)
+        rows, found = ([], False)
+        if request.status_code == 200 :
+            rows, found = f15.get_rows(request, chunks, page_steps)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError):
+        info ="create_hourly_rates_entsoe:\n\t"+g_ui_text["t29"]
+        f0.log_action(info, False)
+        return(False, [])
 
-    # "dv-data-table".
-    if request.text.find("dv-data-table") == -1 :
-        info = "create_hourly_rates_entsoe:\n\t"+g_ui_text["t30f"]
+    f0.log_request("requests_get", request, logreq, max_log_len)
+
+    if request.status_code != 200 :
+        request.close()
+        info = "create_hourly_rates_entsoe:\n\t"+g_ui_text["t30f"]+" response:"+str(request.status_code)
         f0.log_action(info, False)
-        return(False)
-
-    t_from = 'dv-data-table'
-    t_to = "</tbody>"
-    start_of_table = request.text.split(t_from, 1)[1]
-    start_of_table = start_of_table.split("<tbody>")[1]
-    the_table = start_of_table.split(t_to)[0]
-    the_table = the_table.replace('<tr>', '')
-    the_table = the_table.replace('\t', '')
-    the_table = the_table.replace('\n', '')
-    the_table = the_table.replace(' ', '')
-
-    t_rows = the_table.split('</tr>')
-    #print(t_rows)
-    f = open(te["fi_hourly_rate"], "w", encoding="utf8")
-    i=0
-    for tr in t_rows :
-        """
-        ><td rowspan="1" class="first">00:00 - 01:00</td>
-        <td class="dv-value-cell"><span onclick="showDetail('eu.entsoe.emfip.transmission_domain.r2.presentation.entity.DayAheadPricesMongoEntity',
-        '6410626168dcf1a5565e4f78', '2023-03-15T23:00:00.000Z', 'PRICE', 'CET');" class="data-view-detail-link">32.98</span></td>
-        """
-        if len(tr) == 0 :
-            continue
+        return(False, [])
 
-        #ix = tr.find("T")      # 2023-03-15T23:00:00+01:00  'CET'
-        #h = tr[ix+1] + tr[ix+2]
+    if not found :      # No "dv-data-table".
+        info = "create_hourly_rates_entsoe:\n\t"+g_ui_text["t30f"]
+        f0.log_action(info, False)
+        return(False, [])
 
-        #<td rowspan="1" class="first">00:00 - 01:00</td>
-        s = tr.split('"first">')[1]
-        h = s.split(':')[0]
+    return(True, f0.get_hourly_rate_recs(get_slots_from_rows(rows)))
 
-        s = tr.split('class="data-view-detail-link">')[1]
-        rate = s.split('</span>')[0]
-        rate = round(float(rate)/10, 3)    # MWh -> kWh  /1000  Euro -> cent *100
-        f.write(h+":"+str(rate)+"\n")
 
-    f.close()
-    return(True)
+def fetch(el_area, logreq, max_log_len, day=None) :
+    # Called by pgart_misc_func.exec_plugin_pgm(). Returns (status, the lines of the hourly rate file). day: a prefetch.
+    return(create_hourly_rates_entsoe(el_area, logreq, max_log_len, day))
 
 
-el_area, logreq, max_log_len = f0.get_args_fi_cre_hourly_rates("pgart_get_hourly_rates_entsoe_eu.py")
-print(el_area, logreq, max_log_len)
+if __name__ == "__main__" :
+    el_area, logreq, max_log_len = f0.get_args_fi_cre_hourly_rates("pgart_get_hourly_rates_entsoe_eu.py")
+    print(el_area, logreq, max_log_len)
 
-nr_trials = 1
-more = True
-while more :
-    if create_hourly_rates_entsoe(el_area, logreq, max_log_len) :
+    status, recs = f0.run_plugin_fetch("hourly_rates", fetch, (el_area, logreq, max_log_len))
+    if status :
         f0.print_hourly_rates()
-        sys.stdout.flush()
-        exit()
     else :
-        if nr_trials == max_nr_get_request_trials :
-            print("-ok")
-            exit()
-        time.sleep(55)       # Try once more after a while.
-
-    nr_trials += 1
-
+        print("-ok")
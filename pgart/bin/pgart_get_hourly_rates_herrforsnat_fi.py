@@ -20,26 +20,34 @@ from pathlib import Path
 import pgart_misc_func as f0
 import pgart_env_func as f1
 import pgart_lang_func as f8
+import pgart_http_func as f13
+import pgart_html_func as f15
 
 te = f1.get_pgart_env()
 
-def create_hourly_rates_herrforsnat(el_area, logreq, max_log_len):
-    area_nr = f1.exit_if_el_area_missing("fi", el_area)
-    url_herrforsnat  = f1.get_url_herrforsnat()
+fetches_tomorrow = False    # The page is parsed from "PRIS Idag". Not prefetched.
+page_steps = [("tag", None, None, "today-spotprices-chart"), ("text", "PRIS Idag")]     # The list of pgart_html_func.
 
-    try:
-        request = requests.get(url_herrforsnat)
-    except requests.exceptions.ConnectionError:
-        info ="create_hourly_rates_herrforsnat:\n\t"+g_ui_text["t29"]
-        f0.log_action(info, False)
-        return(False)
 
-    f0.log_request("requests_get", request, logreq, max_log_len)
+def is_end_of_list(row) :
+    return(len(row) == 0)       # <li></li>
 
-    if request.status_code != 200 :
-        info = "create_hourly_rates_herrforsnat:\n\t"+g_ui_text["t30"]+" response:"+str(request.status_code)
-        f0.log_action(info, False)
-        return(False)
+def get_slots_from_rows(rows) :
+    # The rows of the list => [(hour, minute, price)]. [("00 - 01", {}), ("2.22", {})], or 00:15 - 00:30 per quarter.
+    slots = []
+    for row in rows :
+        if len(row) < 2 :
+            continue
+
+        hour, minute = f0.get_slot_label(row[0][0])
+        slots.append((hour, minute, row[1][0]))
+
+    return(slots)
+
+
+def create_hourly_rates_herrforsnat(el_area, logreq, max_log_len):
+    area_nr = f1.exit_if_el_area_missing("fi", el_area)
+    url_herrforsnat  = f1.get_url_herrforsnat()
 
     """
                <span class="text-uppercase">
@@ -54,69 +62,49 @@ def create_hourly_rates_herrforsnat(el_area, logreq, max_log_len):
                                     </pricedata>
                                 </span>
                 </li>
-                <li>
-                    <span>01 - 02</span>
-                    <span>
-                                    <pricedata class="today s-price" data-price="2.75">
-                                        2.75
-                                    </pricedata>
-                                </span>
-                </li>
             <li></li>
+    From "PRIS Idag" after "today-spotprices-chart". The page is read until the empty <li></li>.
     """
+    try:
+        request, chunks = f13.get_stream(url_herrforsnat, cache=True)
+        rows, found = ([], False)
+        if request.status_code == 200 :
+            rows, found = f15.get_rows(request, chunks, page_steps, ("li",), ("span",), is_end_of_list)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError):
+        info ="create_hourly_rates_herrforsnat:\n\t"+g_ui_text["t29"]
+        f0.log_action(info, False)
+        return(False, [])
+
+    f0.log_request("requests_get", request, logreq, max_log_len)
 
-    # From "PRIS Idag".
-    if request.text.find("PRIS Idag") == -1 :
+    if request.status_code != 200 :
+        request.close()
+        info = "create_hourly_rates_herrforsnat:\n\t"+g_ui_text["t30"]+" response:"+str(request.status_code)
+        f0.log_action(info, False)
+        return(False, [])
+
+    if len(rows) == 0 :     # No "PRIS Idag".
         info = "create_hourly_rates_herrforsnat:\n\t"+g_ui_text["t30c"]
         f0.log_action(info, False)
-        return(False)
-
-    start_hour_price_table = request.text.split('today-spotprices-chart', 1)[1]
-    start_hour_price_table = start_hour_price_table.split('PRIS Idag', 1)[1]
-    s = start_hour_price_table.split("<li></li>", 1)[0]
-    s = s.replace("<span>", "")
-    s1 = s.replace("<li>", "")
-    s2 = s1.split("</li>")
-
-    #              01 - 02</span>
-    #                                <pricedata class="today s-price" data-price="2.75">
-    #                                    2.75
-    #                                </pricedata>
-    #                           </span>
-
-    f = open(te["fi_hourly_rate"], "w", encoding="utf8")
-    i = 1      # Bypass the first line
-    while i < len(s2)-1 :
-        s3 = s2[i].split("</span>", 1)[0]
-        # 00 - 01
-        h = s3.split("-")[0].strip()         # Get the hour
-        s4 = s2[i].split("</pricedata>")[0]
-        rate = s4.split('">')[1].strip()
-        f.write(h+":"+rate+"\n")
-        i += 1
-
-    f.close()
-    return(True)
+        return(False, [])
+
+    return(True, f0.get_hourly_rate_recs(get_slots_from_rows(rows)))
+
+
+def fetch(el_area, logreq, max_log_len) :
+    # Called by pgart_misc_func.exec_plugin_pgm(). Returns (status, the lines of the hourly rate file).
+    return(create_hourly_rates_herrforsnat(el_area, logreq, max_log_len))
 
 
 g_lang = f8.get_language()
 g_ui_text = f1.ui_texts(g_lang)
-max_nr_get_request_trials = 2
 
-el_area, logreq, max_log_len = f0.get_args_fi_cre_hourly_rates("pgart_get_hourly_rates_herrforsnat_fi.py")
-print(el_area, logreq, max_log_len)
+if __name__ == "__main__" :
+    el_area, logreq, max_log_len = f0.get_args_fi_cre_hourly_rates("pgart_get_hourly_rates_herrforsnat_fi.py")
+    print(el_area, logreq, max_log_len)
 
-nr_trials = 1
-more = True
-while more :
-    if create_hourly_rates_herrforsnat(el_area, logreq, max_log_len) :
+    status, recs = f0.run_plugin_fetch("hourly_rates", fetch, (el_area, logreq, max_log_len))
+    if status :
         f0.print_hourly_rates()
-        sys.stdout.flush()
-        exit()
     else :
-        if nr_trials == max_nr_get_request_trials :
-            print("-ok")
-            exit()
-        time.sleep(55)       # Try once more after a while.
-
-    nr_trials += 1
+        print("-ok")
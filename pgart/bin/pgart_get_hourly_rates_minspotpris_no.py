@@ -22,26 +22,41 @@ from datetime import date,datetime,timedelta
 import pgart_misc_func as f0
 import pgart_env_func as f1
 import pgart_lang_func as f8
+import pgart_http_func as f13
+import pgart_html_func as f15
 
 te = f1.get_pgart_env()
 
-def create_hourly_rates_minspotpris(el_area, logreq, max_log_len) :
-    area_nr = f1.exit_if_el_area_missing("no", el_area)
-    url_minspotpris  = f1.get_url_minspotpris()
+fetches_tomorrow = True     # The page shows tomorrow in the afternoon.
+page_steps = [("tag", "table", "id", "eksAvgtd")]      # The table of pgart_html_func.
 
-    try:
-        request = requests.get(url_minspotpris)
-    except requests.exceptions.ConnectionError:
-        info ="create_monthly_and_hourly_rates_minspotpris:\n\t"+g_ui_text["t29a"]
-        f0.log_action(info, False)
-        return(False)
+def is_end_of_table(row) :
+    # This <tr><td colspan= is always there, just after the one or two days table.
+    return(any("colspan" in attrs for text, attrs in row))
 
-    f0.log_request("requests_get", request, logreq, max_log_len)
 
-    if request.status_code != 200 :
-        info = "create_monthly_and_hourly_rates_minspotpris:\n\t"+g_ui_text["t30a"]+" response:"+str(request.status_code)
-        f0.log_action(info, False)
-        return(False)
+def get_slots_from_rows(rows, dt, area_nr) :
+    # The rows of the table => ([(hour, minute, price)], True when the day dt (dd/mm/yyyy) was there).
+    # [("19/03/2023", {}), ("Øst", {})...] starts a day. [("14 - 15", {}), ("131.749", {"title": "105.399"})...] an hour.
+    slots = []
+    found = False
+    for row in rows :
+        if row[0][0].find("/") > -1 :
+            if found :
+                break       # Tomorrow is already loaded.
+            found = row[0][0] == dt
+            continue
+
+        if found and len(row) > area_nr + 1 :
+            hour, minute = f0.get_slot_label(row[0][0])
+            slots.append((hour, minute, row[area_nr + 1][1].get("title")))      # Use the raw "title" price 114.935.
+
+    return(slots, found)
+
+
+def create_hourly_rates_minspotpris(el_area, logreq, max_log_len, day=None) :
+    area_nr = f1.exit_if_el_area_missing("no", el_area)
+    url_minspotpris  = f1.get_url_minspotpris()
 
     """
     <div id="utenavgifter"><br>
@@ -62,88 +77,51 @@ def create_hourly_rates_minspotpris(el_area, logreq, max_log_len) :
     The second "tdhighligth" is not presented in the morning.
     <tr class="tdhighligth"><td>20/03/2023</td><td>Øst</td><td>Sør</td><td>Vest</td><td>Midt</td><td>Nord</td></tr><tr class="white"><td class="w20 b">00 - 01</td><td clas
 
-    This <tr><td colspan= is always there.
+    This <tr><td colspan= is always there. The page is read until it.
     """
+    try:
+        request, chunks = f13.get_stream(url_minspotpris, cache=True)
+        rows, found = ([], False)
+        if request.status_code == 200 :
+            rows, found = f15.get_rows(request, chunks, page_steps, stop=is_end_of_table)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError):
+        info ="create_monthly_and_hourly_rates_minspotpris:\n\t"+g_ui_text["t29a"]
+        f0.log_action(info, False)
+        return(False, [])
 
-    # From 20/03/2023 0 -> 23
-    # <table id="eksAvgtd" class="liste timereg"><tr class="tdhighligth"><td>
-    start_hour_price_table = request.text.split('<table id="eksAvgtd"', 1)[1]
+    f0.log_request("requests_get", request, logreq, max_log_len)
+
+    if request.status_code != 200 :
+        request.close()
+        info = "create_monthly_and_hourly_rates_minspotpris:\n\t"+g_ui_text["t30a"]+" response:"+str(request.status_code)
+        f0.log_action(info, False)
+        return(False, [])
 
     # Find today. <tr class="tdhighligth"><td>20/03/2023</td><td>Øst</td><td>Sør</td><td>Vest</td><td>Midt</td><td>Nord</td></tr>
-    dt_now = datetime.strftime(datetime.now(), "%d/%m/%Y")
-    date_search = '<tr class="tdhighligth"><td>'+dt_now+"</td>"
-    if start_hour_price_table.find(date_search) == -1 :
+    dt_now = datetime.strftime(datetime.now() if day is None else day, "%d/%m/%Y")
+    slots, found = get_slots_from_rows(rows, dt_now, area_nr)
+    if not found :
         info ="create_monthly_and_hourly_rates_minspotpris:\n\t"+g_ui_text["t30a"]+" Missing date:"+dt_now
-        f0.log_action(info, True)
-
-    start_hour_price_table = start_hour_price_table.split(date_search, 1)[1]
-    the_table = start_hour_price_table.split("<td colspan=")[0]   # Just after the one or two days table.
-
-    if the_table.find('<tr class="tdhighligth"><td>') > -1 :
-        # Tomorrow is already loaded. The entries for today might be missing the start hours
-        the_table = the_table.split('<tr class="tdhighligth"><td>')[0]
-
-    #<td>Øst</td><td>Sør</td><td>Vest</td><td>Midt</td><td>Nord</td></tr><tr class="gray"><tr class="white"><td class="w20 b">00 - 01</td><td class="r red" title="114.935">143.669</td><td class="r red" title="114.935">143.669</td>...</tr>
-    cols = the_table.split("</tr>")
-
-    f = open(te["fi_hourly_rate"], "w", encoding="utf8")
+        f0.log_action(info, day is None)        # A prefetch is made again later.
+        return(False, [])
 
-    i = 1       # Bypass the header line
-    more = True
-    while more :
-        # col == <tr class="gray"><tr class="white"><td class="w20 b">00 - 01</td><td class="r red" title="114.935">143.669</td><td class="r red" title="114.935">143.669</td>...</tr>  Up until the last hour.
-        col_part2 = cols[i].split('<td class="w20 b">')[1]
+    return(True, f0.get_hourly_rate_recs(slots))
 
-        # 00 - 01</td><td class="r red" title="114.935">143.669</td><td class="r red" title="114.935">143.669</td>
-        s4 = col_part2.split("</td>", 1)
 
-        # 00 - 01
-        h = s4[0].split("-")[0].strip()         # Get the hour
+def fetch(el_area, logreq, max_log_len, day=None) :
+    # Called by pgart_misc_func.exec_plugin_pgm(). Returns (status, the lines of the hourly rate file). day: a prefetch.
+    return(create_hourly_rates_minspotpris(el_area, logreq, max_log_len, day))
 
-        #<td class="r red" title="114.935">143.669</td><td class="r red" title="114.935">143.669</td>
-        s5 = s4[1].split("</td>")
 
-        """
-        # <td class="r red" title="114.935">143.669   # Use the price with added costs 143.669.
-        rate = s5[area_nr].split(">")[1]
-        """
-
-        #<td class="r red" title="114.935">143.669
-        rtmp = s5[area_nr].split('title="')[1]      # Use the raw "title" price 114.935.
-
-        # 114.935">143.669
-        rate = rtmp.split('"')[0]
-
-        f.write(h+":"+rate+"\n")
-
-        i += 1
-        if h == "23" :
-            more = False
-
-        if i == 25 :   # Avoid an infinite loop.
-            more = False
-
-    f.close()
-    return(True)
-
-
-max_nr_get_request_trials = 2
 g_lang = f8.get_language()
 g_ui_text = f1.ui_texts(g_lang)
 
-el_area, logreq, max_log_len = f0.get_args_fi_cre_hourly_rates("pgart_get_hourly_rates_minspotpris_no.py")
+if __name__ == "__main__" :
+    el_area, logreq, max_log_len = f0.get_args_fi_cre_hourly_rates("pgart_get_hourly_rates_minspotpris_no.py")
+    print(el_area, logreq, max_log_len)
 
-nr_trials = 1
-more = True
-while more :
-    if create_hourly_rates_minspotpris(el_area, logreq, max_log_len) :
+    status, recs = f0.run_plugin_fetch("hourly_rates", fetch, (el_area, logreq, max_log_len))
+    if status :
         f0.print_hourly_rates()
-        sys.stdout.flush()
-        exit()
     else :
-        if nr_trials == max_nr_get_request_trials :
-            print("-ok")
-            exit()
-        time.sleep(55)       # Try once more after a while.
-
-    nr_trials += 1
+        print("-ok")
@@ -20,26 +20,27 @@ import pgart_lang_func as f8
 
 
 base_dir = '/sys/bus/w1/devices/'
-device_folder = glob.glob(base_dir + '28*')[0]
-device_file = device_folder + '/w1_slave'
 
 log = 1  #0=zero, 1=all
 
 te = f1.get_pgart_env()
 
-def list_env() :
-    print(base_dir)
-    print(device_folder)
-    print(device_file)
 
+def get_device_file() :
+    # Looked up when read. Importing this module on a computer without the sensor is ok.
+    device_folders = glob.glob(base_dir + '28*')
+    if len(device_folders) == 0 :
+        return("")
 
-def log_temp_reading(txt) :
-    f = open(te["fi_indoor_temp_reading"], "w", encoding="utf8")
-    f.write(txt+"\n")
-    f.close()
+    return(device_folders[0] + '/w1_slave')
+
+
+def list_env() :
+    print(base_dir)
+    print(get_device_file())
 
 
-def read_temp_raw():
+def read_temp_raw(device_file):
     f = open(device_file, 'r')
     lines = f.readlines()
     f.close()
@@ -49,9 +50,13 @@ def read_temp_raw():
 def read_temp(log):
     i = 1
     sum_sec = 0
+    device_file = get_device_file()
+    if device_file == "" :
+        return(False, "No DS18B20 device in "+base_dir, "", 0)
+
     device_file_not_two_lines = True
     while device_file_not_two_lines :
-        lines = read_temp_raw()
+        lines = read_temp_raw(device_file)
         if len(lines) != 2 :
             if log > 0 :
                 print("Device line 2 missing.")
@@ -86,13 +91,19 @@ def read_temp(log):
 
         time.sleep(0.5)  # Try again later.
         sum_sec += 0.5
+        i += 1
+
+
+def fetch() :
+    # Called by pgart_misc_func.exec_plugin_pgm(). Returns (status, the line of fi_indoor_temp_reading).
+    stat, msg, dt, t = read_temp(log)
+    if not stat :
+        f0.log_action("get_indoor_temp_raspberry_pi:\n\t"+msg, False)
+        return(False, [])
 
+    return(True, [dt+","+str(t)])
 
-list_env()
-stat, msg, dt, t = read_temp(log)
-if stat :
-    log_temp_reading(dt+","+str(t))
-else :
-    log_temp_reading("Error: "+msg)
 
-exit()
+if __name__ == "__main__" :
+    list_env()
+    f0.run_plugin_fetch("temp_reading", fetch, ())
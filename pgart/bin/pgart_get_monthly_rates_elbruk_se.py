@@ -20,83 +20,74 @@ import time
 import pgart_misc_func as f0
 import pgart_env_func as f1
 import pgart_lang_func as f8
+import pgart_http_func as f13
+import pgart_html_func as f15
 
 te = f1.get_pgart_env()
 
+months =['Januari', 'Februari', 'Mars', 'April', 'Maj', 'Juni', 'Juli', 'Augusti', 'September', 'Oktober', 'November', 'December']
+page_steps = [("tag", "table", "class", "data-table mb30"), ("text", "Månad"), ("tag", "tbody", None, None)]   # The table of pgart_html_func.
+
+
+def get_recs_from_rows(rows) :
+    # The rows of the month table => the lines of the monthly rate file.
+    # [("November 2022 *", {}), ("47,33 öre/kWh", {})] => 2022-11:47.33. The preliminary * instead of a final value.
+    recs = []
+    for row in rows :
+        if len(row) < 2 :
+            continue
+
+        my = row[0][0].replace('*', '').split()     # November 2022 => November and 2022
+        r = row[1][0].replace(' öre/kWh', '').replace(",", ".")
+        m = months.index(my[0]) + 1
+        recs.append(my[1]+"-"+"{:02d}".format(m)+":"+r)
+
+    return(recs)
+
 
 def create_monthly_rates_elbruk(el_area, logreq, max_log_len):
     url_elbruk  = f1.get_url_elbruk(el_area)
-    months =['Januari', 'Februari', 'Mars', 'April', 'Maj', 'Juni', 'Juli', 'Augusti', 'September', 'Oktober', 'November', 'December']
+
+    # Månadstabellen
+    # Sedan 2023-02-21. Moms tillkommit och inte &nbsp; längre. Den andra tabellen.
+    #<table class="table data-table mb30"><thead><tr><th>Månad</th>
+    # (SE4)</th></tr></thead><tbody><tr><td>November 2022 *</td><td>47,33 öre/kWh</td></tr> ... </td></tr>
+    # The page is read until its </tbody>.
     try:
-        request = requests.get(url_elbruk)
-    except requests.exceptions.ConnectionError:
+        request, chunks = f13.get_stream(url_elbruk, cache=True)
+        rows, found = ([], False)
+        if request.status_code == 200 :
+            rows, found = f15.get_rows(request, chunks, page_steps)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError):
         info ="create_monthly_rates_elbruk:\n\t"+g_ui_text["t29"]
         f0.log_action(info, False)
-        return(False)
+        return(False, [])
 
     f0.log_request("requests_get", request, logreq, max_log_len)
 
-    if request.status_code != 200 :
+    if request.status_code != 200 or not found :
+        request.close()
         info = "create_monthly_rates_elbruk:\n\t"+g_ui_text["t30"]+" response:"+str(request.status_code)
         f0.log_action(info, False)
-        return(False)
+        return(False, [])
 
-    # Månadstabellen
-    # Sedan 2023-02-21. Moms tillkommit och inte &nbsp; längre. Den andra tabellen.
-    #<table class="table data-table mb30"><thead><tr><th>Månad</th>
+    return(True, get_recs_from_rows(rows))
 
-    t_from = 'data-table mb30"><thead><tr><th>Månad</th>'
-    t_to = "</tbody>"
-    start_of_table = request.text.split(t_from)[1]
-    start_of_table = start_of_table.split(t_to)[0]
 
-    # (SE4)</th></tr></thead><tbody><tr><td>November 2022 *</td><td>47,33 öre/kWh</td></tr> ... </td></tr>
-    the_table = start_of_table.split("<tbody>")[1]
-    the_table = the_table.replace(' öre/kWh', '')
-    the_table = the_table.replace('*', '')         # Use the preliminary instead of a final value.
-
-    t_rows = the_table.split('<tr')     # <tr><td>November 2022</td><td>47,33</td></tr> => ><td>November 2022</td><td>47,33</td></tr>
-    fi = Path(te["fi_monthly_rates"])
-    f = open(te["fi_monthly_rates"], "w", encoding="utf8")
-    for tr in t_rows :
-        if tr == "" :
-            continue;
-
-        tmp_my_r = tr.split('</td><td>')       # ><td>November 2022</td><td>47,33</td></tr> => ><td>November 2022 and 47,33</td></tr>
-        tmp_my = tmp_my_r[0].split('<td>')[1]  # ><td>November 2022 => November 2022
-        my = tmp_my.split(' ')              # November 2022 => November and 2022
-        month = my[0]
-        y = my[1]
-        r = tmp_my_r[1].split('<')[0]          # 47,33</td></tr> => 47,33
-        r = r.replace(",", ".")
-        m = months.index(month) + 1
-        m2dig = "{:02d}"
-        m2 = m2dig.format(m)
-        f.write(y+"-"+m2+":"+r+"\n")
-
-    f.close()
-    return(True)
+def fetch(el_area, logreq, max_log_len) :
+    # Called by pgart_misc_func.exec_plugin_pgm(). Returns (status, the lines of the monthly rate file).
+    return(create_monthly_rates_elbruk(el_area, logreq, max_log_len))
 
 
 g_lang = f8.get_language()
 g_ui_text = f1.ui_texts(g_lang)
-max_nr_get_request_trials = 2
 
-el_area, logreq, max_log_len = f0.get_args_fi_cre_hourly_rates("pgart_get_monthly_rates_elbruk_se.py")
-print(el_area, logreq, max_log_len)
+if __name__ == "__main__" :
+    el_area, logreq, max_log_len = f0.get_args_fi_cre_hourly_rates("pgart_get_monthly_rates_elbruk_se.py")
+    print(el_area, logreq, max_log_len)
 
-nr_trials = 1
-more = True
-while more :
-    if create_monthly_rates_elbruk(el_area, logreq, max_log_len) :
+    status, recs = f0.run_plugin_fetch("monthly_rates", fetch, (el_area, logreq, max_log_len))
+    if status :
         f0.print_monthly_rates()
-        sys.stdout.flush()
-        exit()
     else :
-        if nr_trials == max_nr_get_request_trials :
-            print("-ok")
-            exit()
-        print("Will sleep for 55s before the next try.")
-        time.sleep(55)       # Try once more after a while.
-
-    nr_trials += 1
+        print("-ok")
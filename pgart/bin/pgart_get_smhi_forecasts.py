@@ -12,24 +12,19 @@ import sys
 
 import pgart_misc_func as f0
 import pgart_get_smhi_forecasts_func as f2
-import time
 
-max_nr_get_request_trials = 2
 
-my_lat, my_lon, wind_force_factor, logreq, max_log_len = f0.get_args_forecasts_from_smhi()
-print(my_lat, my_lon, wind_force_factor, logreq, max_log_len)
+def fetch(my_lat, my_lon, wind_force_factor, logreq, max_log_len) :
+    # Called by pgart_misc_func.exec_plugin_pgm(). Returns (status, the lines of fi_forecast_short).
+    return(f2.get_forecasts_from_smhi(my_lat, my_lon, wind_force_factor, logreq, max_log_len))
 
-nr_trials = 1
-more = True
-while more :
-    if f2.get_forecasts_from_smhi(my_lat, my_lon, wind_force_factor, logreq, max_log_len) :
+
+if __name__ == "__main__" :
+    my_lat, my_lon, wind_force_factor, logreq, max_log_len = f0.get_args_forecasts_from_smhi()
+    print(my_lat, my_lon, wind_force_factor, logreq, max_log_len)
+
+    status, recs = f0.run_plugin_fetch("forecast", fetch, (my_lat, my_lon, wind_force_factor, logreq, max_log_len))
+    if status :
         f0.print_forecast_short()
-        sys.stdout.flush()
-        exit()
     else :
-        if nr_trials == max_nr_get_request_trials :
-            print("-ok")
-            exit()
-        time.sleep(55)       # Try once more after a while.
-
-    nr_trials += 1
+        print("-ok")
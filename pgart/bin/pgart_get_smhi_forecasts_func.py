@@ -11,7 +11,6 @@
 import json
 import platform
 import os
-import requests
 from pathlib import Path
 from datetime import date,datetime,timedelta
 import time
@@ -19,6 +18,7 @@ import time
 import pgart_misc_func as f0
 import pgart_env_func as f1
 import pgart_lang_func as f8
+import pgart_http_func as f13
 
 g_lang = f8.get_language()
 g_ui_text = f1.ui_texts(g_lang)
@@ -33,10 +33,11 @@ def create_smhi_url(my_lat, my_lon) :
 
 
 def get_smhi_forecast(smhi_url, logreq, max_log_len) :
+    import requests     # Only when SMHI is asked. Slow to import.
     json_smhi = ""
     try:
-        response = requests.get(smhi_url)
-    except requests.exceptions.ConnectionError:
+        response = f13.get(smhi_url, cache=True)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         info ="get_smhi_forecast:\n\t"+g_ui_text["t26"]
         f0.log_action(info, False)
         return(False, json_smhi)
@@ -53,6 +54,9 @@ def get_smhi_forecast(smhi_url, logreq, max_log_len) :
 
 
 def save_smhi_forecast_long(json_smhi) :
+    if f0.is_phase_over() :
+        return(False)       # The run has gone on without this forecast. See run_plugin_fetch().
+
     json_formatted_str = json.dumps(json_smhi, indent=4)
     f = open(te["fi_smhi_forecast"] , "w", encoding="utf8")
     f.write(json_formatted_str)
@@ -60,12 +64,13 @@ def save_smhi_forecast_long(json_smhi) :
     return(True)
 
 
-def save_smhi_forecast_short(json_smhi_short) :
-    f = open(te["fi_forecast_short"], "w", encoding="utf8")
+def get_smhi_forecast_short_recs(json_smhi_short) :
+    # The lines of fi_forecast_short.
+    recs = []
     for dt in json_smhi_short :
-        f.write(dt+":"+json_smhi_short[dt]+"\n")
-    f.close()
-    return(True)
+        recs.append(dt+":"+json_smhi_short[dt])
+
+    return(recs)
 
 
 def save_forecast_temp_wind(forecast_temp_wind) :
@@ -135,17 +140,20 @@ def get_forecasts_from_smhi(my_lat, my_lon, windchill_wind_force_factor, logreq,
     smhi_url = create_smhi_url(my_lat, my_lon)
     status, json_smhi = get_smhi_forecast(smhi_url, logreq, max_log_len)
     if not status :
-        return(False)
+        return(False, [])
 
     save_smhi_forecast_long(json_smhi)
     json_smhi_short = create_smhi_forecast_short(json_smhi)
-    save_smhi_forecast_short(json_smhi_short)
 
-    return(True)
+    return(True, get_smhi_forecast_short_recs(json_smhi_short))
 
 
 def get_forecasts_from_file(windchill_wind_force_factor) :
-    json_smhi_short = f0.get_forecast_short()
+    return(get_forecasts(f0.get_forecast_short(), windchill_wind_force_factor))
+
+
+def get_forecasts(json_smhi_short, windchill_wind_force_factor) :
+    # json_smhi_short: {"2023-01-17_20": "-3.2,5.0"...} from the file or from pgart_get_smhi_forecasts.fetch().
     if len(json_smhi_short) == 0 :
         return(json_smhi_short)
 
@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# A columnar history of summary_run.log and windchill_stats.log in var/history.
+# One directory per table and month and one binary file per column, like:
+#   var/history/run_summary/202401/pump_temp.bin
+# A column file is a python array (fixed size numbers). Text values, like set_hour, are stored as a number
+# that points into var/history/<table>/dict.json.
+# Rows are only appended. A query reads just the columns it needs.
+
+import os
+import re
+import json
+import time
+import glob
+import atexit
+
+from array import array
+from datetime import datetime
+
+import pgart_env_func as f1
+
+te = f1.get_pgart_env()
+
+# column: array typecode. "code" columns are stored as "H" pointing into the dictionary.
+g_history_tables = {
+    "run_summary": {
+        "dt": "q", "hour": "b", "call_id": "code", "actions": "code", "change_type": "code",
+        "outdoor_temp": "h", "room_temp": "h", "sensor_temp": "f", "pump_temp": "h", "new_temp": "h",
+        "hr_rate_temp_decrease": "h", "hr_rate_usage": "code", "windchill_temp_increase": "h", "windchill_temp_usage": "code"},
+    "windchill_stats": {
+        "dt": "q", "hour": "b", "indoor_temp": "h", "forecast_temp": "f", "forecast_wind": "f", "factor": "f",
+        "windchill_temp": "f", "temp_diff": "f", "temp_increase_wanted": "f", "temp_increase_final": "f", "evaluation_code": "b"},
+    "run_phases": {
+        "dt": "q", "hour": "b", "call_id": "code", "total_ms": "i", "inputs_ms": "i", "hourly_rates_ms": "i",
+        "monthly_rates_ms": "i", "sensor_ms": "i", "pump_ms": "i", "forecast_ms": "i", "plan_ms": "i", "pump_write_ms": "i",
+        "degraded": "code", "http_requests": "i", "http_connections": "i"}
+}
+
+g_history_rows = []         # (table, row). Written by flush_history().
+
+
+def get_typecode(table, column) :
+    typecode = g_history_tables[table][column]
+    if typecode == "code" :
+        return("H")
+
+    return(typecode)
+
+
+def get_history_dict(table) :
+    # {"hr_rate_usage": ["off", "set_hour"...]...}
+    try :
+        f = open(te["g_history_dir"]+"/"+table+"/dict.json", "r", encoding="utf8")
+        codes = json.load(f)
+        f.close()
+    except (OSError, ValueError) :
+        codes = {}
+
+    return(codes)
+
+
+def save_history_dict(table, codes) :
+    fi = te["g_history_dir"]+"/"+table+"/dict.json"
+    f = open(fi+".tmp", "w", encoding="utf8")
+    json.dump(codes, f)
+    f.close()
+    os.replace(fi+".tmp", fi)
+
+
+def get_nr_rows(table, month_dir) :
+    # A column can be longer than the others if a run was stopped while appending. Those values are ignored.
+    # A column added to the table later has no file for the months before. It is filled with 0 at the next append.
+    nr_rows = None
+    for column in g_history_tables[table] :
+        fi = month_dir+"/"+column+".bin"
+        if not os.path.isfile(fi) :
+            continue
+
+        n = os.path.getsize(fi) // array(get_typecode(table, column)).itemsize
+        if nr_rows is None or n < nr_rows :
+            nr_rows = n
+
+    return(0 if nr_rows is None else nr_rows)
+
+
+def add_history_row(table, row) :
+    # row: {"dt": "2024-01-15_07:02", "hour": 7, ...}. Missing values are 0.
+    if row is None :        # The log line could not be parsed.
+        return()
+
+    g_history_rows.append((table, row))
+
+
+def flush_history() :
+    # Everything from this run. One open per column file and month.
+    global g_history_rows
+    if len(g_history_rows) == 0 :
+        return()
+
+    new_rows = {}
+    for table, row in g_history_rows :
+        dt = datetime.strptime(row["dt"], "%Y-%m-%d_%H:%M")
+        row = dict(row)
+        row["dt"] = int(time.mktime(dt.timetuple()))
+        new_rows.setdefault((table, dt.strftime("%Y%m")), []).append(row)
+
+    g_history_rows = []
+    for (table, month), rows in new_rows.items() :
+        append_history_rows(table, month, rows)
+
+
+def append_history_rows(table, month, rows) :
+    month_dir = te["g_history_dir"]+"/"+table+"/"+month
+    os.makedirs(month_dir, exist_ok=True)
+    codes = get_history_dict(table)
+    codes_changed = False
+    nr_rows = get_nr_rows(table, month_dir)
+    for column in g_history_tables[table] :
+        typecode = get_typecode(table, column)
+        values = array(typecode)
+        for row in rows :
+            val = row.get(column, 0)
+            if g_history_tables[table][column] == "code" :
+                col_codes = codes.setdefault(column, [])
+                val = str(val)
+                if not val in col_codes :
+                    col_codes.append(val)
+                    codes_changed = True
+                val = col_codes.index(val)
+            elif typecode in ["f", "d"] :
+                val = float(val)
+            else :
+                val = int(val)
+
+            values.append(val)
+
+        fi = month_dir+"/"+column+".bin"
+        f = open(fi, "ab")
+        f.truncate(nr_rows * values.itemsize)       # Values after an interrupted append are removed. A new column gets 0s.
+        values.tofile(f)
+        f.close()
+
+    if codes_changed :
+        save_history_dict(table, codes)
+
+
+def get_history_months(table, month_from, month_to) :
+    months = []
+    for month_dir in glob.glob(te["g_history_dir"]+"/"+table+"/"+"[0-9]"*6) :
+        month = os.path.basename(month_dir)
+        if month >= month_from and month <= month_to :
+            months.append(month)
+
+    months.sort()
+    return(months)
+
+
+def read_history_columns(table, columns, month_from="000000", month_to="999999") :
+    # Yields one dict per month: {column: array}. Text columns are returned as their codes.
+    for month in get_history_months(table, month_from, month_to) :
+        month_dir = te["g_history_dir"]+"/"+table+"/"+month
+        nr_rows = get_nr_rows(table, month_dir)
+        cols = {}
+        for column in columns :
+            values = array(get_typecode(table, column))
+            fi = month_dir+"/"+column+".bin"
+            if not os.path.isfile(fi) :
+                values.extend([0] * nr_rows)       # Added to the table after this month.
+            else :
+                f = open(fi, "rb")
+                values.fromfile(f, nr_rows)
+                f.close()
+
+            cols[column] = values
+
+        yield(cols)
+
+
+def get_summary_row(line) :
+    # 2024-01-15_07:02 L3 000100 No_schema    out:-3  room:20  sensor:-273 pump:19 new:19 hr_rate:0 set_hour windchill:0 off
+    buf = line.split()
+    if len(buf) != 13 or not re.fullmatch(r"\d{4}-\d\d-\d\d_\d\d:\d\d", buf[0]) :
+        return(None)
+
+    try :
+        row = {
+               "dt": buf[0], "hour": int(buf[0][11:13]), "call_id": buf[1], "actions": buf[2], "change_type": buf[3],
+               "outdoor_temp": int(buf[4].split(":")[1]), "room_temp": int(buf[5].split(":")[1]),
+               "sensor_temp": float(buf[6].split(":")[1]), "pump_temp": int(buf[7].split(":")[1]),
+               "new_temp": int(buf[8].split(":")[1]), "hr_rate_temp_decrease": int(buf[9].split(":")[1]),
+               "hr_rate_usage": buf[10], "windchill_temp_increase": int(buf[11].split(":")[1]), "windchill_temp_usage": buf[12]}
+    except (ValueError, IndexError) :
+        return(None)
+
+    return(row)
+
+
+def get_windchill_row(line) :
+    # 2024-01-15_07:02 h: 7 last_indoor_t:21 forec_t:-3.2 forec_wind: 5.0 factor:1.0 windchill_t:-8.5 diff: 5.3 wanted_inc: 1.0 got_inc: 1.0 (3) text
+    m = re.match(
+                 r"(\d{4}-\d\d-\d\d_\d\d:\d\d) h:\s*(\d+) last_indoor_t:\s*(-?\d+) forec_t:\s*(\S+) forec_wind:\s*(\S+) "
+                 r"factor:\s*(\S+) windchill_t:\s*(\S+) diff:\s*(\S+) wanted_inc:\s*(\S+) got_inc:\s*(\S+) \((-?\d+)\)", line)
+    if m is None :
+        return(None)
+
+    try :
+        row = {
+               "dt": m.group(1), "hour": int(m.group(2)), "indoor_temp": int(m.group(3)),
+               "forecast_temp": float(m.group(4)), "forecast_wind": float(m.group(5)), "factor": float(m.group(6)),
+               "windchill_temp": float(m.group(7)), "temp_diff": float(m.group(8)), "temp_increase_wanted": float(m.group(9)),
+               "temp_increase_final": float(m.group(10)), "evaluation_code": int(m.group(11))}
+    except ValueError :
+        return(None)
+
+    return(row)
+
+
+atexit.register(flush_history)
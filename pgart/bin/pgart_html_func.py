@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# The rows of one table (or list) of a web page, parsed while the page is downloaded.
+# The parser is fed the chunks from pgart_http_func.get_stream() and stops the download when the table is closed.
+# Only the rows are kept, not the page. The memory is the size of the table.
+#   steps   where the table starts, matched in order:
+#           ("tag", tag, attr, text)  a start tag. None: any tag, any attribute. text: a part of the attribute value.
+#           ("text", text)            a part of the text of the page.
+#           The table ends with the element of the last "tag" step, or by stop(row).
+#   rows    [[(text, {attr: value}), ...], ...] one list of cells per row_tags element. Rows without cells are dropped.
+# See pgart_bench_parse_pages.py for the parse speed, on synthetic pages or on pages recorded from the sites.
+
+import codecs
+
+from html.parser import HTMLParser
+
+import pgart_http_func as f13
+
+
+class RowParser(HTMLParser) :
+    # A small state machine: waiting for the steps, in the table, in a row, in a cell, done.
+
+    def __init__(self, steps, row_tags=("tr",), cell_tags=("td", "th"), stop=None) :
+        super().__init__(convert_charrefs=True)
+        self.steps = steps
+        self.row_tags = row_tags
+        self.cell_tags = cell_tags
+        self.stop = stop            # stop(row) True: the table ends before this row.
+        self.step = 0
+        self.region_tag = None
+        self.region_depth = 0
+        self.row = None
+        self.cell = None            # [text, attrs, depth]
+        self.rows = []
+        self.done = False
+
+    def is_in_table(self) :
+        return(self.step == len(self.steps) and not self.done)
+
+    def is_step_tag(self, tag, attrs) :
+        step = self.steps[self.step]
+        if step[0] != "tag" or (step[1] is not None and step[1] != tag) :
+            return(False)
+
+        if step[3] is None :
+            return(True)
+
+        return(any(step[3] in (value or "") for attr, value in attrs if step[2] is None or step[2] == attr))
+
+    def end_row(self) :
+        if self.cell is not None :
+            self.end_cell()
+
+        row = self.row
+        self.row = None
+        if row is None :
+            return()
+
+        if self.stop is not None and self.stop(row) :
+            self.done = True
+        elif len(row) > 0 :
+            self.rows.append(row)
+
+    def end_cell(self) :
+        self.row.append((" ".join(self.cell[0].split()), self.cell[1]))
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs) :
+        if self.done :
+            return()
+
+        if not self.is_in_table() :
+            if self.is_step_tag(tag, attrs) :
+                self.step += 1
+                self.region_tag = tag
+                self.region_depth = 1
+            elif self.region_tag == tag :
+                self.region_depth += 1
+            return()
+
+        if tag == self.region_tag :
+            self.region_depth += 1
+
+        if tag in self.row_tags :
+            self.end_row()          # <tr class="gray"><tr class="white"> is two rows.
+            self.row = []
+        elif tag in self.cell_tags and self.row is not None :
+            if self.cell is None :
+                self.cell = ["", dict(attrs), 1]
+            else :
+                self.cell[2] += 1   # <span><span>..</span></span> is one cell.
+
+    def handle_endtag(self, tag) :
+        if self.done :
+            return()
+
+        if tag == self.region_tag :
+            self.region_depth -= 1
+
+        if not self.is_in_table() :
+            return()
+
+        if self.cell is not None and tag in self.cell_tags :
+            self.cell[2] -= 1
+            if self.cell[2] == 0 :
+                self.end_cell()
+        elif tag in self.row_tags :
+            self.end_row()
+
+        if tag == self.region_tag and self.region_depth == 0 :
+            self.end_row()
+            self.done = True
+
+    def handle_data(self, data) :
+        if self.done :
+            return()
+
+        if not self.is_in_table() :
+            step = self.steps[self.step]
+            if step[0] == "text" and step[1] in data :
+                self.step += 1
+            return()
+
+        if self.cell is not None :
+            self.cell[0] += data
+
+
+def parse_stream(chunks, parser, encoding=None, on_done=None) :
+    # Feeds the chunks (bytes) to the parser until the table is done. The rest is not read: chunks is closed.
+    # on_done() is called when the table is done, before chunks is closed. Not after an error.
+    # Returns (the rows, True when the table was found and closed).
+    decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+    try :
+        for chunk in chunks :
+            parser.feed(decoder.decode(chunk))
+            if parser.done :
+                if on_done is not None :
+                    on_done()
+                break
+        else :
+            parser.feed(decoder.decode(b"", final=True))
+            parser.close()
+            parser.end_row()
+    finally :
+        chunks.close()
+
+    return(parser.rows, parser.done)
+
+
+def get_rows(response, chunks, steps, row_tags=("tr",), cell_tags=("td", "th"), stop=None) :
+    # As parse_stream() for a response from pgart_http_func.get_stream(). A page cut off after the table is cached.
+    return(parse_stream(chunks, RowParser(steps, row_tags, cell_tags, stop), response.encoding,
+                        lambda : f13.set_stream_done(response)))
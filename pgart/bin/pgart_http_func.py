@@ -0,0 +1,420 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# The HTTP client of the fetchers and of Thermia online. One requests.Session per name keeps the connections to a host
+# open (keep-alive), so a new TCP and TLS handshake is only needed for a new host or when the host has closed it.
+# The login to Thermia makes four calls to the same host. pgart_control_heating_daemon.py keeps the sessions between the runs.
+# Every call gets the timeout of pgart_misc_func.get_timeout() unless it has its own.
+# get_reuse_stats(): how many requests and how many new connections, per host.
+# get(url, cache=True): the answer is kept in var/http_cache, compressed, one file per URL. Until it is stale by
+# Cache-Control max-age or Expires it is used without asking. Then it is asked for with If-None-Match/If-Modified-Since,
+# and an unchanged page costs a 304. The least recently used files are removed above cache_max_kbytes.
+# get_stream(url): the body as chunks while it is downloaded. The reader stops when it has what it needs and the
+# rest of the page is not read. With cache=True the part that was read is kept, marked partial, when the reader
+# says it is done with set_stream_done(). get() does not use it.
+
+import os
+import glob
+import shutil
+import json
+import time
+import zlib
+import hashlib
+import threading
+
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+
+te = f1.get_pgart_env()
+
+pool_hosts = 10         # Hosts with open connections per session. More than the fetchers use.
+pool_per_host = 4       # Connections per host. The inputs are fetched at the same time.
+accept_encoding = "gzip, deflate"
+cache_max_kbytes = 8192     # var/http_cache. The SMHI forecast is the biggest, about 100 kbytes compressed.
+stream_chunk_size = 16384
+stream_keep_bytes = 65536   # The start of a streamed page is kept in response.content for log_request().
+
+g_sessions = {}         # name: requests.Session
+g_sessions_lock = threading.Lock()
+g_stats_base = {}       # host: (requests, connections) at reset_reuse_stats().
+
+
+def get_session(name="default") :
+    # "thermia" for the Thermia cookies and token. "default" for the rest.
+    with g_sessions_lock :
+        if name not in g_sessions :
+            import requests     # Only when a site is asked. Slow to import.
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_per_host)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["Accept-Encoding"] = accept_encoding
+            g_sessions[name] = session
+
+        return(g_sessions[name])
+
+
+def close_session(name) :
+    # The open connections and the cookies are dropped. The next call gets a new session.
+    with g_sessions_lock :
+        session = g_sessions.pop(name, None)
+
+    if session is not None :
+        session.close()
+
+
+def request(method, url, session="default", **kwargs) :
+    # As requests.request(). Raises the same exceptions.
+    if kwargs.get("timeout") is None :
+        kwargs["timeout"] = f0.get_timeout(f0.http_timeout)
+
+    return(get_session(session).request(method, url, **kwargs))
+
+
+def get(url, session="default", cache=False, **kwargs) :
+    if cache :
+        return(get_cached(url, session, **kwargs))
+
+    return(request("GET", url, session, **kwargs))
+
+
+def post(url, session="default", **kwargs) :
+    return(request("POST", url, session, **kwargs))
+
+
+def get_pool_counts() :
+    # {host: (requests, connections)} since the start, all sessions. From the connection pools of urllib3.
+    counts = {}
+    with g_sessions_lock :
+        sessions = list(g_sessions.values())
+
+    for session in sessions :
+        for adapter in set(session.adapters.values()) :
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()) :
+                pool = pools.get(key)
+                if pool is None :
+                    continue
+
+                nr_requests, nr_connections = counts.get(pool.host, (0, 0))
+                counts[pool.host] = (nr_requests + pool.num_requests, nr_connections + pool.num_connections)
+
+    return(counts)
+
+
+def reset_reuse_stats() :
+    # The next get_reuse_stats() counts from now. At the start of a run in the daemon.
+    g_stats_base.clear()
+    g_stats_base.update(get_pool_counts())
+
+
+def get_reuse_stats() :
+    # {host: (requests, new connections)} since reset_reuse_stats(). requests - new connections were reused.
+    stats = {}
+    for host, (nr_requests, nr_connections) in get_pool_counts().items() :
+        base_requests, base_connections = g_stats_base.get(host, (0, 0))
+        if nr_requests > base_requests :
+            stats[host] = (nr_requests - base_requests, nr_connections - base_connections)
+
+    return(stats)
+
+
+def get_cache_file(url) :
+    return(te["g_http_cache_dir"]+"/"+hashlib.sha1(url.encode("utf-8")).hexdigest()+".cache")
+
+
+def read_cache(url) :
+    # Returns (meta, body) or (None, None). The first line of the file is the meta data, then the body zlib compressed.
+    try :
+        f = open(get_cache_file(url), "rb")
+        meta = json.loads(f.readline())
+        body = zlib.decompress(f.read())
+        f.close()
+    except (OSError, ValueError, zlib.error) :
+        return(None, None)
+
+    if meta.get("url") != url or meta.get("partial", False) :       # Not likely, but sha1 is just a name.
+        return(None, None)
+
+    return(meta, body)
+
+
+def read_cache_meta(url) :
+    # As read_cache() without the body. Also a partial page from get_stream().
+    try :
+        f = open(get_cache_file(url), "rb")
+        meta = json.loads(f.readline())
+        f.close()
+    except (OSError, ValueError) :
+        return(None)
+
+    if meta.get("url") != url :
+        return(None)
+
+    return(meta)
+
+
+def get_cache_control(headers) :
+    # {"max-age": "3600", "no-store": ""...}
+    directives = {}
+    for directive in headers.get("Cache-Control", "").split(",") :
+        key, sep, value = directive.strip().lower().partition("=")
+        if key != "" :
+            directives[key] = value.strip('"')
+
+    return(directives)
+
+
+def get_fresh_until(headers) :
+    # time.time() until the answer may be used without asking. Now when it shall always be asked for.
+    directives = get_cache_control(headers)
+    if "no-cache" in directives :
+        return(time.time())
+
+    if directives.get("max-age", "").isdigit() :
+        return(time.time() + int(directives["max-age"]))
+
+    try :
+        return(parsedate_to_datetime(headers["Expires"]).timestamp())
+    except (KeyError, TypeError, ValueError) :
+        return(time.time())
+
+
+def get_cache_meta(url, response) :
+    # None when the answer shall not be kept.
+    if "no-store" in get_cache_control(response.headers) :
+        return(None)
+
+    meta = {
+            "url": url, "etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified"),
+            "fresh_until": get_fresh_until(response.headers), "stored": time.time(),
+            "content_type": response.headers.get("Content-Type"), "encoding": response.encoding}
+    if meta["etag"] is None and meta["last_modified"] is None and meta["fresh_until"] <= time.time() :
+        return(None)        # Nothing to ask with and never fresh. Not worth keeping.
+
+    return(meta)
+
+
+def write_cache(url, meta, f_body) :
+    # f_body: the compressed body, an open file. Another program could read the cache file at the same time.
+    os.makedirs(te["g_http_cache_dir"], exist_ok=True)
+    fi = get_cache_file(url)
+    f = open(fi+".tmp", "wb")
+    f.write(json.dumps(meta).encode("utf-8")+b"\n")
+    shutil.copyfileobj(f_body, f)
+    f.close()
+    os.replace(fi+".tmp", fi)
+    evict_cache()
+
+
+def save_cache(url, response, body=None) :
+    # body: the one from the cache after a 304.
+    meta = get_cache_meta(url, response)
+    if meta is None :
+        return()
+
+    if body is None :
+        body = response.content
+
+    os.makedirs(te["g_http_cache_dir"], exist_ok=True)
+    fi_body = get_cache_file(url)+"."+str(threading.get_ident())+".body"
+    f = open(fi_body, "w+b")
+    f.write(zlib.compress(body, 6))
+    f.seek(0)
+    write_cache(url, meta, f)
+    f.close()
+    os.remove(fi_body)
+
+
+def evict_cache() :
+    # The least recently used first. A hit touches the file.
+    files = []
+    for fi in glob.glob(te["g_http_cache_dir"]+"/*.cache") :
+        try :
+            files.append((os.path.getmtime(fi), os.path.getsize(fi), fi))
+        except OSError :
+            continue        # Removed by another program.
+
+    total = sum(size for mtime, size, fi in files)
+    for mtime, size, fi in sorted(files) :
+        if total <= cache_max_kbytes * 1024 :
+            break
+
+        try :
+            os.remove(fi)
+        except OSError :
+            pass
+
+        total -= size
+
+
+def get_cached_response(url, meta, body) :
+    # A response as from the site for a fresh cache file. No request is made.
+    import requests
+    response = requests.models.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = body
+    response.encoding = meta["encoding"]
+    response.elapsed = timedelta(0)
+    response.request = requests.Request("GET", url).prepare()
+    if meta["content_type"] is not None :
+        response.headers["Content-Type"] = meta["content_type"]
+
+    response.headers["X-Pgart-Cache"] = "fresh"
+    return(response)
+
+
+def get_cached(url, session="default", **kwargs) :
+    # As get(). The status is 200 also when the site answered 304 Not Modified, with the body from the cache.
+    meta, body = read_cache(url)
+    if meta is not None and time.time() < meta["fresh_until"] :
+        os.utime(get_cache_file(url))     # Recently used.
+        return(get_cached_response(url, meta, body))
+
+    headers = dict(kwargs.pop("headers", None) or {})
+    if meta is not None :
+        if meta["etag"] is not None :
+            headers["If-None-Match"] = meta["etag"]
+        if meta["last_modified"] is not None :
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    response = get(url, session, headers=headers, **kwargs)
+    if response.status_code == 304 and meta is not None :
+        response.status_code = 200
+        response._content = body
+        response.encoding = meta["encoding"]
+        for header, key in (("ETag", "etag"), ("Last-Modified", "last_modified")) :
+            if header not in response.headers and meta[key] is not None :
+                response.headers[header] = meta[key]      # A 304 need not repeat them.
+        response.headers["X-Pgart-Cache"] = "revalidated"
+        save_cache(url, response, body)      # New fresh_until. Also touched.
+    elif response.status_code == 200 :
+        save_cache(url, response)
+
+    return(response)
+
+
+def iter_keep_head(response, chunks) :
+    # The chunks as they are. The first stream_keep_bytes become response.content when the reader is done.
+    head = bytearray()
+    try :
+        for chunk in chunks :
+            if len(head) < stream_keep_bytes :
+                head += chunk[0:stream_keep_bytes - len(head)]
+            yield(chunk)
+    finally :
+        chunks.close()
+        response._content = bytes(head)
+        response._content_consumed = True
+
+
+def iter_cache_body(url) :
+    # The body of the cache file, decompressed a chunk at a time.
+    f = open(get_cache_file(url), "rb")
+    try :
+        f.readline()        # The meta data.
+        decompressor = zlib.decompressobj()
+        while True :
+            block = f.read(stream_chunk_size)
+            if len(block) == 0 :
+                break
+            yield(decompressor.decompress(block))
+        yield(decompressor.flush())
+    finally :
+        f.close()
+
+
+def iter_response(response) :
+    try :
+        for chunk in response.iter_content(stream_chunk_size) :
+            yield(chunk)
+    finally :
+        response.close()        # Not read to the end: the connection is dropped, not put back in the pool.
+
+
+def set_stream_done(response) :
+    # The reader of get_stream() has what it needs and stops. The part read is then kept in the cache, marked partial.
+    # Call it before the chunks are closed.
+    response.pgart_stream_done = True
+
+
+def iter_response_to_cache(url, response, meta) :
+    # The chunks are also compressed to a body file. Kept when the page was read to the end or the reader stopped
+    # after set_stream_done(). Not after an error or a timeout of the reader: the body is cut off.
+    # The body file is on disk so the memory does not grow with the page.
+    fi_body = get_cache_file(url)+"."+str(threading.get_ident())+".body"
+    os.makedirs(te["g_http_cache_dir"], exist_ok=True)
+    f = open(fi_body, "w+b")
+    compressor = zlib.compressobj(6)
+    keep = False
+    try :
+        for chunk in response.iter_content(stream_chunk_size) :
+            f.write(compressor.compress(chunk))
+            yield(chunk)
+        keep = True
+    except GeneratorExit :
+        if getattr(response, "pgart_stream_done", False) :
+            meta["partial"] = True       # The reader has what it needs. The same reader can use it again.
+            keep = True
+        raise
+    finally :
+        response.close()
+        if keep :
+            f.write(compressor.flush())
+            f.seek(0)
+            write_cache(url, meta, f)
+        f.close()
+        os.remove(fi_body)
+
+
+def get_stream(url, session="default", cache=False, **kwargs) :
+    # As get() but the body is not read. Returns (response, chunks). chunks: a generator of the body in bytes,
+    # gzip already decoded. Close it when done. response.content is the start of the body after that.
+    # With cache: a fresh cache file is read, a 304 gives the body of the cache file. The status is 200.
+    meta = None
+    headers = dict(kwargs.pop("headers", None) or {})
+    if cache :
+        meta = read_cache_meta(url)
+        if meta is not None and time.time() < meta["fresh_until"] :
+            os.utime(get_cache_file(url))     # Recently used.
+            response = get_cached_response(url, meta, b"")
+            return(response, iter_keep_head(response, iter_cache_body(url)))
+
+        if meta is not None :
+            if meta["etag"] is not None :
+                headers["If-None-Match"] = meta["etag"]
+            if meta["last_modified"] is not None :
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+    response = get(url, session, headers=headers, stream=True, **kwargs)
+    if response.status_code == 304 and meta is not None :
+        response.close()
+        response.status_code = 200
+        response.encoding = meta["encoding"]
+        response.headers["X-Pgart-Cache"] = "revalidated"
+        new_meta = get_cache_meta(url, response)
+        if new_meta is not None :       # A new fresh_until. The body is the same.
+            for key in ["etag", "last_modified", "content_type"] :
+                if new_meta[key] is None :
+                    new_meta[key] = meta[key]      # A 304 need not repeat them.
+            new_meta["partial"] = meta.get("partial", False)
+            f = open(get_cache_file(url), "rb")
+            f.readline()
+            write_cache(url, new_meta, f)
+            f.close()
+        return(response, iter_keep_head(response, iter_cache_body(url)))
+
+    if response.status_code == 200 and cache :
+        meta = get_cache_meta(url, response)
+        if meta is not None :
+            return(response, iter_keep_head(response, iter_response_to_cache(url, response, meta)))
+
+    return(response, iter_keep_head(response, iter_response(response)))
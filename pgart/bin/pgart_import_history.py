@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# Imports summary_run.log and windchill_stats.log, with all rotated generations (also gzipped), into var/history.
+# One line at a time. Rows already in the history (the same table and date-time) are skipped,
+# so it can be run again.
+
+import getopt, sys
+import time
+
+from datetime import datetime
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_history_func as f10
+import pgart_lang_func as f8
+
+g_lang = f8.get_language()
+g_ui_text = f1.ui_texts(g_lang)
+te = f1.get_pgart_env()
+
+max_nr_rows_in_memory = 10000     # Then they are written.
+
+
+def get_args() :
+    argv = sys.argv[1:]     # Bypass my own name
+    options = "t:"
+    long_options = ["tables="]
+    tables = "run_summary,windchill_stats"
+    try:
+        args, values = getopt.getopt(argv, options, long_options)
+        for arg, val in args :
+            if arg in ("-t", "--tables") :
+                tables = val
+    except getopt.error as err :
+        print(str(err))
+        print("usage: pgart_import_history.py -t <run_summary,windchill_stats>")
+        exit()
+
+    return(tables.split(','))
+
+
+def get_existing_dts(table) :
+    existing_dts = set()
+    for cols in f10.read_history_columns(table, ["dt"]) :
+        existing_dts.update(cols["dt"])
+
+    return(existing_dts)
+
+
+def import_log(table, fi_log, get_row) :
+    existing_dts = get_existing_dts(table)
+    nr_imported = 0
+    nr_skipped = 0
+    for line in f0.read_log_lines(fi_log) :
+        row = get_row(line)
+        if row is None :        # Explanations and such.
+            continue
+
+        dt = int(time.mktime(datetime.strptime(row["dt"], "%Y-%m-%d_%H:%M").timetuple()))
+        if dt in existing_dts :
+            nr_skipped += 1
+            continue
+
+        existing_dts.add(dt)
+        f10.add_history_row(table, row)
+        nr_imported += 1
+        if len(f10.g_history_rows) >= max_nr_rows_in_memory :
+            f10.flush_history()
+
+    f10.flush_history()
+    print(table+": imported:"+str(nr_imported)+" already there:"+str(nr_skipped))
+
+
+tables = get_args()
+for table in tables :
+    if table == "run_summary" :
+        import_log(table, te["fi_run_summary_log"], f10.get_summary_row)
+    elif table == "windchill_stats" :
+        import_log(table, te["fi_windchill_stats"], f10.get_windchill_row)
+    else :
+        print(table+" "+g_ui_text["tp10"])
@@ -14,7 +14,19 @@ import pgart_env_func as f1
 
 te = f1.get_pgart_env()
 
+g_language = {"mtime": None, "lang": "se"}      # Read once. Again only when fi_language has been changed.
+
+
 def get_language() :
+    try :
+        mtime = os.path.getmtime(te["fi_language"])
+    except OSError :
+        mtime = 0
+
+    if mtime == g_language["mtime"] :
+        return(g_language["lang"])
+
+    lang = "se"
     filepath = Path(te["fi_language"])
     if filepath.is_file():
         f = open(te["fi_language"], "r", encoding="utf8")
@@ -28,5 +40,10 @@ def get_language() :
 
             rec = rec.strip()
             if rec == "se" or rec == "en" :
-                return(rec)
-    return("se")
+                lang = rec
+                break
+        f.close()
+
+    g_language["mtime"] = mtime
+    g_language["lang"] = lang
+    return(lang)
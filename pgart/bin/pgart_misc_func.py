@@ -9,26 +9,86 @@
 
 import getopt
 import sys
+import importlib
 import platform
 import os
 import glob
 import subprocess
-import smtplib
 import re
 import time
 import json
+import atexit
+import hashlib
+import zlib
+import struct
+import random
+import threading
+import signal
+import errno
 
-from email.mime.text import MIMEText
 from pathlib import Path
 from datetime import date,datetime,timedelta
+from urllib.parse import urlparse
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None        # Windows. No locking.
 
 import pgart_env_func as f1
 import pgart_lang_func as f8
+import pgart_price_store_func as f14
 
 g_lang = f8.get_language()
 g_ui_text = f1.ui_texts(g_lang)
 te = f1.get_pgart_env()
 
+g_action_log_recs = []          # (date-time, txt). Written by flush_action_log().
+g_action_log_format = "text"    # text, json or both.
+g_action_log_lock = threading.Lock()    # The inputs are read in threads. See run_concurrently().
+g_mail_pars = None              # Read once by get_mail_params().
+g_mail_worker_started = False
+
+# run_with_retry(). Seconds. The delay doubles after each failed attempt, with a random part (jitter).
+# No new attempt is started after the deadline. It is shorter than the input timeouts in pgart_control_heating.py.
+retry_max_attempts = 5
+retry_first_delay = 2
+retry_max_delay = 30
+retry_deadline = 100
+retry_errnos = [errno.ENETDOWN, errno.ENETUNREACH, errno.EHOSTDOWN, errno.EHOSTUNREACH]    # Like no network yet after a restart.
+
+g_request_status = threading.local()     # The last HTTP status of the thread. Set by log_request().
+
+# Seconds. Every HTTP request and Modbus transaction gets a timeout: these or, if less, what is left of the phase
+# of the thread (the input timeout in run_concurrently()) or of the run (run_time_budget). See get_timeout().
+http_timeout = (10, 30)         # Connect, read.
+modbus_timeout = 10
+external_pgm_timeout = 600      # A program run by exec_external_pgm().
+g_run_deadline = {"t": None}    # time.time() when the run shall be done. set_run_budget().
+g_phase_deadline = threading.local()    # .t: time.time() when the phase of the thread shall be done. .name: the phase.
+g_phase_times = {}              # phase: ms. This run. Saved by the caller.
+g_phase_timeouts = set()        # The phases that ran out of time this run.
+
+# The programs in the bin directory that can be run in this process. name: exec_type.
+g_plugin_pgms = {
+    "pgart_get_hourly_rates_elprisetjustnu_se.py": "hourly_rates",
+    "pgart_get_hourly_rates_entsoe_eu.py": "hourly_rates",
+    "pgart_get_hourly_rates_herrforsnat_fi.py": "hourly_rates",
+    "pgart_get_hourly_rates_minspotpris_no.py": "hourly_rates",
+    "pgart_get_monthly_rates_elbruk_se.py": "monthly_rates",
+    "pgart_get_smhi_forecasts.py": "forecast",
+    "pgart_get_indoor_temp_raspberry_pi.py": "temp_reading"
+}
+
+request_ring_nr_slots = 10              # The last exchanges kept per endpoint.
+request_ring_slot_size = 65536          # Bytes. Compressed.
+request_ring_header = "<8sIII"          # magic, nr_slots, slot_size, next_slot
+request_ring_magic = b"PGRING01"
+request_masked_params = ["securityToken"]   # URL parameters not written to the request rings. The ENTSO-E API token.
+request_masked_headers = ["authorization", "cookie", "set-cookie", "x-csrf-token"]     # Headers not written to the request rings. Lower case.
+request_masked_fields = ["password", "token", "access_token", "refresh_token", "id_token", "code", "code_verifier",
+                         "client_secret", "csrf_token"]     # Form, JSON and URL fields not written. The Thermia login.
+
 
 def is_float(s) :
     try:
@@ -70,7 +130,20 @@ def exec_external_pgm(exec_type, exec_path) :
 
     print(exec_path)
     sys.stdout.flush()
-    status = os.system(exec_path)     # The calling program will continue even after a not catched error.
+    flush_action_log()      # The program will log to the same file. Keep the order.
+    # The calling program will continue even after a not catched error. The program is stopped when it runs out of time.
+    p = subprocess.Popen(exec_path, shell=True, start_new_session=True)
+    try :
+        status = p.wait(timeout=get_timeout(external_pgm_timeout))
+    except subprocess.TimeoutExpired :
+        if hasattr(os, "killpg") :
+            os.killpg(p.pid, signal.SIGKILL)     # The shell and the program.
+        else :
+            p.kill()
+        p.wait()
+        status = "timeout"
+        save_phase_timeout()
+        log_action("exec_external_pgm "+exec_type+":\n\tstopped, no result in time.", False)
 
     dt = datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M:%S")
     print(dt+" End: exec_external_pgm", exec_type, status)
@@ -152,6 +225,10 @@ def exec_external_pgm(exec_type, exec_path) :
 
 
 def exec_hourly_rate_pgm(pgm, el_area, logreq, max_log_len ) :
+    if is_plugin_pgm(pgm) :
+        status, recs = exec_plugin_pgm("hourly_rates", pgm, (el_area, logreq, max_log_len))
+        return(status)
+
     cmd = "/usr/bin/python3 "+ te["g_bin_dir"]+"/"+pgm+" -a "+el_area+" -l "+str(logreq)+" -m "+str(max_log_len)
     if exec_external_pgm("hourly_rates", cmd) :
         return(True)
@@ -159,23 +236,304 @@ def exec_hourly_rate_pgm(pgm, el_area, logreq, max_log_len ) :
     return(False)
 
 
-def is_hourly_rates_proper() :
-    fi = Path(te["fi_hourly_rate"])
-    if not fi.is_file():
-        return(False, te["fi_hourly_rate"]+" missing.")
+def is_plugin_pgm(exec_args) :
+    # pgm, arg1, arg2 ... A user program, or a program with its own arguments, is run by exec_external_pgm().
+    buf = "".join(exec_args.split()).split(",")
+    return(len(buf) == 1 and buf[0] in g_plugin_pgms)
+
+
+def get_plugin_cache_file(exec_type, day=None) :
+    if day is not None :        # A prefetch of another day.
+        return(f1.get_fi_hourly_rate(day))
+
+    cache_files = {
+        "hourly_rates": te["fi_hourly_rate"],
+        "monthly_rates": te["fi_monthly_rates"],
+        "forecast": te["fi_forecast_short"],
+        "temp_reading": te["fi_indoor_temp_reading"]}
+    return(cache_files[exec_type])
+
+
+def is_plugin_result_proper(exec_type, recs, day=None) :
+    if exec_type == "hourly_rates" :
+        return(is_hourly_rates_proper(recs, day))
+    if exec_type == "monthly_rates" :
+        return(is_monthly_rates_proper(recs))
+    if exec_type == "forecast" :
+        return(is_forecast_short_proper(recs))
+
+    status, info, dt, t = get_ext_temp_reading(recs)
+    return(status, info)
+
+
+def set_run_budget(seconds) :
+    # seconds: None => no run deadline.
+    g_run_deadline["t"] = None if seconds is None else time.time() + seconds
+    g_phase_times.clear()
+    g_phase_timeouts.clear()
+
+
+def get_time_left() :
+    # Seconds left of the phase of this thread or of the run, the least. None when there is no deadline.
+    deadlines = [t for t in [g_run_deadline["t"], getattr(g_phase_deadline, "t", None)] if t is not None]
+    if len(deadlines) == 0 :
+        return(None)
+
+    return(min(deadlines) - time.time())
+
+
+def get_timeout(timeout) :
+    # timeout: seconds or (connect, read) as for requests. Never more than the time left, never 0 (= no timeout for a socket).
+    time_left = get_time_left()
+    if time_left is None :
+        return(timeout)
+
+    time_left = max(0.1, time_left)
+    if isinstance(timeout, tuple) :
+        return(tuple(min(x, time_left) for x in timeout))
+
+    return(min(timeout, time_left))
+
+
+def is_phase_over() :
+    # The input timeout of this thread has passed. run_concurrently() has gone on without it, maybe to the next run.
+    t = getattr(g_phase_deadline, "t", None)
+    return(t is not None and time.time() >= t)
+
+
+def save_phase_time(phase, t_start) :
+    g_phase_times[phase] = int((time.time() - t_start) * 1000)
+
+
+def save_phase_timeout() :
+    # The phase of this thread gave up for lack of time. Not an error of its own, the caller decides.
+    phase = getattr(g_phase_deadline, "name", None)
+    if phase is not None :
+        g_phase_timeouts.add(phase)
+
+
+def get_retry_delay(nr_attempts) :
+    # Exponential backoff with "equal jitter": at least half the delay, so it is never a busy loop.
+    delay = min(retry_max_delay, retry_first_delay * 2 ** (nr_attempts - 1))
+    return(delay / 2 + random.uniform(0, delay / 2))
+
+
+def is_retryable(err) :
+    # err: the exception or, for a failed result, None. Then the last HTTP status decides.
+    if err is not None :
+        # No contact, a timeout or a broken connection can be better the next time. A page with a new layout,
+        # a bad URL, a missing file or a fault in the program can not.
+        requests = sys.modules.get("requests")      # Loaded when err is one of its. Not imported here for the start time.
+        if requests is not None and isinstance(err, requests.exceptions.RequestException) :
+            return(isinstance(err, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                    requests.exceptions.ChunkedEncodingError)))
+
+        return(isinstance(err, (ConnectionError, TimeoutError)) or getattr(err, "errno", None) in retry_errnos)
+
+    status_code = getattr(g_request_status, "code", None)
+    if status_code is None or status_code in [408, 425, 429] or status_code >= 500 :
+        return(True)
+
+    return(False)   # Like 401 or 404. The same answer again.
+
+
+def run_with_retry(name, func, args, max_attempts=retry_max_attempts) :
+    # func(*args) returns (status, result). Attempts until ok, an error that will not go away, max_attempts or retry_deadline.
+    # Only this thread sleeps. The other inputs in run_concurrently() go on.
+    # Returns (status, result, nr_attempts).
+    t_deadline = time.time() + retry_deadline
+    nr_attempts = 0
+    while True :
+        nr_attempts += 1
+        g_request_status.code = None
+        err = None
+        try :
+            status, result = func(*args)
+        except Exception as e :         # Not SystemExit. A forced exit by func ends the run, see run_concurrently().
+            err = e
+            log_action(name+":\n\tattempt:"+str(nr_attempts)+" "+type(err).__name__+" "+str(err), False)
+            status, result = False, None
+
+        if status :
+            break
+
+        if nr_attempts >= max_attempts or not is_retryable(err) :
+            break
+
+        delay = get_retry_delay(nr_attempts)
+        time_left = get_time_left()
+        if time_left is not None and delay >= time_left :
+            save_phase_timeout()
+            break
+
+        if time.time() + delay > t_deadline :
+            break
+
+        print(name+": attempt:"+str(nr_attempts)+" failed. Next attempt in "+str(round(delay, 1))+"s.")
+        sys.stdout.flush()
+        time.sleep(delay)
+
+    if nr_attempts > 1 or not status :
+        log_action(name+":\n\tstatus:"+str(status)+" attempts:"+str(nr_attempts), False)
+
+    return(status, result, nr_attempts)
+
+
+def run_plugin_fetch(exec_type, fetch, args, day=None) :
+    # fetch(*args) returns (status, recs). recs are the lines of the file for exec_type, like "14:38.28" for the hourly rates.
+    # The result is validated in memory and then saved. The file is a cache for the next runs and for the other programs.
+    # day: the hourly rates of that day, fetch(*args, day). Prefetched, the file there is kept if the fetch fails.
+    # Returns (status, recs).
+    fi_name = get_plugin_cache_file(exec_type, day)
+    dt = datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M:%S")
+    print(dt+" Begin: run_plugin_fetch", exec_type, "" if day is None else datetime.strftime(day, "%Y-%m-%d"))
+
+    fi = Path(fi_name)
+    if day is not None :
+        args = args + (day,)
+    elif fi.is_file():    # The file shall be recreated
+        print("Deleted existing: "+fi_name)
+        os.remove(fi)
+
+    max_attempts = retry_max_attempts
+    if exec_type == "temp_reading" :
+        max_attempts = 1       # The sensor program makes its own readings again.
+
+    status, recs, nr_attempts = run_with_retry("run_plugin_fetch "+exec_type, fetch, args, max_attempts)
+    if recs is None :
+        recs = []
+
+    dt = datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M:%S")
+    print(dt+" End: run_plugin_fetch", exec_type, status, "attempts:"+str(nr_attempts))
+
+    if not status :
+        print(fi_name+" not created")
+        log_action("run_plugin_fetch:\n\tFailed to create:"+fi_name, False)
+        return(False, [])
+
+    status, info = is_plugin_result_proper(exec_type, recs, day)
+    new_fi = fi_name
+    if not status :
+        new_fi = fi_name + ".bad"       # Saved for the troubleshooting.
+
+    f = open(new_fi+".tmp", "w", encoding="utf8")
+    for rec in recs :
+        f.write(rec+"\n")
+    f.close()
+    if is_phase_over() :
+        os.remove(new_fi+".tmp")        # Too late. A later run could already have read or written the file.
+        log_action("run_plugin_fetch "+exec_type+":\n\tresult after the timeout not saved: "+fi_name, False)
+        return(False, [])
+
+    os.replace(new_fi+".tmp", new_fi)        # Complete when it is there. pgart_control_heating_daemon.py may be watching.
+
+    if not status :
+        log_action("run_plugin_fetch "+exec_type+":\n\t"+fi_name+" => "+new_fi, False)
+        if exec_type == "hourly_rates" :
+            log_action("run_plugin_fetch hourly_rates:\n\t"+g_ui_text["t30h"], False)
+        return(False, [])
+
+    log_action("run_plugin_fetch:\n\tSuccess "+fi_name+" created.", False)
+    if exec_type == "hourly_rates" :
+        f14.add_day(args[0], datetime.now() if day is None else day, recs)      # args[0]: el_area. Validated above.
+
+    return(True, recs)
+
+
+def run_concurrently(jobs) :
+    # jobs: {name: (func, args, timeout)}. All are started at the same time, each in its own thread.
+    # The waiting takes as long as the slowest one, or its timeout (seconds from the start).
+    # Returns {name: (state, result)}. state: ok, forced_exit (log_action(txt, True) in the thread), error or timeout.
+    # The exit of a thread does not end the program. The caller checks forced_exit: the run ends or the job has failed.
+    results = {}
+
+    def run_job(name, func, args, timeout) :
+        g_phase_deadline.t = t_start + timeout       # get_timeout() of the requests in this thread.
+        g_phase_deadline.name = name
+        try :
+            results[name] = ("ok", func(*args))
+        except SystemExit :
+            results[name] = ("forced_exit", None)
+        except Exception as err :
+            log_action("run_concurrently "+name+":\n\t"+type(err).__name__+" "+str(err), False)
+            results[name] = ("error", None)
+
+        save_phase_time(name, t_start)
+
+    t_start = time.time()
+    threads = {}
+    time_left = get_time_left()
+    if time_left is not None :
+        jobs = {name: (func, args, min(timeout, max(0, time_left))) for name, (func, args, timeout) in jobs.items()}  # Within the run budget.
+
+    for name, (func, args, timeout) in jobs.items() :
+        # daemon: a thread still waiting for a device or a web site does not keep the run alive.
+        threads[name] = threading.Thread(target=run_job, args=(name, func, args, timeout), name=name, daemon=True)
+        threads[name].start()
+
+    for name, (func, args, timeout) in jobs.items() :
+        threads[name].join(max(0, t_start + timeout - time.time()))
+        if threads[name].is_alive() :
+            log_action("run_concurrently "+name+":\n\tNo result after "+str(round(timeout, 1))+"s", False)
+            results[name] = ("timeout", None)
+            g_phase_times[name] = int(timeout * 1000)
+            g_phase_timeouts.add(name)
 
-    f = open(te["fi_hourly_rate"], 'r' , encoding="utf8")
+    print("run_concurrently: "+", ".join(jobs)+" seconds:"+str(round(time.time() - t_start, 1)))
+    return(dict(results))
+
+
+def get_plugin_module(pgm) :
+    return(importlib.import_module("".join(pgm.split())[:-3]))
+
+
+def exec_plugin_pgm(exec_type, pgm, args, day=None) :
+    # Runs fetch() of a program in g_plugin_pgms in this process. No new python interpreter.
+    return(run_plugin_fetch(exec_type, get_plugin_module(pgm).fetch, args, day))
+
+
+def read_recs(fi_name) :
+    f = open(fi_name, 'r' , encoding="utf8")
+    recs = f.read().splitlines()
+    f.close()
+    return(recs)
+
+
+def is_hourly_rates_proper(recs=None, day=None) :
+    # recs: the lines of the file or the same lines in memory from a plugin. day: not today, a prefetch.
+    # One line per hour of the day, 14:38.28, or per quarter, 14:15:38.28. 23/92 or 25/100 when daylight saving time starts or ends.
+    if recs is None :
+        fi = Path(te["fi_hourly_rate"])
+        if not fi.is_file():
+            return(False, te["fi_hourly_rate"]+" missing.")
+
+        recs = read_recs(te["fi_hourly_rate"])
+
+    minutes = f14.get_recs_minutes(recs)
     nr_rec = 0
-    for rec in f:
+    for rec in recs:
         nr_rec = nr_rec +1
         rec = rec.strip()
         rec = "".join(rec.split())
-        if rec.count(":") != 1 :
+        if not rec.count(":") in [1, 2] :
             info = "is_hourly_rates_proper:\n\t"+te["fi_hourly_rate"]+". "+rec+". "+g_ui_text["tp5d"]
             log_action(info, False)
             return(False, info)
 
-        buf = rec.split(":")     # Must be like 14:38.28
+        if rec.count(":") != (2 if minutes == 15 else 1) :
+            info = "is_hourly_rates_proper:\n\t"+te["fi_hourly_rate"]+". "+rec+". "+g_ui_text["th5c"]
+            log_action(info, False)
+            return(False, info)
+
+        buf = rec.split(":")     # Must be like 14:38.28 or 14:15:38.28
+        if minutes == 15 :
+            if not buf[1] in ["00", "15", "30", "45"] :
+                info = "is_hourly_rates_proper:\n\t"+te["fi_hourly_rate"]+". "+rec+". "+g_ui_text["th3c"]
+                log_action(info, False)
+                return(False, info)
+
+            buf = [buf[0], buf[2]]
+
         hr = buf[0]
         if not hr.isnumeric() :
             info = "is_hourly_rates_proper:\n\t"+te["fi_hourly_rate"]+". "+rec+". "+g_ui_text["th2"]
@@ -191,9 +549,8 @@ def is_hourly_rates_proper() :
             info = "is_hourly_rates_proper:\n\t"+te["fi_hourly_rate"]+". "+rec+". "+g_ui_text["th4"]
             log_action(info, False)
             return(False, info)
-    f.close()
 
-    if nr_rec != 24 :
+    if nr_rec != f14.get_nr_day_slots(datetime.now() if day is None else day, minutes) :
         info = "is_hourly_rates_proper:\n\t"+te["fi_hourly_rate"]+". nr_rec:"+str(nr_rec)+" "+g_ui_text["th5"]
         log_action(info, False)
         return(False, info)
@@ -201,14 +558,16 @@ def is_hourly_rates_proper() :
     return(True, "")
 
 
-def is_monthly_rates_proper() :
-    fi = Path(te["fi_monthly_rates"])
-    if not fi.is_file():
-        return(False, te["fi_monthly_rates"]+" missing.")
+def is_monthly_rates_proper(recs=None) :
+    if recs is None :
+        fi = Path(te["fi_monthly_rates"])
+        if not fi.is_file():
+            return(False, te["fi_monthly_rates"]+" missing.")
+
+        recs = read_recs(te["fi_monthly_rates"])
 
-    f = open(te["fi_monthly_rates"], 'r' , encoding="utf8")
     nr_rec = 0
-    for rec in f:
+    for rec in recs:
         nr_rec = nr_rec +1
         rec = rec.strip()
         rec = "".join(rec.split())     # Must be like 2023-02:138.28
@@ -238,7 +597,6 @@ def is_monthly_rates_proper() :
             info = "is_monthly_rates_proper:\n\t"+te["fi_monthly_rates"]+". "+rec+". "+g_ui_text["th4"]
             log_action(info, False)
             return(False, info)
-    f.close()
 
     if nr_rec < 1 :
         info = "is_monthly_rates_proper:\n\t"+te["fi_monthly_rates"]+". "+str(nr_rec)+" "+g_ui_text["th5b"]
@@ -277,11 +635,11 @@ def get_args_fi_cre_hourly_rates(pgm) :
             print(str(err))
             exit()
     else :
-        print("usage: "+pgm+" -a <area_id> -l <0|1>  -m <nr_bytes> or --area <area_id> --logreq <0|1>  --maxlog <nr_bytes>")
+        print("usage: "+pgm+" -a <area_id> -l <0|1|2>  -m <nr_bytes> or --area <area_id> --logreq <0|1|2>  --maxlog <nr_bytes>")
         exit()
 
     logreq = int(logreq)
-    if logreq != 1 :
+    if logreq not in (1, 2) :
         logreq = 0
 
     return(el_area, logreq, max_log_len)
@@ -313,11 +671,11 @@ def get_args_forecasts_from_smhi() :
             print(str(err))
             exit()
     else :
-        print("usage: pgart_get_smhi_forecasts.py -x <nr> -y <nr> -w <0.5-1.5> -l <0|1>  -m <nr_bytes> or --lat <nr> --lon <nr> --Windfact <0.5-1.5> --logreq <0|1> --maxlog <nr_bytes>")
+        print("usage: pgart_get_smhi_forecasts.py -x <nr> -y <nr> -w <0.5-1.5> -l <0|1|2>  -m <nr_bytes> or --lat <nr> --lon <nr> --Windfact <0.5-1.5> --logreq <0|1|2> --maxlog <nr_bytes>")
         exit()
 
     logreq = int(logreq)
-    if logreq != 1 :
+    if logreq not in (1, 2) :
         logreq = 0
 
     return(my_lat, my_lon, wind_force_factor, logreq, max_log_len)
@@ -337,48 +695,164 @@ def  get_exec_str(exec_args) :
     return(exec_str)
 
 
-def send_mail_via_gmail(mail_from, gmail_app_pwd, mail_to, mail_subject, mail_msg)  :
+def open_smtp_connection(mail_pars) :
+    # One connection for all queued mails. Gmail needs STARTTLS and an "app password".
+    # No login without STARTTLS, the password would be sent in clear text. Unless smtp_login_without_tls = y.
     # Send to a dedicated (not so serious) user-of-your-own and from there forward to your real user.
     # The "gmail_app_pwd" will be visible.
     # Google "Sign in using app passwords" to get more.
-    try:
-        s = smtplib.SMTP('smtp.gmail.com', 587)
+    import smtplib      # Only when a mail is sent.
+    s = smtplib.SMTP(mail_pars["smtp_host"], int(mail_pars["smtp_port"]), timeout=30)
+    s.ehlo()
+    if s.has_extn("starttls") :
         s.starttls()
-        s.login(mail_from, gmail_app_pwd)
+        s.ehlo()
+    elif mail_pars["smtp_login_without_tls"] != "y" :
+        s.close()
+        raise smtplib.SMTPNotSupportedError(mail_pars["smtp_host"]+" does not offer STARTTLS. See smtp_login_without_tls.")
 
+    if s.has_extn("auth") :
+        s.login(mail_pars["mail_user"], mail_pars["gmail_app_pwd"])
+
+    return(s)
+
+
+def send_mail_via_smtp(s, mail_from, mail_to, mail_subject, mail_msg)  :
+    # False when the mail was refused. The connection is lost: SMTPServerDisconnected or OSError is raised.
+    import smtplib
+    try:
+        from email.mime.text import MIMEText
         msg = MIMEText(mail_msg)
         msg['Subject'] = mail_subject
-
         s.sendmail(mail_from, mail_to, msg.as_string())
-        s.quit()
-    except :
+    except smtplib.SMTPServerDisconnected :
+        raise
+    except smtplib.SMTPException :
+        return(False)
+    except OSError :
+        raise               # The socket. SMTPException is an OSError too.
+    except Exception :
         return(False)
 
     return(True)
 
 
+def get_request_ring_file(endpoint) :
+    return(te["g_request_ring_dir"]+"/"+re.sub(r"[^\w.-]", "_", endpoint)+".ring")
+
+
+def create_request_ring(fi) :
+    # Header + request_ring_nr_slots empty slots. The size never changes after this.
+    os.makedirs(te["g_request_ring_dir"], exist_ok=True)
+    f = open(fi, "wb")
+    f.write(struct.pack(request_ring_header, request_ring_magic, request_ring_nr_slots, request_ring_slot_size, 0))
+    f.truncate(struct.calcsize(request_ring_header) + request_ring_nr_slots * request_ring_slot_size)
+    f.close()
+
+
+def write_request_ring(endpoint, rec) :
+    # The exchange replaces the oldest one in the ring file of the endpoint.
+    data = zlib.compress(json.dumps(rec, ensure_ascii=False).encode("utf8"))
+    while len(data) > request_ring_slot_size - 4 and len(rec["content"]) > 0 :
+        rec["content"] = rec["content"][0:len(rec["content"])//2]
+        rec["content_truncated"] = True
+        data = zlib.compress(json.dumps(rec, ensure_ascii=False).encode("utf8"))
+
+    fi = get_request_ring_file(endpoint)
+    if not os.path.isfile(fi) :
+        create_request_ring(fi)
+
+    f = open(fi, "r+b")
+    if fcntl is not None :
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+    header_size = struct.calcsize(request_ring_header)
+    magic, nr_slots, slot_size, next_slot = struct.unpack(request_ring_header, f.read(header_size))
+    if magic != request_ring_magic or len(data) > slot_size - 4 :
+        f.close()
+        return("")
+
+    f.seek(header_size + next_slot * slot_size)
+    f.write(struct.pack("<I", len(data)) + data)
+    f.seek(0)
+    f.write(struct.pack(request_ring_header, magic, nr_slots, slot_size, (next_slot + 1) % nr_slots))
+    f.close()           # Also unlocks.
+    return(fi)
+
+
+def read_request_ring(fi) :
+    # The exchanges in a ring file. The oldest first.
+    recs = []
+    f = open(fi, "rb")
+    header_size = struct.calcsize(request_ring_header)
+    magic, nr_slots, slot_size, next_slot = struct.unpack(request_ring_header, f.read(header_size))
+    if magic != request_ring_magic :
+        f.close()
+        return(recs)
+
+    for i in range(nr_slots) :
+        f.seek(header_size + ((next_slot + i) % nr_slots) * slot_size)
+        length = struct.unpack("<I", f.read(4))[0]
+        if length == 0 :
+            continue
+
+        recs.append(json.loads(zlib.decompress(f.read(length)).decode("utf8")))
+
+    f.close()
+    return(recs)
+
+
+def get_request_text(data) :
+    if data is None :
+        return("")
+
+    if isinstance(data, bytes) :
+        return(data.decode("utf8", errors="replace"))
+
+    return(str(data))
+
+
+def get_masked_url(url) :
+    # ...&securityToken=abc&... => ...&securityToken=***&... Also the fields of request_masked_fields.
+    for par in request_masked_params + request_masked_fields :
+        url = re.sub("([?&]"+re.escape(par)+"=)[^&]*", r"\g<1>***", url)
+    return(url)
+
+
+def get_masked_headers(headers) :
+    # {"Authorization": "Bearer abc"} => {"Authorization": "***"}. The code in a Location: ...?code=abc is masked too.
+    return({key: ("***" if key.lower() in request_masked_headers else get_masked_text(val)) for key, val in headers.items()})
+
+
+def get_masked_text(text) :
+    # A form, password=abc&x=1, or JSON, "password": "abc", => password=***&x=1, "password": "***"
+    for field in request_masked_fields :
+        text = re.sub("((?:^|[?&])"+re.escape(field)+"=)[^&]*", r"\g<1>***", text)
+        text = re.sub('("'+re.escape(field)+'"\\s*:\\s*)"[^"]*"', r'\g<1>"***"', text)
+    return(text)
+
+
 def log_request(func, req, logreq, max_log_len) :
+    # The whole exchange is kept in a ring file per endpoint in var/log/requests. Read them with pgart_dump_requests.py.
+    # Just one line is printed. Credentials are masked. The request body only with logreq 2.
+    g_request_status.code = req.status_code        # For is_retryable().
     if logreq == 0 :
         return()
 
     dt = datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M:%S")
-    print("\n"+dt+" BEGIN: "+func)
-    print("\nreq.request")
-    print(req.request)
-    print("\nreq.request.url")
-    print(req.request.url)
-    print("\nreq.request.headers")
-    print(req.request.headers)
-    if len(req.text) > int(max_log_len) :
-        print("\n"+g_ui_text["t31"]+str(len(req.text))+" max:"+str(max_log_len))
-    else :
-        print("\nreq.request.body")
-        print(req.request.body)
-        print("\nreq.content")
-        print(req.content)
+    func = func.strip(": \n\t")
+    url = get_masked_url(req.request.url)
+    endpoint = func+" "+urlparse(url).netloc
+    rec = {
+           "dt": dt, "func": func, "method": req.request.method, "url": url, "status": req.status_code,
+           "elapsed_ms": int(req.elapsed.total_seconds() * 1000),
+           "request_headers": get_masked_headers(req.request.headers),
+           "request_body": get_masked_text(get_request_text(req.request.body)) if logreq == 2 else "",
+           "response_headers": get_masked_headers(req.headers), "content_len": len(req.content),
+           "content": get_masked_text(req.text[0:int(max_log_len)]), "content_truncated": len(req.text) > int(max_log_len)}
 
-    print("\n"+dt+" END: "+func)
-    print("\n")
+    fi = write_request_ring(endpoint, rec)
+    print(dt+" "+func+" "+req.request.method+" "+url+" status:"+str(req.status_code)+" bytes:"+str(len(req.content))+" => "+fi)
 
 
 def print_json_var(verbose_logging, verbose_nr, var, json_var) :
@@ -389,18 +863,29 @@ def print_json_var(verbose_logging, verbose_nr, var, json_var) :
 
 
 def get_hourly_rates(fi_hourly_rate):
-    hr_rates = {}
+    # {hour: price}. Per quarter the mean of the hour. See pgart_price_store_func.get_price_series() for the slots.
+    return(f14.get_hour_means(f14.read_price_series(fi_hourly_rate)))
+
+
+def get_hourly_rate_recs(slots) :
+    # [(hour, minute, price)] from a site => the lines of the hourly rate file.
+    # 14:38.28 when all are whole hours, else 14:15:38.28 per slot.
+    per_hour = all(minute == 0 for hour, minute, price in slots)
+    recs = []
+    for hour, minute, price in slots :
+        if per_hour :
+            recs.append("{:02d}".format(hour)+":"+str(price))
+        else :
+            recs.append("{:02d}:{:02d}".format(hour, minute)+":"+str(price))
 
-    fi = Path(fi_hourly_rate)
-    if fi.is_file():
-        f = open(fi_hourly_rate, 'r' , encoding="utf8")
-        for rec in f:
-            rec = rec.strip()
-            s = rec.split(":")     # 14:38.28
-            hr_rates.update({int(s[0]): float(s[1])})
+    return(recs)
 
-        f.close()
-    return(hr_rates)
+
+def get_slot_label(label) :
+    # The start of a period from a site => (hour, minute). "14 - 15" => (14, 0). "14:15 - 14:30" => (14, 15).
+    start = label.split("-")[0].strip()
+    buf = start.split(":")
+    return(int(buf[0]), int(buf[1]) if len(buf) > 1 else 0)
 
 
 def print_hourly_rates() :
@@ -428,28 +913,33 @@ def print_monthly_rates() :
     print(json.dumps(hr_rates, indent=4))
 
 
-def get_forecast_short() :
+def get_forecast_short(recs=None) :
     forecast_short = {}
 
-    filepath = Path(te["fi_forecast_short"])
-    if filepath.is_file():
-        f = open(te["fi_forecast_short"], "r", encoding="utf8")
-        for rec in f:
-            rec = rec.strip()
-            s = rec.split(":", 1)
-            forecast_short.update({s[0]: s[1]})
+    if recs is None :
+        filepath = Path(te["fi_forecast_short"])
+        if not filepath.is_file():
+            return(forecast_short)
+
+        recs = read_recs(te["fi_forecast_short"])
+
+    for rec in recs:
+        rec = rec.strip()
+        s = rec.split(":", 1)
+        forecast_short.update({s[0]: s[1]})
 
-        f.close()
     return(forecast_short)
 
 
-def is_forecast_short_proper() :
-    fi = Path(te["fi_forecast_short"])
-    if not fi.is_file():
-        return(False, te["fi_forecast_short"]+" missing.")
+def is_forecast_short_proper(recs=None) :
+    if recs is None :
+        fi = Path(te["fi_forecast_short"])
+        if not fi.is_file():
+            return(False, te["fi_forecast_short"]+" missing.")
+
+        recs = read_recs(te["fi_forecast_short"])
 
-    f = open(te["fi_forecast_short"], "r", encoding="utf8")
-    for rec in f:
+    for rec in recs:
         rec = rec.strip()
         rec = "".join(rec.split())
         # Check the format. 2023-01-17_20:0.8,6.8
@@ -506,7 +996,6 @@ def is_forecast_short_proper() :
             log_action(info, False)
             return(False, info)
 
-    f.close()
     return(True, "")
 
 
@@ -515,55 +1004,45 @@ def print_forecast_short() :
     print(json.dumps(json_smhi_short, indent=4))
 
 
-def get_ext_temp_reading() :
-    filepath = Path(te["fi_indoor_temp_reading"])
-    if filepath.is_file():
-        f = open(te["fi_indoor_temp_reading"], "r", encoding="utf8")
-        for rec in f:
-            rec = rec.strip()
-            rec = "".join(rec.split())
-            # Check the format. 2023-01-17_20:02:01,20.4
-            if rec.count(",") != 1 :
-                info = "get_ext_temp_reading:\n\t"+te["fi_indoor_temp_reading"]+". "+rec+". "+g_ui_text["tp5d1"]
-                log_action(info, False)
-                return(False, info, 0, 0)
-
-            buf = rec.split(",", 1)
-            # Valid date?
-            try:
-                res = bool(datetime.strptime(buf[0], "%Y-%m-%d_%H:%M:%S"))
-            except ValueError:
-                info = "get_ext_temp_reading:\n\t"+te["fi_indoor_temp_reading"]+". "+rec+". "+g_ui_text["tp5f1"]
-                log_action(info, False)
-                return(False, info, 0, 0)
+def get_ext_temp_reading(recs=None) :
+    if recs is None :
+        filepath = Path(te["fi_indoor_temp_reading"])
+        if not filepath.is_file():
+            return(False, "No file", 0, 0)
 
-            if not is_float(buf[1]) :
-                info = "get_ext_temp_reading:\n\t"+te["fi_indoor_temp_reading"]+". "+rec+". "+g_ui_text["th4"]
-                log_action(info, False)
-                return(False, info, 0, 0)
-        f.close()
-    else :
+        recs = read_recs(te["fi_indoor_temp_reading"])
+
+    if len(recs) == 0 :
         return(False, "No file", 0, 0)
 
-    return(True, "ok", buf[0], buf[1])
+    for rec in recs:
+        rec = rec.strip()
+        rec = "".join(rec.split())
+        # Check the format. 2023-01-17_20:02:01,20.4
+        if rec.count(",") != 1 :
+            info = "get_ext_temp_reading:\n\t"+te["fi_indoor_temp_reading"]+". "+rec+". "+g_ui_text["tp5d1"]
+            log_action(info, False)
+            return(False, info, 0, 0)
 
+        buf = rec.split(",", 1)
+        # Valid date?
+        try:
+            res = bool(datetime.strptime(buf[0], "%Y-%m-%d_%H:%M:%S"))
+        except ValueError:
+            info = "get_ext_temp_reading:\n\t"+te["fi_indoor_temp_reading"]+". "+rec+". "+g_ui_text["tp5f1"]
+            log_action(info, False)
+            return(False, info, 0, 0)
 
-def get_language() :
-    filepath = Path(te["fi_language"])
-    if filepath.is_file():
-        f = open(te["fi_language"], "r", encoding="utf8")
-        for rec in f:
-            rec = rec.strip()
-            if rec == "":
-                continue
+        if not is_float(buf[1]) :
+            info = "get_ext_temp_reading:\n\t"+te["fi_indoor_temp_reading"]+". "+rec+". "+g_ui_text["th4"]
+            log_action(info, False)
+            return(False, info, 0, 0)
 
-            if rec.find("#", 0 , 1) == 0:
-                continue
+    return(True, "ok", buf[0], buf[1])
 
-            rec = rec.strip()
-            if rec == "se" or rec == "en" :
-                return(rec)
-            return("se")
+
+def get_language() :
+    return(f8.get_language())
 
 
 def is_mailaddress_valid(address):
@@ -578,7 +1057,11 @@ def is_mailaddress_valid(address):
 
 
 def get_mail_params() :
-    # Get the mail parameters from the config file.
+    # Get the mail parameters from the config file. Once per run.
+    global g_mail_pars
+    if g_mail_pars is not None :
+        return(g_mail_pars)
+
     l_general_pars = f1.default_config_parameters()
     valid_par = f1.valid_config_parameters()
     mail_pars = {}
@@ -617,6 +1100,17 @@ def get_mail_params() :
                     print(par+": "+val+" "+g_ui_text["tp14"]+": "+valid_pars[1])
                     exit()
 
+            elif valid_pars[0] == "int_range" :
+                ir = valid_pars[1].split('-')
+                if not val.isnumeric() or int(val) < int(ir[0]) or int(val) > int(ir[1]) :
+                    print(par+": "+val+" "+g_ui_text["tp14"]+": "+valid_pars[1])
+                    exit()
+
+            elif valid_pars[0] == "txt_single" :
+                if not val in valid_pars[1].split(",") :
+                    print(par+": "+val+" "+g_ui_text["tp14"]+": "+valid_pars[1])
+                    exit()
+
             elif valid_pars[0] == "mailaddress" :
                 if val != "none" :
                     valid_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
@@ -629,35 +1123,159 @@ def get_mail_params() :
 
         if len(mail_pars) == 0 :
             print("get_mail_params:"+te["fi_mail_params"]+" "+g_ui_text["t5a"])
+        else :
+            for par in ["mail_user", "gmail_app_pwd", "mail_subject", "smtp_host", "smtp_port", "mail_dedup_minutes",
+                        "smtp_login_without_tls"] :
+                if not par in mail_pars :
+                    mail_pars.update({par: l_general_pars[par]})
 
+        g_mail_pars = mail_pars
         return(mail_pars)
     else:
         print(te["fi_mail_params"]+" "+g_ui_text["t5"])
         exit()
 
 
+def get_mail_key(msg) :
+    # The same message but at another time is a duplicate. "2024-01-10_07:02:03 txt" => "txt"
+    txt = re.sub(r"^\d{4}-\d{2}-\d{2}[_ ]\d{2}:\d{2}:\d{2}\s*", "", msg)
+    return(hashlib.sha256(txt.encode("utf8")).hexdigest()[0:16])
+
+
 def send_mail(msg) :
+    # The mail is put in var/spool/mail and sent by pgart_send_mail_queue.py when this program ends.
+    # A duplicate of a mail already in the queue just increases its count.
     mail_pars = get_mail_params()
-    if len(mail_pars) > 0 :
-        if mail_pars["mail_user"] != "none" :
-            if not send_mail_via_gmail(
-                    mail_pars["mail_user"], mail_pars["gmail_app_pwd"],
-                    mail_pars["mail_user"], mail_pars["mail_subject"],
-                    msg) :
-                log_action_1("send_mail_via_gmail:\n\tfailed. "+mail_pars["mail_user"]+" "+mail_pars["mail_subject"])
+    if len(mail_pars) == 0 or mail_pars["mail_user"] == "none" :
+        return()
 
-            log_action_1("send_mail_via_gmail:\n\tok. "+mail_pars["mail_user"]+" "+mail_pars["mail_subject"])
+    os.makedirs(te["g_mail_spool_dir"], exist_ok=True)
+    dt = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+    key = get_mail_key(msg)
+    fi_spool = te["g_mail_spool_dir"]+"/"+key+".json"
+    rec = {"key": key, "first_dt": dt, "last_dt": dt, "count": 0, "attempts": 0, "msg": msg}
+    if os.path.isfile(fi_spool) :
+        try :
+            f = open(fi_spool, "r", encoding="utf8")
+            rec = json.load(f)
+            f.close()
+        except (OSError, ValueError) :
+            pass
+
+    rec["last_dt"] = dt
+    rec["count"] += 1
+    fi_tmp = fi_spool+".tmp"
+    f = open(fi_tmp, "w", encoding="utf8")
+    json.dump(rec, f, ensure_ascii=False)
+    f.close()
+    os.replace(fi_tmp, fi_spool)
 
+    if rec["count"] == 1 :
+        log_action_1("send_mail:\n\tqueued. "+mail_pars["mail_user"]+" "+mail_pars["mail_subject"])
+    else :
+        log_action_1("send_mail:\n\tmerged. "+mail_pars["mail_user"]+" "+mail_pars["mail_subject"]+" count:"+str(rec["count"]))
 
-def log_action_1(txt) :
-    dt = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
-    f = open(te["fi_action_log"] , "a", encoding="utf8")
+
+def start_background_pgm(pgm) :
+    # Started in its own session. This program does not wait for it and it is not stopped when this one ends.
+    try :
+        subprocess.Popen(
+                         ["/usr/bin/python3", te["g_bin_dir"]+"/"+pgm],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         start_new_session=True)
+    except OSError as err :
+        log_action_1("start_background_pgm:\n\tfailed. "+pgm+" "+str(err))
+
+
+def start_mail_queue_worker() :
+    # Send the queued mails in the background. This program does not wait for the SMTP server.
+    global g_mail_worker_started
+    if g_mail_worker_started :
+        return()
+
+    if len(glob.glob(te["g_mail_spool_dir"]+"/*.json")) == 0 :
+        return()
+
+    g_mail_worker_started = True
+    start_background_pgm("pgart_send_mail_queue.py")
+
+
+def set_action_log_format(action_log_format) :
+    # Lines logged before this call are also written in the new format. Nothing is written until the flush.
+    global g_action_log_format
+    g_action_log_format = action_log_format
+
+
+def get_action_log_json_rec(dt, txt) :
+    # One json line with fixed fields. Like: "tcp_get_indoor_temperature:\n\tstatus:ok. heating_effect:21"
+    # => function:tcp_get_indoor_temperature event:info values:{status:ok, heating_effect:21}
+    rec = {"timestamp": dt, "function": "-", "event": "info", "values": {}, "text": txt}
     if txt == "" :
-        f.write("- - - - - - - - - - - - - - - - - - - - \n")
+        rec["event"] = "separator"
+        return(rec)
+
+    if txt == "Aborted." :
+        rec["event"] = "aborted"
+        return(rec)
+
+    if txt.endswith(" Forced exit.") :
+        rec["event"] = "forced_exit"
+
+    buf = txt.split(":", 1)
+    func = buf[0].strip()
+    msg = ""
+    if len(buf) == 2 :
+        msg = buf[1]
+
+    if func[0:4] in ["Get ", "Set ", "Del "] :          # A setting. "Set hourly_rate:\n\ttext"
+        rec["function"] = "settings"
+        rec["event"] = func[0:3].lower()
+        rec["values"]["key"] = func[4:]
+    elif func.find(" ") == -1 :
+        rec["function"] = func
     else :
-        f.write(dt+" "+txt+"\n\n")
+        msg = txt
 
-    f.close()
+    for par, val in re.findall(r"([A-Za-z_/]+):(-?[\w.\-/]+)", msg) :
+        rec["values"][par] = val.rstrip(".")
+
+    return(rec)
+
+
+def flush_action_log() :
+    # All lines of the run are written with one open/close per file.
+    global g_action_log_recs
+    with g_action_log_lock :
+        recs = g_action_log_recs
+        g_action_log_recs = []
+
+    if len(recs) == 0 :
+        return()
+
+    if g_action_log_format in ["text", "both"] :
+        f = open(te["fi_action_log"] , "a", encoding="utf8")
+        for dt, txt in recs :
+            if txt == "" :
+                f.write("- - - - - - - - - - - - - - - - - - - - \n")
+            else :
+                f.write(dt+" "+txt+"\n\n")
+        f.close()
+
+    if g_action_log_format in ["json", "both"] :
+        f = open(te["fi_action_log_json"] , "a", encoding="utf8")
+        for dt, txt in recs :
+            f.write(json.dumps(get_action_log_json_rec(dt, txt), ensure_ascii=False)+"\n")
+        f.close()
+
+
+atexit.register(flush_action_log)
+atexit.register(start_mail_queue_worker)      # Runs before flush_action_log(). The last registered runs first.
+
+
+def log_action_1(txt) :
+    dt = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+    with g_action_log_lock :
+        g_action_log_recs.append((dt, txt))
 
 
 def log_action(txt, exit_now) :
@@ -671,6 +1289,7 @@ def log_action(txt, exit_now) :
         print(dt+" "+txt)
         send_mail(dt+" "+txt)
         log_action_1("Aborted.")
+        flush_action_log()
         exit()
 
 
@@ -680,51 +1299,152 @@ def os_rename(fi, new_fi) :
     os.rename(fo, fn)
 
 
-def rename_files_to_increased_appendix_nr(fi_current, keep_nr_versions) :
-    # Keep some files. fi_current fi_current.1 fi_current.2 ...
-    fi_parts = fi_current.split(".")   #Get the last part of the current file.
-    fi_current_extension = fi_parts[len(fi_parts) - 1]
-
-    fi_names = []
-    for fi in glob.glob(fi_current+'*') :   # get all such files.
-        fi_names.append(fi)
-
-    #Rename the files to a higher index
-    fi_names.sort(reverse=True)
-    for fi in fi_names :
-        if fi.endswith('.'+fi_current_extension) :  # The last file now. The one without an index. Rename it to index 1
-            new_fi =  fi + ".1"
-            os_rename(fi, new_fi)
-        else:                                       # Shift up one step or delete.
-            fi_parts = fi.split(".")
-            ix = fi_parts[len(fi_parts) - 1]
-            if not ix.isdigit() :
-                continue
+def get_rotated_log_files() :
+    # The names used in rotate_log_limits.
+    return({
+            "hourly_run": te["fi_hourly_run_log"],
+            "action": te["fi_action_log"],
+            "action_json": te["fi_action_log_json"],
+            "windchill_stats": te["fi_windchill_stats"],
+            "summary_run": te["fi_run_summary_log"]})
 
-            if int(ix) >= keep_nr_versions :        # Just keep keep_nr_versions files.
-                fi = Path(fi)
-                os.remove(fi)
-            else :
-                ix_ind = fi.rfind(ix)
-                new_fi =  fi[0:ix_ind] + str(int(ix) + 1)   # Increase the index.
-                os_rename(fi, new_fi)
 
+def get_log_rotate_limits(rotate_log_limits) :
+    # "hourly_run:2048_7,action:1024_7" => {"hourly_run": (2048, 7), "action": (1024, 7)...}
+    # Kbytes_days. 0 = no limit. Logs not in rotate_log_limits get the default limits.
+    limits = {}
+    for pars in [f1.default_config_parameters()["rotate_log_limits"], rotate_log_limits] :
+        for x in "".join(pars.split()).split(',') :
+            name, kb_days = x.split(':')
+            kbytes, days = kb_days.split('_')
+            limits.update({name: (int(kbytes), int(days))})
 
-def rotate_log_files(keep_nr_rotated_log_files) :
-    last_dt = "-"
-    dt_now = datetime.strftime(datetime.now(), "%Y-%m-%d")
-    fi = Path(te["fi_last_log_rotate"])
-    if fi.is_file():
-        f = open(te["fi_last_log_rotate"], 'r' , encoding="utf8")
-        last_dt = f.readline().strip()
+    return(limits)
+
+
+def get_log_generation_key(fi_log, fi) :
+    # action.log.20240115T020312[.gz] or the old style action.log.3 (older than any timestamped one.)
+    suffix = fi[len(fi_log)+1:]
+    if suffix.endswith(".gz") :
+        suffix = suffix[0:-len(".gz")]
+
+    if suffix.isdigit() :
+        return((0, -int(suffix)))
+
+    if re.fullmatch(r"\d{8}T\d{6}", suffix) :
+        return((1, suffix))
+
+    return(None)
+
+
+def get_log_generations(fi_log) :
+    # The rotated generations of fi_log. The oldest first.
+    gens = []
+    for fi in glob.glob(fi_log+".*") :
+        key = get_log_generation_key(fi_log, fi)
+        if key is not None :
+            gens.append((key, fi))
+
+    gens.sort()
+    return([fi for key, fi in gens])
+
+
+def open_log_file(fi) :
+    # A rotated generation may be compressed.
+    if fi.endswith(".gz") :
+        import gzip
+        return(gzip.open(fi, "rt", encoding="utf8"))
+
+    return(open(fi, "r", encoding="utf8"))
+
+
+def read_log_lines(fi_log) :
+    # All lines of all generations and the current log. The oldest first. One line at a time.
+    for fi in get_log_generations(fi_log)+[fi_log] :
+        if not os.path.isfile(fi) :
+            continue
+
+        f = open_log_file(fi)
+        for rec in f :
+            yield rec
         f.close()
 
-    if last_dt != dt_now :
-        rename_files_to_increased_appendix_nr(te["fi_windchill_stats"], keep_nr_rotated_log_files)
-        rename_files_to_increased_appendix_nr(te["fi_action_log"], keep_nr_rotated_log_files)
-        rename_files_to_increased_appendix_nr(te["fi_hourly_run_log"], keep_nr_rotated_log_files)
-        rename_files_to_increased_appendix_nr(te["fi_run_summary_log"], keep_nr_rotated_log_files)
 
-        f = open(te["fi_last_log_rotate"], "w", encoding="utf8")
-        f.write(dt_now+"\n")
+def get_log_rotate_status() :
+    # {"action": "2024-01-15 02:03:12"...} when the current log was started.
+    status = {}
+    try :
+        f = open(te["fi_last_log_rotate"], "r", encoding="utf8")
+        status = json.load(f)
         f.close()
+    except (OSError, ValueError) :      # Missing or the old format with just a date.
+        pass
+
+    if not isinstance(status, dict) :
+        status = {}
+
+    return(status)
+
+
+def save_log_rotate_status(status) :
+    fi_tmp = te["fi_last_log_rotate"]+".tmp"
+    f = open(fi_tmp, "w", encoding="utf8")
+    json.dump(status, f, indent=4)
+    f.close()
+    os.replace(fi_tmp, te["fi_last_log_rotate"])
+
+
+def remove_old_log_generations(fi_log, keep_nr_versions) :
+    gens = get_log_generations(fi_log)
+    for fi in gens[0:max(0, len(gens) - keep_nr_versions)] :
+        os.remove(fi)
+
+
+def is_log_compression_needed() :
+    # The newest generation is not compressed. It can still be written to, like hourly_run.log by cron's >>.
+    for fi_log in get_rotated_log_files().values() :
+        for fi in get_log_generations(fi_log)[0:-1] :
+            if not fi.endswith(".gz") :
+                return(True)
+
+    return(False)
+
+
+def rotate_log_files(keep_nr_rotated_log_files, rotate_log_limits) :
+    # Checked every run. A log is rotated when it is bigger or older than its limits in rotate_log_limits.
+    # Rotation is a rename to a timestamped name. The older generations are gzipped in the background.
+    limits = get_log_rotate_limits(rotate_log_limits)
+    status = get_log_rotate_status()
+    dt_now = datetime.now()
+    dt_now_str = datetime.strftime(dt_now, "%Y-%m-%d %H:%M:%S")
+    status_changed = False
+    for name, fi_log in get_rotated_log_files().items() :
+        if not os.path.isfile(fi_log) :
+            continue
+
+        if not name in status :
+            status.update({name: dt_now_str})
+            status_changed = True
+
+        kbytes, days = limits[name]
+        log_started = datetime.strptime(status[name], "%Y-%m-%d %H:%M:%S")
+        too_big = kbytes > 0 and os.path.getsize(fi_log) > kbytes * 1024
+        too_old = days > 0 and dt_now - log_started >= timedelta(days=days)
+        if not (too_big or too_old) :
+            continue
+
+        if name in ["action", "action_json"] :
+            flush_action_log()      # What is logged so far belongs to the rotated file.
+
+        new_fi = fi_log+"."+datetime.strftime(dt_now, "%Y%m%dT%H%M%S")
+        os_rename(fi_log, new_fi)
+        remove_old_log_generations(fi_log, keep_nr_rotated_log_files)
+        status.update({name: dt_now_str})
+        status_changed = True
+        log_action_1("rotate_log_files:\n\t"+fi_log+" => "+new_fi+" kbytes:"+str(int(os.path.getsize(new_fi)/1024))+" since:"+log_started.strftime("%Y-%m-%d"))
+
+    if status_changed :
+        save_log_rotate_status(status)
+
+    if is_log_compression_needed() :
+        start_background_pgm("pgart_compress_log_files.py")
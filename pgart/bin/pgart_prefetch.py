@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# Fetches tomorrow's hourly rates and the forecasts before pgart_control_heating.py needs them. For cron.
+# pgart_control_heating_daemon.py does the same between its runs with prefetch = y.
+#   pgart_prefetch.py       what is due. The forecasts when the run at daemon_run_minute is within prefetch_forecast_minutes_before.
+#   pgart_prefetch.py -f    the forecasts now and the missing hourly rates.
+# See xtra_cron/help_cron.txt.
+
+import getopt, sys
+
+from datetime import datetime,timedelta
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_lang_func as f8
+import pgart_read_control_params_func as f7
+import pgart_prefetch_func as f12
+
+g_lang = f8.get_language()
+g_ui_text = f1.ui_texts(g_lang)
+te = f1.get_pgart_env()
+
+
+def get_args() :
+    argv = sys.argv[1:]     # Bypass my own name
+    options = "f"
+    long_options = ["force"]
+    force = False
+    try:
+        args, values = getopt.getopt(argv, options, long_options)
+        for arg, val in args :
+            if arg in ("-f", "--force") :
+                force = True
+    except getopt.error as err :
+        print(str(err))
+        print("usage: pgart_prefetch.py -f")
+        exit()
+
+    return(force)
+
+
+def get_next_run(run_minute) :
+    # As in pgart_control_heating_daemon.py. The cron line of pgart_control_heating.py has the same minute.
+    now = datetime.now()
+    next_run = now.replace(minute=run_minute, second=0, microsecond=0)
+    if next_run <= now :
+        next_run = next_run + timedelta(hours=1)
+
+    return(next_run)
+
+
+force = get_args()
+ret_stat, general_pars, weekday_indoor_temp_hours = f7.get_parameters()
+if ret_stat != "ok" :
+    f0.log_action("pgart_prefetch: "+ret_stat, True)
+
+jobs = f12.get_prefetch_jobs(general_pars, get_next_run(int(general_pars['daemon_run_minute'])), force)
+if len(jobs) == 0 :
+    print("pgart_prefetch: nothing is due.")
+else :
+    print(f12.run_prefetch(jobs))
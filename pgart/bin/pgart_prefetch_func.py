@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# Fetches the inputs before pgart_control_heating.py needs them. The run then finds them in var and var/local.
+# - The hourly rates of tomorrow from prefetch_hourly_rates_from_hour, when they are published, and of today if missing.
+#   Only by a plugin program that can fetch another day, fetches_tomorrow in pgart_get_hourly_rates_*.py. Otherwise by the run.
+# - The forecasts prefetch_forecast_minutes_before the run. Used by the run if not older than forecast_max_age.
+# Called by pgart_control_heating_daemon.py between the runs and by pgart_prefetch.py from cron.
+
+import os
+import time
+
+from pathlib import Path
+from datetime import datetime,timedelta
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+
+te = f1.get_pgart_env()
+
+prefetch_retry = 900        # Seconds. Tomorrow's rates are not published yet. Or the site is down.
+prefetch_timeout = 120      # Seconds. For all the prefetches together. Not a run, there is no run_time_budget.
+
+g_prefetch = {"hourly_rates": {}, "forecast_for": None}     # {day: time.time() of the last attempt}, the run of the last forecast.
+
+
+def is_hourly_rates_needed(general_pars) :
+    # As get_hourly_rates_input() in pgart_control_heating.py.
+    return(general_pars['use_hourly_rates'] == "y" or int(general_pars['hourly_rate_decrease_during_top_hours']) > 0
+           or general_pars['create_hourly_rates'] == "y")
+
+
+def get_prefetch_rates_module(general_pars) :
+    # The plugin program that can fetch the rates of tomorrow. None for a user program.
+    pgm = general_pars['pgm_create_hourly_rates']
+    if general_pars['external_pgm_create_hourly_rates'] != "," or not f0.is_plugin_pgm(pgm) :
+        return(None)
+
+    module = f0.get_plugin_module(pgm)
+    if not getattr(module, "fetches_tomorrow", False) :
+        return(None)
+
+    return(module)
+
+
+def is_forecast_fresh(general_pars) :
+    # A forecast_short file not older than forecast_max_age minutes is used by the run as it is.
+    max_age = int(general_pars['forecast_max_age']) * 60
+    try :
+        age = time.time() - os.path.getmtime(te["fi_forecast_short"])
+    except OSError :
+        return(False)
+
+    if age > max_age :
+        return(False)
+
+    status, info = f0.is_forecast_short_proper()
+    return(status)
+
+
+def get_due_rate_days(general_pars, now) :
+    # The days with a missing hourly rate file that may be fetched now.
+    if not is_hourly_rates_needed(general_pars) or get_prefetch_rates_module(general_pars) is None :
+        return([])
+
+    days = [now]
+    if now.hour >= int(general_pars['prefetch_hourly_rates_from_hour']) :
+        days.append(now + timedelta(1))
+
+    due = []
+    for day in days :
+        if Path(f1.get_fi_hourly_rate(day)).is_file() :
+            continue
+
+        if time.time() - g_prefetch["hourly_rates"].get(day.date(), 0) < prefetch_retry :
+            continue
+
+        due.append(day)
+
+    return(due)
+
+
+def is_forecast_due(general_pars, next_run) :
+    # next_run: datetime of the next run of pgart_control_heating.py. One forecast per run.
+    if general_pars['use_windchill_compensation'] != "y" or g_prefetch["forecast_for"] == next_run :
+        return(False)
+
+    if int(datetime.now().strftime("%m")) not in [int(x) for x in general_pars['set_indoor_temp_months'].split(',')] :
+        return(False)
+
+    return(0 < (next_run - datetime.now()).total_seconds() <= int(general_pars['prefetch_forecast_minutes_before']) * 60)
+
+
+def prefetch_hourly_rates(general_pars, day) :
+    status, recs = f0.run_plugin_fetch(
+                                       "hourly_rates", get_prefetch_rates_module(general_pars).fetch,
+                                       (general_pars['el_area'], 0, general_pars['max_log_len']), day)
+    return(status)
+
+
+def prefetch_forecast(general_pars) :
+    # As create_forecasts() in pgart_control_heating.py.
+    if general_pars['external_pgm_create_forecasts'] == "," :
+        status, recs = f0.exec_plugin_pgm(
+                                          "forecast", "pgart_get_smhi_forecasts.py",
+                                          (general_pars['my_lat'], general_pars['my_lon'], general_pars['windchill_wind_force_factor'],
+                                           0, general_pars['max_log_len']))
+        return(status)
+
+    cmd = "/usr/bin/python3  "+te["g_bin_dir"]+"/"+f0.get_exec_str(general_pars['external_pgm_create_forecasts'])
+    return(f0.exec_external_pgm("forecast", cmd))
+
+
+def get_prefetch_jobs(general_pars, next_run, force=False) :
+    # What is due now, as jobs for run_prefetch(). force: the forecast now and the rates without waiting for prefetch_retry.
+    f1.get_pgart_env()      # A new day.
+    if force :
+        g_prefetch["hourly_rates"].clear()
+
+    jobs = {}
+    for day in get_due_rate_days(general_pars, datetime.now()) :
+        g_prefetch["hourly_rates"][day.date()] = time.time()
+        jobs["hourly_rates_"+datetime.strftime(day, "%Y%m%d")] = (prefetch_hourly_rates, (general_pars, day), prefetch_timeout)
+
+    if force or is_forecast_due(general_pars, next_run) :
+        g_prefetch["forecast_for"] = next_run
+        if force or not is_forecast_fresh(general_pars) :
+            jobs["forecast"] = (prefetch_forecast, (general_pars,), prefetch_timeout)
+
+    return(jobs)
+
+
+def run_prefetch(jobs) :
+    # All at the same time. Returns {name: ok|failed|timeout|error}.
+    results = f0.run_concurrently(jobs)
+    states = {}
+    for name, (state, result) in results.items() :
+        states[name] = state if state != "ok" else "ok" if result else "failed"
+
+    f0.log_action("run_prefetch:\n\t"+", ".join(name+":"+state for name, state in states.items()), False)
+    return(states)
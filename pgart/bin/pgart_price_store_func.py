@@ -0,0 +1,335 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# The prices of any number of days, one store per zone (el_area): var/price_store/<zone>.bin.
+# A slot is (UTC start in seconds, length in minutes, price). The slots are sorted by the start.
+#   get_price(zone, t)              the price of the slot with t. O(1), a dict of the starts.
+#   get_range(zone, t_from, t_to)   the slots in between. O(log n), bisect on the starts.
+# The fetchers still write hourly_rate_yyyymmdd.txt. run_plugin_fetch() also puts the day here.
+# pgart_compact_prices.py folds the existing files into the store.
+# Daylight saving time: the "hh:price" lines of a day are in local time. The day has 23 or 25 hours when the clock is
+# changed, 02 is missing or comes twice. The lines are put on the UTC slots of the day in their order.
+# Resolution: a file has one line per hour, "14:38.28", or one per quarter, "14:15:38.28". 96 quarters, 92 or 100 with DST.
+# get_price_series() parses the lines once into arrays. The control works per hour on the mean of the hour's slots.
+
+import os
+import threading
+
+from array import array
+from bisect import bisect_left,bisect_right
+from datetime import datetime,timedelta
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None        # Windows. Only the lock between the threads.
+
+import pgart_env_func as f1
+
+te = f1.get_pgart_env()
+
+g_series = {}           # fi_hourly_rate: (mtime, series). Parsed once per version of the file.
+g_stores = {}           # zone: {"mtime", "start": array("q"), "minutes": array("h"), "price": array("d"), "index": {start: i}}
+g_store_lock = threading.Lock()
+
+
+def get_fi_store(zone) :
+    return(te["g_price_store_dir"]+"/"+zone+".bin")
+
+
+def get_day_bounds(day) :
+    # (UTC start, UTC end) of the local day in seconds. 23, 24 or 25 hours.
+    d0 = datetime(day.year, day.month, day.day)
+    return(int(d0.timestamp()), int((d0 + timedelta(1)).timestamp()))
+
+
+def get_day_slot_starts(day, minutes=60) :
+    t0, t1 = get_day_bounds(day)
+    return(list(range(t0, t1, minutes * 60)))
+
+
+def get_nr_day_slots(day, minutes=60) :
+    t0, t1 = get_day_bounds(day)
+    return((t1 - t0) // (minutes * 60))
+
+
+def get_rec_slot(rec) :
+    # "14:38.28" => (14, 0, 38.28), an hour. "14:15:38.28" => (14, 15, 38.28), a quarter. ValueError when neither.
+    buf = "".join(rec.split()).split(":")
+    if len(buf) == 2 :
+        return(int(buf[0]), 0, float(buf[1]))
+
+    if len(buf) == 3 :
+        return(int(buf[0]), int(buf[1]), float(buf[2]))
+
+    raise ValueError(rec)
+
+
+def get_recs_minutes(recs) :
+    # 15 when the lines are per quarter, else 60. From the first line, is_hourly_rates_proper() checks the rest.
+    for rec in recs :
+        if rec.strip() != "" :
+            return(15 if "".join(rec.split()).count(":") == 2 else 60)
+
+    return(60)
+
+
+def get_price_series(recs) :
+    # The lines of a day => (minutes, array("b") the hour of each slot, array("d") the prices). In the order of the day.
+    hours = array("b")
+    prices = array("d")
+    for rec in recs :
+        if rec.strip() == "" :
+            continue
+
+        hour, minute, price = get_rec_slot(rec)
+        hours.append(hour)
+        prices.append(price)
+
+    return(get_recs_minutes(recs), hours, prices)
+
+
+def read_price_series(fi_hourly_rate) :
+    # As get_price_series() from the file. An empty series when it is missing or not readable.
+    try :
+        mtime = os.path.getmtime(fi_hourly_rate)
+    except OSError :
+        return(60, array("b"), array("d"))
+
+    cached = g_series.get(fi_hourly_rate)
+    if cached is not None and cached[0] == mtime :
+        return(cached[1])
+
+    f = open(fi_hourly_rate, "r", encoding="utf8")
+    recs = f.read().splitlines()
+    f.close()
+    try :
+        series = get_price_series(recs)
+    except ValueError :
+        series = (60, array("b"), array("d"))
+
+    g_series[fi_hourly_rate] = (mtime, series)
+    return(series)
+
+
+def get_hour_means(series) :
+    # {hour: price}, the mean of the slots of each hour. The two 02 hours of a 25 hour day give one mean.
+    minutes, hours, prices = series
+    sums = {}
+    counts = {}
+    for hour, price in zip(hours, prices) :
+        sums[hour] = sums.get(hour, 0) + price
+        counts[hour] = counts.get(hour, 0) + 1
+
+    return({hour: sums[hour] / counts[hour] for hour in sums})
+
+
+def get_hour_slots(series, hour) :
+    # The prices of the slots of the hour. 1 per hour or 4 per quarter, twice that for 02 of a 25 hour day.
+    minutes, hours, prices = series
+    return([price for h, price in zip(hours, prices) if h == hour])
+
+
+def recs_to_slots(day, recs) :
+    # The lines of a local day => [(UTC start, price)]. None when they do not fit the day.
+    minutes = get_recs_minutes(recs)
+    recs = [rec for rec in recs if rec.strip() != ""]
+    starts = get_day_slot_starts(day, minutes)
+    if len(recs) != len(starts) :
+        return(None)
+
+    slots = []
+    for t, rec in zip(starts, recs) :
+        try :
+            hour, minute, price = get_rec_slot(rec)
+        except ValueError :
+            return(None)
+
+        local = datetime.fromtimestamp(t)
+        if hour != local.hour or minute != local.minute :
+            return(None)        # 02 on a 23 hour day, or not in the order of the day.
+
+        slots.append((t, price))
+
+    return(slots)
+
+
+def read_store(fi) :
+    # nr slots, then the starts, the minutes and the prices.
+    store = {"start": array("q"), "minutes": array("h"), "price": array("d")}
+    if not os.path.isfile(fi) :
+        return(store)
+
+    f = open(fi, "rb")
+    nr = array("q")
+    nr.fromfile(f, 1)
+    for key in ["start", "minutes", "price"] :
+        store[key].fromfile(f, nr[0])
+    f.close()
+    return(store)
+
+
+def load_store(zone) :
+    # Read again when another program has changed it.
+    fi = get_fi_store(zone)
+    try :
+        mtime = os.path.getmtime(fi)
+    except OSError :
+        mtime = 0
+
+    store = g_stores.get(zone)
+    if store is None or store["mtime"] != mtime :
+        store = read_store(fi)
+        store["mtime"] = mtime
+        store["index"] = {t: i for i, t in enumerate(store["start"])}
+        g_stores[zone] = store
+
+    return(store)
+
+
+def save_store(zone, slots) :
+    # slots: {UTC start: (minutes, price)}
+    os.makedirs(te["g_price_store_dir"], exist_ok=True)
+    fi = get_fi_store(zone)
+    starts = sorted(slots)
+    f = open(fi+".tmp", "wb")
+    array("q", [len(starts)]).tofile(f)
+    array("q", starts).tofile(f)
+    array("h", [slots[t][0] for t in starts]).tofile(f)
+    array("d", [slots[t][1] for t in starts]).tofile(f)
+    f.close()
+    os.replace(fi+".tmp", fi)
+
+
+def add_slots(zone, new_slots, minutes=60) :
+    # new_slots: [(UTC start, price)], any number of days. They replace what the store has for the same time.
+    if len(new_slots) == 0 :
+        return()
+
+    os.makedirs(te["g_price_store_dir"], exist_ok=True)
+    with g_store_lock :
+        f_lock = open(get_fi_store(zone)+".lock", "w")
+        if fcntl is not None :
+            fcntl.flock(f_lock, fcntl.LOCK_EX)      # A fetcher started by pgart_control_heating.py could write at the same time.
+
+        store = load_store(zone)
+        new_starts = sorted(t for t, price in new_slots)
+        slots = {}
+        for t, m, price in zip(store["start"], store["minutes"], store["price"]) :
+            j = bisect_right(new_starts, t + m * 60 - 1) - 1      # The last new slot that starts within this one.
+            if j < 0 or new_starts[j] + minutes * 60 <= t :
+                slots[t] = (m, price)
+
+        for t, price in new_slots :
+            slots[t] = (minutes, price)
+
+        save_store(zone, slots)
+        f_lock.close()
+
+
+def add_day(zone, day, recs) :
+    # The lines of the hourly_rate file of the day. Returns False when they do not fit the day.
+    slots = recs_to_slots(day, recs)
+    if slots is None :
+        return(False)
+
+    add_slots(zone, slots, get_recs_minutes(recs))
+    return(True)
+
+
+def get_price(zone, t) :
+    # The price of the slot with t (UTC seconds). None when the store does not have it.
+    store = load_store(zone)
+    for minutes in [15, 60] :
+        i = store["index"].get(t - t % (minutes * 60))
+        if i is not None and store["minutes"][i] == minutes :
+            return(store["price"][i])
+
+    return(None)
+
+
+def get_range(zone, t_from, t_to) :
+    # [(UTC start, minutes, price)] of the slots from t_from up to t_to. Also the slot that t_from is in.
+    store = load_store(zone)
+    start = store["start"]
+    i = bisect_left(start, t_from)
+    if i > 0 and start[i - 1] + store["minutes"][i - 1] * 60 > t_from :
+        i -= 1
+
+    slots = []
+    while i < len(start) and start[i] < t_to :
+        slots.append((start[i], store["minutes"][i], store["price"][i]))
+        i += 1
+
+    return(slots)
+
+
+def get_day_rates(zone, day) :
+    # {hour: price} in local time, as pgart_misc_func.get_hourly_rates(). Empty when the day is not complete.
+    t0, t1 = get_day_bounds(day)
+    slots = get_range(zone, t0, t1)
+    if len(slots) == 0 or slots[0][0] != t0 or sum(minutes * 60 for t, minutes, price in slots) != t1 - t0 :
+        return({})
+
+    hours = array("b", [datetime.fromtimestamp(t).hour for t, minutes, price in slots])
+    return(get_hour_means((0, hours, array("d", [price for t, minutes, price in slots]))))
+
+
+def get_day_slots(zone, day) :
+    # [(hour, minute, price)] of the local day, for pgart_misc_func.get_hourly_rate_recs(). None when the day is not
+    # complete or has both hours and quarters.
+    t0, t1 = get_day_bounds(day)
+    slots = get_range(zone, t0, t1)
+    if len(slots) == 0 or len(set(minutes for t, minutes, price in slots)) != 1 :
+        return(None)
+
+    if slots[0][0] != t0 or len(slots) != get_nr_day_slots(day, slots[0][1]) :
+        return(None)
+
+    return([(datetime.fromtimestamp(t).hour, datetime.fromtimestamp(t).minute, price) for t, minutes, price in slots])
+
+
+def get_days_rates(zone, day_from, day_to) :
+    # [(yyyymmdd, {hour: price})] of the complete days from day_from to day_to.
+    store = load_store(zone)
+    if len(store["start"]) == 0 :
+        return([])
+
+    days = []
+    day = max(day_from, datetime.fromtimestamp(store["start"][0]).replace(hour=0, minute=0, second=0))
+    day_to = min(day_to, datetime.fromtimestamp(store["start"][-1]))
+    while day <= day_to :
+        hr_rates = get_day_rates(zone, day)
+        if len(hr_rates) > 0 :
+            days.append((datetime.strftime(day, "%Y%m%d"), hr_rates))
+
+        day += timedelta(1)
+
+    return(days)
+
+
+def fold_daily_files(zone, fi_names) :
+    # hourly_rate_yyyymmdd.txt files => the store, in one write. Returns (the files folded, the files that do not fit their day).
+    folded = []
+    skipped = []
+    slots = {60: [], 15: []}
+    for fi in fi_names :
+        day = datetime.strptime(os.path.basename(fi).split("_")[2].split(".")[0], "%Y%m%d")
+        f = open(fi, "r", encoding="utf8")
+        recs = [rec for rec in f.read().splitlines() if rec.strip() != ""]
+        f.close()
+        day_slots = recs_to_slots(day, recs)
+        if day_slots is None :
+            skipped.append(fi)
+            continue
+
+        slots[get_recs_minutes(recs)].extend(day_slots)
+        folded.append(fi)
+
+    for minutes, minutes_slots in slots.items() :
+        add_slots(zone, minutes_slots, minutes)
+    return(folded, skipped)
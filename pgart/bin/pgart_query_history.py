@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# Queries the history in var/history. Only the columns needed are read.
+# Average pump setpoint per hour in January 2024:
+#   pgart_query_history.py -f 20240101 -t 20240131 -c pump_temp -a avg -g hour
+# Hours with a windchill increase per day:
+#   pgart_query_history.py -c windchill_temp_increase -a count -g day -w "windchill_temp_increase>0"
+# The windchill evaluation codes per month:
+#   pgart_query_history.py -n windchill_stats -c evaluation_code -a count -g month -w "evaluation_code=3"
+# The longest run per hour in ms:
+#   pgart_query_history.py -n run_phases -c total_ms -a max -g hour
+# Columns: pgart_query_history.py -l
+
+import getopt, sys
+import time
+import re
+
+from datetime import datetime,timedelta
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_history_func as f10
+import pgart_lang_func as f8
+
+g_lang = f8.get_language()
+g_ui_text = f1.ui_texts(g_lang)
+te = f1.get_pgart_env()
+
+usage = "usage: pgart_query_history.py -n <run_summary|windchill_stats|run_phases> -f <yyyymmdd> -t <yyyymmdd> -c <column> -a <avg|min|max|sum|count> -g <hour|day|weekday|month|all> -w <column=value,column>value...> -l"
+
+
+def get_args() :
+    argv = sys.argv[1:]     # Bypass my own name
+    options = "n:f:t:c:a:g:w:l"
+    long_options = ["table=", "fromymd=", "toymd=", "column=", "aggregate=", "group=", "where=", "list"]
+    query = {"table": "run_summary", "from": "19700101", "to": "20371231", "column": "pump_temp",
+             "aggregate": "avg", "group": "day", "where": "", "list": False}
+    try:
+        args, values = getopt.getopt(argv, options, long_options)
+        for arg, val in args :
+            if arg in ("-n", "--table") :
+                query["table"] = val
+            elif arg in ("-f", "--fromymd") :
+                query["from"] = val
+            elif arg in ("-t", "--toymd") :
+                query["to"] = val
+            elif arg in ("-c", "--column") :
+                query["column"] = val
+            elif arg in ("-a", "--aggregate") :
+                query["aggregate"] = val
+            elif arg in ("-g", "--group") :
+                query["group"] = val
+            elif arg in ("-w", "--where") :
+                query["where"] = val
+            elif arg in ("-l", "--list") :
+                query["list"] = True
+    except getopt.error as err :
+        print(str(err))
+        print(usage)
+        exit()
+
+    if not query["table"] in f10.g_history_tables :
+        print(query["table"]+" "+g_ui_text["tp10"])
+        exit()
+
+    if query["list"] :
+        for table, columns in f10.g_history_tables.items() :
+            print(table+": "+", ".join(columns))
+        exit()
+
+    if not query["column"] in f10.g_history_tables[query["table"]] :
+        print(query["column"]+" "+g_ui_text["tp10"])
+        exit()
+
+    if not query["aggregate"] in ["avg", "min", "max", "sum", "count"] or not query["group"] in ["hour", "day", "weekday", "month", "all"] :
+        print(usage)
+        exit()
+
+    return(query)
+
+
+def get_conditions(table, where) :
+    # "windchill_temp_usage=set_hour,outdoor_temp<-5" => [(column, op, value)]. Text values are looked up in the dictionary.
+    conditions = []
+    codes = f10.get_history_dict(table)
+    for x in where.split(',') :
+        if x == "" :
+            continue
+
+        m = re.fullmatch(r"(\w+)(!=|>=|<=|=|>|<)(.+)", x.strip())
+        if m is None or not m.group(1) in f10.g_history_tables[table] :
+            print(x+" "+g_ui_text["tp10"])
+            exit()
+
+        column, op, val = m.groups()
+        if f10.g_history_tables[table][column] == "code" :
+            if val in codes.get(column, []) :
+                val = codes[column].index(val)
+            else :
+                val = -1            # Never stored.
+        else :
+            val = float(val)
+
+        conditions.append((column, op, val))
+
+    return(conditions)
+
+
+def is_row_selected(cols, i, conditions) :
+    for column, op, val in conditions :
+        x = cols[column][i]
+        if op == "=" :
+            selected = x == val
+        elif op == "!=" :
+            selected = x != val
+        elif op == ">" :
+            selected = x > val
+        elif op == "<" :
+            selected = x < val
+        elif op == ">=" :
+            selected = x >= val
+        else :
+            selected = x <= val
+
+        if not selected :
+            return(False)
+
+    return(True)
+
+
+def get_group_key(group, dt, hour) :
+    if group == "hour" :
+        return("{:02d}".format(hour))
+    if group == "all" :
+        return("all")
+
+    t = time.localtime(dt)
+    if group == "day" :
+        return(time.strftime("%Y-%m-%d", t))
+    if group == "weekday" :
+        return(str(t.tm_wday + 1))
+    return(time.strftime("%Y-%m", t))
+
+
+def run_query(query) :
+    table = query["table"]
+    column = query["column"]
+    conditions = get_conditions(table, query["where"])
+    dt_from = int(time.mktime(datetime.strptime(query["from"], "%Y%m%d").timetuple()))
+    dt_to = int(time.mktime((datetime.strptime(query["to"], "%Y%m%d") + timedelta(days=1)).timetuple()))
+    columns = ["dt", "hour", column] + [c for c, op, val in conditions]
+    columns = list(dict.fromkeys(columns))      # Each once.
+
+    groups = {}     # key: [count, sum, min, max]
+    nr_scanned = 0
+    for cols in f10.read_history_columns(table, columns, query["from"][0:6], query["to"][0:6]) :
+        dts = cols["dt"]
+        hours = cols["hour"]
+        values = cols[column]
+        nr_scanned += len(dts)
+        for i in range(len(dts)) :
+            if dts[i] < dt_from or dts[i] >= dt_to :
+                continue
+
+            if not is_row_selected(cols, i, conditions) :
+                continue
+
+            key = get_group_key(query["group"], dts[i], hours[i])
+            x = values[i]
+            if not key in groups :
+                groups[key] = [1, x, x, x]
+            else :
+                g = groups[key]
+                g[0] += 1
+                g[1] += x
+                g[2] = min(g[2], x)
+                g[3] = max(g[3], x)
+
+    return(groups, nr_scanned)
+
+
+def print_result(query, groups) :
+    codes = f10.get_history_dict(query["table"]).get(query["column"], [])
+    is_code = f10.g_history_tables[query["table"]][query["column"]] == "code"
+    print("{:10s} {:>10s} {:>7s}".format(query["group"], query["aggregate"]+"("+query["column"]+")", "count"))
+    for key in sorted(groups) :
+        count, total, min_x, max_x = groups[key]
+        if query["aggregate"] == "count" :
+            val = str(count)
+        elif is_code and query["aggregate"] in ["min", "max"] :
+            val = codes[int(min_x if query["aggregate"] == "min" else max_x)]
+        elif query["aggregate"] == "avg" :
+            val = "{:.2f}".format(total / count)
+        elif query["aggregate"] == "sum" :
+            val = "{:.2f}".format(total)
+        elif query["aggregate"] == "min" :
+            val = "{:.2f}".format(min_x)
+        else :
+            val = "{:.2f}".format(max_x)
+
+        print("{:10s} {:>10s} {:>7d}".format(key, val, count))
+
+
+query = get_args()
+t0 = time.time()
+groups, nr_scanned = run_query(query)
+print_result(query, groups)
+print("rows scanned:"+str(nr_scanned)+" ms:"+str(int((time.time() - t0) * 1000)))
@@ -97,6 +97,23 @@ def is_hr_hr_valid(hr_hr) :
 
     return(True, "")
 
+def is_log_limits_valid(log_limits) :
+    # log_limits: hourly_run:2048_7,action:1024_7
+    for x in log_limits.split(',') :
+        if x.count(":") != 1 or x.split(':')[1].count("_") != 1 :
+            return(False, g_ui_text["tp5j"]+" hourly_run:2048_7. "+str(x))
+
+        name, kb_days = x.split(':')
+        if not name in f0.get_rotated_log_files() :
+            return(False, name+" "+g_ui_text["tp10"]+" "+",".join(f0.get_rotated_log_files()))
+
+        buf = kb_days.split('_')
+        if not (buf[0].isnumeric() and buf[1].isnumeric()) :
+            return(False, g_ui_text["tp13"]+": "+str(x))
+
+    return(True, "")
+
+
 def is_exec_path_valid(rec_orig) :
     par, val = rec_orig.split("=", 1)
     print(par, val)
@@ -265,6 +282,12 @@ def get_parameters():
                     ret_stat = fi_par+" "+par+": "+result
                     break
 
+            elif par == "rotate_log_limits" :
+                status, result = is_log_limits_valid(val)
+                if not status :
+                    ret_stat = fi_par+" "+par+": "+result
+                    break
+
             elif par == "external_pgm_create_hourly_rates" or par == "external_pgm_create_forecasts" :
                 status, result = is_exec_path_valid(rec_orig)
                 val = result
@@ -0,0 +1,212 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# Sends the mails queued in var/spool/mail by pgart_misc_func.send_mail(). Started in the background when
+# pgart_control_heating.py ends. All mails are sent over one SMTP connection.
+# A mail with the same text as one sent less than mail_dedup_minutes ago waits in the queue. It is sent
+# when the time has passed, once, with the number of times it was reported.
+# Just one of these programs is running at a time. A mail left as .sending by one that stopped is queued again.
+
+import os
+import glob
+import json
+
+from datetime import datetime,timedelta
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None        # Windows. No locking.
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_lang_func as f8
+
+g_lang = f8.get_language()
+g_ui_text = f1.ui_texts(g_lang)
+te = f1.get_pgart_env()
+
+max_age_queued_mail = 48    # Hours. Then it is removed even if it was never sent.
+sending_grace_minutes = 10  # A .sending file older than this was left by a worker that stopped. Queued again.
+
+
+def get_sent_mails() :
+    # key: when a mail with that text was sent last.
+    sent = {}
+    try :
+        f = open(te["fi_mail_sent"], "r", encoding="utf8")
+        sent = json.load(f)
+        f.close()
+    except (OSError, ValueError) :
+        pass
+
+    return(sent)
+
+
+def save_sent_mails(sent, dedup_minutes) :
+    dt_old = datetime.strftime(datetime.now() - timedelta(minutes=dedup_minutes), "%Y-%m-%d %H:%M:%S")
+    sent = {key: dt for key, dt in sent.items() if dt > dt_old}
+    fi_tmp = te["fi_mail_sent"]+".tmp"
+    f = open(fi_tmp, "w", encoding="utf8")
+    json.dump(sent, f)
+    f.close()
+    os.replace(fi_tmp, te["fi_mail_sent"])
+
+
+def get_queued_mails() :
+    recs = []
+    for fi in glob.glob(te["g_mail_spool_dir"]+"/*.json") :
+        try :
+            f = open(fi, "r", encoding="utf8")
+            recs.append((fi, json.load(f)))
+            f.close()
+        except (OSError, ValueError) :
+            continue
+
+    recs.sort(key=lambda x: x[1]["first_dt"])
+    return(recs)
+
+
+def get_mail_text(rec) :
+    if rec["count"] == 1 :
+        return(rec["msg"])
+
+    return(rec["msg"]+"\n\n"+str(rec["count"])+" times between "+rec["first_dt"]+" and "+rec["last_dt"]+".")
+
+
+def requeue_mail(fi, fi_sending, rec) :
+    # The mail could not be sent. A new duplicate may have been queued meanwhile. Then add the counts.
+    rec["attempts"] += 1
+    if os.path.isfile(fi) :
+        try :
+            f = open(fi, "r", encoding="utf8")
+            new_rec = json.load(f)
+            f.close()
+            rec["count"] += new_rec["count"]
+            rec["last_dt"] = new_rec["last_dt"]
+        except (OSError, ValueError) :
+            pass
+
+    f = open(fi_sending, "w", encoding="utf8")
+    json.dump(rec, f, ensure_ascii=False)
+    f.close()
+    os.replace(fi_sending, fi)
+
+
+def recover_stale_mails() :
+    # A worker that crashed or was killed while sending leaves the mail as .sending. It is queued again.
+    # If it was sent but not yet noted in mail_sent.txt it may be sent again, else the dedup check holds it.
+    # The rename to .sending changes ctime, not mtime.
+    t_old = datetime.now().timestamp() - sending_grace_minutes * 60
+    for fi_sending in glob.glob(te["g_mail_spool_dir"]+"/*.sending") :
+        try :
+            if max(os.path.getmtime(fi_sending), os.path.getctime(fi_sending)) > t_old :
+                continue        # Perhaps another worker, without locking, is sending it now.
+
+            f = open(fi_sending, "r", encoding="utf8")
+            rec = json.load(f)
+            f.close()
+        except OSError :
+            continue
+        except ValueError :
+            f0.log_action_1("send_mail_queue:\n\tremoved. Not readable: "+fi_sending)
+            os.remove(fi_sending)
+            continue
+
+        fi = fi_sending[0:-len(".sending")]+".json"
+        requeue_mail(fi, fi_sending, rec)
+        f0.log_action_1("send_mail_queue:\n\tqueued again: "+fi+" count:"+str(rec["count"]))
+
+
+def send_queued_mails(mail_pars) :
+    dedup_minutes = int(mail_pars["mail_dedup_minutes"])
+    dt_now = datetime.now()
+    dt_dedup = datetime.strftime(dt_now - timedelta(minutes=dedup_minutes), "%Y-%m-%d %H:%M:%S")
+    dt_too_old = datetime.strftime(dt_now - timedelta(hours=max_age_queued_mail), "%Y-%m-%d %H:%M:%S")
+    sent = get_sent_mails()
+    s = None
+    nr_sent = 0
+    nr_waiting = 0
+    nr_failed = 0
+    for fi, rec in get_queued_mails() :
+        if rec["first_dt"] < dt_too_old :
+            f0.log_action_1("send_mail_queue:\n\tremoved. Not sent since "+rec["first_dt"]+". count:"+str(rec["count"]))
+            os.remove(fi)
+            continue
+
+        if rec["key"] in sent and sent[rec["key"]] > dt_dedup :       # The same text was sent a moment ago.
+            nr_waiting += 1
+            continue
+
+        fi_sending = fi[0:-len(".json")]+".sending"      # A new duplicate is queued in a new file meanwhile.
+        try :
+            os.rename(fi, fi_sending)
+        except OSError :
+            continue
+
+        if s is None :
+            try :
+                s = f0.open_smtp_connection(mail_pars)
+            except Exception as err :
+                f0.log_action_1("send_mail_queue:\n\tfailed. "+mail_pars["smtp_host"]+":"+mail_pars["smtp_port"]+" "+str(err))
+                requeue_mail(fi, fi_sending, rec)
+                return(nr_sent, nr_waiting, nr_failed + 1)
+
+        try :
+            sent_ok = f0.send_mail_via_smtp(s, mail_pars["mail_user"], mail_pars["mail_user"], mail_pars["mail_subject"], get_mail_text(rec))
+        except OSError as err :       # SMTPServerDisconnected too. The next mail opens a new connection.
+            f0.log_action_1("send_mail_queue:\n\tconnection lost. "+mail_pars["smtp_host"]+":"+mail_pars["smtp_port"]+" "+str(err))
+            try :
+                s.close()
+            except Exception :
+                pass
+            s = None
+            sent_ok = False
+
+        if sent_ok :
+            os.remove(fi_sending)
+            sent.update({rec["key"]: datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")})
+            nr_sent += 1
+        else :
+            requeue_mail(fi, fi_sending, rec)
+            nr_failed += 1
+
+    if s is not None :
+        try :
+            s.quit()
+        except Exception :
+            pass
+
+    if nr_sent > 0 :
+        save_sent_mails(sent, dedup_minutes)
+
+    return(nr_sent, nr_waiting, nr_failed)
+
+
+def main() :
+    f0.g_mail_worker_started = True     # Do not start another one of me when I end.
+    mail_pars = f0.get_mail_params()
+    if len(mail_pars) == 0 or mail_pars["mail_user"] == "none" :
+        return()
+
+    os.makedirs(te["g_mail_spool_dir"], exist_ok=True)
+    f_lock = open(te["fi_mail_queue_lock"], "w")
+    if fcntl is not None :
+        try :
+            fcntl.flock(f_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError :
+            return()                # Another one is sending. It will take these mails too.
+
+    recover_stale_mails()
+    nr_sent, nr_waiting, nr_failed = send_queued_mails(mail_pars)
+    if nr_sent + nr_failed > 0 :
+        f0.log_action_1("send_mail_queue:\n\tsent:"+str(nr_sent)+" waiting:"+str(nr_waiting)+" failed:"+str(nr_failed)+" "+mail_pars["mail_user"]+" "+mail_pars["mail_subject"])
+
+    f_lock.close()
+
+
+main()
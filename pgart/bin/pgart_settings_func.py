@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# Functions to keep the settings status (settings_status.txt) in memory during a run.
+# The file is read once and written once at the end of the run (or at a forced exit).
+# A record: {"date": "2023-03-01", "hour": 14, "value": [20, "text"]}
+
+# With state_store = sqlite the settings and one row per run summary are kept in pgart_state.db.
+# Everything from a run is written in one transaction.
+
+import json
+import os
+import atexit
+import sqlite3
+
+from pathlib import Path
+from datetime import datetime
+
+import pgart_env_func as f1
+
+te = f1.get_pgart_env()
+
+g_settings = None           # Not loaded yet.
+g_settings_dirty = False
+g_state_store = "file"
+g_run_summaries = []        # Rows for the run_summary table. Only for sqlite.
+
+
+def set_state_store(state_store) :
+    # Must be called before the first setting is used.
+    global g_state_store
+    g_state_store = state_store
+
+
+def open_state_db() :
+    con = sqlite3.connect(te["fi_state_db"])
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute(
+                "CREATE TABLE IF NOT EXISTS settings ("
+                "key TEXT PRIMARY KEY, date TEXT, hour INTEGER, value TEXT)")
+    con.execute(
+                "CREATE TABLE IF NOT EXISTS run_summary ("
+                "id INTEGER PRIMARY KEY, dt TEXT, call_id TEXT, actions TEXT, change_type TEXT, "
+                "outdoor_temp INTEGER, room_temp INTEGER, sensor_temp REAL, pump_temp INTEGER, new_temp INTEGER, "
+                "hr_rate_temp_decrease INTEGER, hr_rate_usage TEXT, windchill_temp_increase INTEGER, windchill_temp_usage TEXT)")
+    con.execute("CREATE INDEX IF NOT EXISTS run_summary_dt ON run_summary (dt)")
+    return(con)
+
+
+def load_settings_db() :
+    settings = {}
+    con = open_state_db()
+    for key, dt, hr, value in con.execute("SELECT key, date, hour, value FROM settings") :
+        settings[key] = {"date": dt, "hour": hr, "value": json.loads(value)}
+
+    nr_runs = con.execute("SELECT count(*) FROM run_summary").fetchone()[0]
+    con.close()
+    if len(settings) == 0 and nr_runs == 0 :
+        # A new database. Take over the status from the file.
+        return(load_settings_file())
+
+    return(settings)
+
+
+def flush_settings_db() :
+    con = open_state_db()
+    with con :          # One transaction.
+        con.execute("DELETE FROM settings")
+        con.executemany(
+                        "INSERT INTO settings (key, date, hour, value) VALUES (?, ?, ?, ?)",
+                        [(key, rec["date"], rec["hour"], json.dumps(rec["value"])) for key, rec in g_settings.items()])
+        con.executemany(
+                        "INSERT INTO run_summary (dt, call_id, actions, change_type, outdoor_temp, room_temp, sensor_temp, "
+                        "pump_temp, new_temp, hr_rate_temp_decrease, hr_rate_usage, windchill_temp_increase, windchill_temp_usage) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        g_run_summaries)
+    con.close()
+
+
+def add_run_summary(dt, call_id, actions, change_type, outdoor_temp, room_temp, sensor_temp, pump_temp, new_temp,
+                    hr_rate_temp_decrease, hr_rate_usage, windchill_temp_increase, windchill_temp_usage) :
+    global g_settings_dirty
+    if g_state_store != "sqlite" :
+        return()
+
+    g_run_summaries.append((
+                            dt, call_id, actions, change_type, outdoor_temp, room_temp, float(sensor_temp), pump_temp, new_temp,
+                            hr_rate_temp_decrease, hr_rate_usage, windchill_temp_increase, windchill_temp_usage))
+    g_settings_dirty = True
+
+
+def get_run_summaries(dt_from, dt_to) :
+    # dt as "2023-03-01_14:02". Uses the index on dt.
+    con = open_state_db()
+    rows = con.execute(
+                       "SELECT * FROM run_summary WHERE dt >= ? AND dt <= ? ORDER BY dt",
+                       (dt_from, dt_to)).fetchall()
+    con.close()
+    return(rows)
+
+
+def get_typed_field(field) :
+    try:
+        return(int(field))
+    except ValueError:
+        pass
+
+    try:
+        return(float(field))
+    except ValueError:
+        return(field)
+
+
+def convert_old_setting(val) :
+    # Before the records there was a string: "2023-03-01 14 20 text ..."
+    s = val.split(" ")
+    rec = {"date": s[0], "hour": 0, "value": []}
+    if len(s) > 1 :
+        rec["hour"] = get_typed_field(s[1])
+    for field in s[2:] :
+        rec["value"].append(get_typed_field(field))
+
+    return(rec)
+
+
+def load_settings() :
+    global g_settings
+    if g_settings is not None :
+        return(g_settings)
+
+    if g_state_store == "sqlite" :
+        g_settings = load_settings_db()
+    else :
+        g_settings = load_settings_file()
+
+    return(g_settings)
+
+
+def load_settings_file() :
+    settings = {}
+    fi = Path(te["fi_settings_status"])
+    if fi.is_file():
+        f = open(te["fi_settings_status"], 'r' , encoding="utf8")
+        try:
+            saved_settings = json.load(f)
+        except ValueError:
+            saved_settings = {}     # A damaged file. Start from scratch rather than stop the heating control.
+        f.close()
+
+        for key, val in saved_settings.items() :
+            if isinstance(val, str) :
+                val = convert_old_setting(val)
+            settings[key] = val
+
+    return(settings)
+
+
+def get_setting(key) :
+    settings = load_settings()
+    return(settings.get(key))
+
+
+def update_setting(key, hour, value) :
+    global g_settings_dirty
+    settings = load_settings()
+    dt = datetime.strftime(datetime.now(), "%Y-%m-%d")
+    settings[key] = {"date": dt, "hour": hour, "value": value}
+    g_settings_dirty = True
+
+
+def remove_setting(key) :
+    global g_settings_dirty
+    settings = load_settings()
+    if key in settings :
+        settings.pop(key)
+        g_settings_dirty = True
+        return(True)
+
+    return(False)
+
+
+def flush_settings() :
+    global g_settings_dirty
+    global g_run_summaries
+    if not g_settings_dirty :
+        return()
+
+    if g_state_store == "sqlite" :
+        load_settings()
+        flush_settings_db()
+        g_run_summaries = []
+    else :
+        flush_settings_file()
+    g_settings_dirty = False
+
+
+def flush_settings_file() :
+    # Write to a temporary file and rename it. A crash will leave either the old or the new file.
+    fi_tmp = te["fi_settings_status"]+".tmp"
+    f = open(fi_tmp, "w", encoding="utf8")
+    f.write(json.dumps(g_settings))
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    os.replace(fi_tmp, te["fi_settings_status"])
+
+
+atexit.register(flush_settings)     # Also at a forced exit.
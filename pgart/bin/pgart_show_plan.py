@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+# This file is part of PGART_T (Pump Gradual Adjustment Room Temperature for Thermia Atlas).
+
+# Copyright (C) 2023 PG Andersson <pg.andersson@gmail.com>.
+
+# pgart_t is free software: you can redistribute it and/or modify it under the terms of GPL-3.0-or-later
+
+# Shows the daily plan: what pgart_control_heating.py will do each hour. Nothing is fetched and the pump is not accessed.
+# The plan in var/daily_plan.json is shown if it is still valid, else it is worked out from the files there are now.
+#   pgart_show_plan.py          today.
+#   pgart_show_plan.py -t       tomorrow. Needs tomorrow's hourly_rate file for the hourly rate decreases.
+
+import getopt, sys
+
+from pathlib import Path
+from datetime import datetime,timedelta
+
+import pgart_misc_func as f0
+import pgart_env_func as f1
+import pgart_lang_func as f8
+import pgart_read_control_params_func as f7
+import pgart_daily_plan_func as f11
+
+g_lang = f8.get_language()
+g_ui_text = f1.ui_texts(g_lang)
+te = f1.get_pgart_env()
+
+
+def get_args() :
+    argv = sys.argv[1:]     # Bypass my own name
+    options = "t"
+    long_options = ["tomorrow"]
+    day = datetime.now()
+    try:
+        args, values = getopt.getopt(argv, options, long_options)
+        for arg, val in args :
+            if arg in ("-t", "--tomorrow") :
+                day = datetime.now() + timedelta(1)
+    except getopt.error as err :
+        print(str(err))
+        print("usage: pgart_show_plan.py -t")
+        exit()
+
+    return(day)
+
+
+def get_plan(day) :
+    ret_stat, general_pars, weekday_indoor_temp_hours = f7.get_parameters()
+    if ret_stat != "ok" :
+        print(ret_stat)
+        exit()
+
+    if general_pars['use_hourly_rates'] == "y" :
+        general_pars['hourly_rate_decrease_during_top_hours'] = 0     # As pgart_control_heating.py.
+
+    fi_hourly_rate = f11.get_fi_hourly_rate(day)
+    forecast_recs = None
+    if general_pars['use_windchill_compensation'] == "y" and Path(te["fi_forecast_short"]).is_file() :
+        forecast_recs = f0.read_recs(te["fi_forecast_short"])
+
+    plan = f11.get_daily_plans().get(datetime.strftime(day, "%Y-%m-%d"))
+    if plan is not None and plan["key"] == f11.get_plan_key(general_pars, weekday_indoor_temp_hours, day, fi_hourly_rate) \
+        and plan["forecast_key"] == f11.get_forecast_key(forecast_recs) :
+        return(plan, "stored")
+
+    return(f11.build_daily_plan(day, general_pars, weekday_indoor_temp_hours, fi_hourly_rate, forecast_recs), "worked out now")
+
+
+def print_plan(plan, how) :
+    windchill_results = f1.get_windchill_evaluation_texts(g_lang)
+    print(plan["date"]+" ("+how+")")
+    print("{:>4s} {:>9s} {:>9s} {:>13s} {:>8s} {:>10s} {:>7s}  {}".format(
+                                                                        "hour", "scheduled", "rate", "quarters", "hr_rate",
+                                                                        "windchill", "target", "windchill evaluation"))
+    for slot in plan["slots"] :
+        sched = str(slot["scheduled_temp"])+("*" if slot["scheduled_change"] else "")
+        rate = "-" if slot["hr_rate_price"] == 0 else "paus" if slot["hr_rate_price"] == -1 else "{:.2f}".format(slot["hr_rate_price"])
+        quarters = "-"
+        if len(slot.get("hr_rate_slots", [])) > 1 :      # Per quarter. rate is the mean of the hour.
+            quarters = "{:.2f}-{:.2f}".format(min(slot["hr_rate_slots"]), max(slot["hr_rate_slots"]))
+
+        evaluation = "-" if slot["windchill"] is None else windchill_results[str(slot["windchill"][0])]
+        if slot["hour"] == plan["night_hour"] :
+            evaluation = "night hour, no adjustments"
+
+        print("{:>4d} {:>9s} {:>9s} {:>13s} {:>8d} {:>10d} {:>7d}  {}".format(
+                                                                             slot["hour"], sched, rate, quarters, -slot["hr_rate_decrease"],
+                                                                      slot["windchill_increase"], slot["target"], evaluation))
+
+    print("* a scheduled change in set_indoor_temp_hours.")
+    if plan.get("rate_minutes") == 15 :
+        print("rate: the mean of the quarters of the hour, quarters: the lowest and highest.")
+
+
+day = get_args()
+plan, how = get_plan(day)
+print_plan(plan, how)
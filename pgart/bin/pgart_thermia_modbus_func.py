@@ -120,7 +120,7 @@ def tcp_set_indoor_temperature(ip, new_indoor_temp, logreq) :
 
 
 def tcp_modbus_transaction(ip, modbus_apu, rcv_len, logreq, run_type) :
-    if logreq == 1 :
+    if logreq > 0 :
         dt = datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M:%S")
         print("\n"+dt+" BEGIN: send "+run_type)
         print(ip)
@@ -132,7 +132,9 @@ def tcp_modbus_transaction(ip, modbus_apu, rcv_len, logreq, run_type) :
         info = "tcp_modbus_transaction:\n\tsocket creation failed: "+ip+" %s" %(err)
         f0.log_action(info, True)
 
+    # A pump that does not answer must not hang the run. Each connect, send and receive gets what is left of the time.
     try:
+        s.settimeout(f0.get_timeout(f0.modbus_timeout))
         s.connect((ip, 502))
     except socket.error as err:
         info = "tcp_modbus_transaction:\n\tConnect failed: "+ip+" %s" %(err)
@@ -141,21 +143,33 @@ def tcp_modbus_transaction(ip, modbus_apu, rcv_len, logreq, run_type) :
     nr_sent = 0
     nr_to_send = len(modbus_apu)
     while nr_sent < nr_to_send:
-        sent = s.send(modbus_apu[nr_sent:])
+        try:
+            s.settimeout(f0.get_timeout(f0.modbus_timeout))
+            sent = s.send(modbus_apu[nr_sent:])
+        except socket.error as err:
+            info = "tcp_modbus_transaction:\n\tSend failed: "+ip+" %s" %(err)
+            f0.log_action(info, True)
+
         if sent == 0:
             info = "tcp_modbus_transaction:\n\tsocket connection broken: "+ip
             f0.log_action(info, True)
 
         nr_sent = nr_sent + sent
 
-    if logreq == 1 :
+    if logreq > 0 :
         dt = datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M:%S")
         print("\n"+dt+" BEGIN: receive")
 
     msg_rcvd = []
     nr_rcvd = 0
     while nr_rcvd < rcv_len:
-        rcvd = s.recv(min(rcv_len - nr_rcvd, 1024))
+        try:
+            s.settimeout(f0.get_timeout(f0.modbus_timeout))
+            rcvd = s.recv(min(rcv_len - nr_rcvd, 1024))
+        except socket.error as err:
+            info = "tcp_modbus_transaction:\n\tReceive failed: "+ip+" %s" %(err)
+            f0.log_action(info, True)
+
         if rcvd == b'':
             info = "tcp_modbus_transaction:\n\tsocket connection broken: "+ip
             f0.log_action(info, True)
@@ -165,7 +179,7 @@ def tcp_modbus_transaction(ip, modbus_apu, rcv_len, logreq, run_type) :
 
     s.close()
     bytes_rcvd = b''.join(msg_rcvd)
-    if logreq == 1:
+    if logreq > 0 :
         dt = datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M:%S")
         print(bytes_rcvd.hex())
         print(dt+" END: receive")
@@ -19,16 +19,20 @@ import json
 from pathlib import Path
 from datetime import date,datetime,timedelta
 import hashlib
+import time
 import random
 import base64
 
 import pgart_misc_func as f0
 import pgart_env_func as f1
 import pgart_lang_func as f8
+import pgart_http_func as f13
 
 g_lang = f8.get_language()
 g_ui_text = f1.ui_texts(g_lang)
 
+g_login = {}        # Kept between the runs in pgart_control_heating_daemon.py. login_id, configuration, request_headers, expires.
+
 thermia_api_config_url, thermia_b2clogin_url, thermia_login_redirect_uri, thermia_client_id, thermia_scope = f1.get_url_thermia_api_azure_login()
 
 def parse_state_and_csrf(text):
@@ -47,9 +51,10 @@ def auth_via_azure(login_id, password, logreq, max_log_len):
     chars = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
     code_challenge = "".join(random.choice(chars) for _ in range(43))
     code_challenge_hash = str( base64.urlsafe_b64encode( hashlib.sha256( code_challenge.encode("utf-8") ).digest() ).rstrip(b"="), "utf-8" )
+    f13.get_session("thermia").cookies.clear()     # Not the cookies of an earlier login. The connection is kept.
 
     try:
-        request_auth = requests.get(
+        request_auth = f13.get(
             thermia_b2clogin_url + "/oauth2/v2.0/authorize",
             params = {
                 "client_id": thermia_client_id,
@@ -58,9 +63,10 @@ def auth_via_azure(login_id, password, logreq, max_log_len):
                 "response_type": "code",
                 "code_challenge": code_challenge_hash,
                 "code_challenge_method": "S256",
-            }
+            },
+            session = "thermia",
         )
-    except requests.exceptions.ConnectionError:
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         info = "request_auth:\n\t"+g_ui_text["t8"]
         f0.log_action(info, True)
 
@@ -78,7 +84,7 @@ def auth_via_azure(login_id, password, logreq, max_log_len):
     #f0.log_action(info, False)
 
     try:
-        request_self_asserted = requests.post(
+        request_self_asserted = f13.post(
             thermia_b2clogin_url + "/SelfAsserted",
             headers = {
                 "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
@@ -94,8 +100,9 @@ def auth_via_azure(login_id, password, logreq, max_log_len):
                 "tx": "StateProperties=" + state_code,
                 "p": "B2C_1A_SignUpOrSigninOnline",
             },
+            session = "thermia",
         )
-    except requests.exceptions.ConnectionError:
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         info = "request_self_asserted:\n\t"+g_ui_text["t8b"]
         f0.log_action(info, True)
 
@@ -117,7 +124,7 @@ def auth_via_azure(login_id, password, logreq, max_log_len):
     f0.log_action(info, False)
 
     try:
-        request_confirmed = requests.get(
+        request_confirmed = f13.get(
             thermia_b2clogin_url + "/api/CombinedSigninAndSignup/confirmed",
             cookies = request_confirmed_cookies,
             params = {
@@ -125,8 +132,9 @@ def auth_via_azure(login_id, password, logreq, max_log_len):
                 "tx": "StateProperties=" + state_code,
                 "p": "B2C_1A_SignUpOrSigninOnline",
             },
+            session = "thermia",
         )
-    except requests.exceptions.ConnectionError:
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         info = "request_confirmed: "+g_ui_text["t8"]
         f0.log_action(info, True)
 
@@ -139,7 +147,7 @@ def auth_via_azure(login_id, password, logreq, max_log_len):
     f0.log_action(info, False)
 
     try:
-        request_token = requests.post(
+        request_token = f13.post(
             thermia_b2clogin_url + "/oauth2/v2.0/token",
             headers = {
                 "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
@@ -151,9 +159,10 @@ def auth_via_azure(login_id, password, logreq, max_log_len):
                 "code": request_confirmed.url.split("code=")[1],
                 "code_verifier": code_challenge,
                 "grant_type": "authorization_code",
-            }
+            },
+            session = "thermia",
         )
-    except requests.exceptions.ConnectionError:
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         info = "request_token:\n\t"+g_ui_text["t8"]
         f0.log_action(info, True)
 
@@ -166,6 +175,7 @@ def auth_via_azure(login_id, password, logreq, max_log_len):
     f0.log_action(info, False)
 
     authentication = json.loads(request_token.text)
+    g_login["expires"] = time.time() + int(authentication.get("expires_in", 3600)) - 300   # A margin for a long run.
     request_headers = {
         "Authorization": "Bearer " + authentication["access_token"],
         "Content-Type": "application/json",
@@ -174,10 +184,20 @@ def auth_via_azure(login_id, password, logreq, max_log_len):
     return(request_headers)
 
 
+def forget_login() :
+    # The next login gets a new token. After a failed run the token could be the reason.
+    g_login.clear()
+    f13.close_session("thermia")
+
+
 def thermia_api_login(login_id, password, logreq, max_log_len):
+    if g_login.get("login_id") == login_id and time.time() < g_login.get("expires", 0) :
+        info = "login-status:"+g_ui_text["t10"]+" Token from an earlier run."
+        return(info, g_login["configuration"], g_login["request_headers"])
+
     try:
-        request_config = requests.get(thermia_api_config_url)
-    except requests.exceptions.ConnectionError:
+        request_config = f13.get(thermia_api_config_url, session="thermia")
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         info = "login_get_config:\n\t"+g_ui_text["t6"]
         f0.log_action(info, True)
 
@@ -195,6 +215,7 @@ def thermia_api_login(login_id, password, logreq, max_log_len):
 
     info = "END login:\n\tauth_via_azure"
     f0.log_action(info, False)
+    g_login.update({"login_id": login_id, "configuration": configuration, "request_headers": request_headers})
     info = "login-status:"+g_ui_text["t10"]
     return(info, configuration, request_headers)
 
@@ -202,8 +223,8 @@ def thermia_api_login(login_id, password, logreq, max_log_len):
 def thermia_api_get_devices(configuration, request_headers, logreq, max_log_len):
     url = (configuration["apiBaseUrl"]+"/api/v1/InstallationsInfo/own")
     try:
-        request = requests.get(url, headers=request_headers)
-    except requests.exceptions.ConnectionError:
+        request = f13.get(url, headers=request_headers, session="thermia")
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         info = "thermia_api_get_devices:\n\t"+g_ui_text["t11"]
         f0.log_action(info, True)
 
@@ -217,8 +238,8 @@ def thermia_api_get_devices(configuration, request_headers, logreq, max_log_len)
 def thermia_api_get_device_info(configuration, request_headers, id, logreq, max_log_len):
     url = (configuration["apiBaseUrl"]+"/api/v1/installationstatus/"+str(id)+"/status")
     try:
-        request = requests.get(url, headers=request_headers)
-    except requests.exceptions.ConnectionError:
+        request = f13.get(url, headers=request_headers, session="thermia")
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         info = "thermia_api_get_device_info: "+g_ui_text["t13"]
         f0.log_action(info, True)
 
@@ -237,8 +258,8 @@ def thermia_api_set_indoor_temperature(request_headers, configuration, id, heati
         "clientUuid": "api-client-uuid",
     }
     try:
-        request = requests.post(url, headers=request_headers, json=new_temp)
-    except requests.exceptions.ConnectionError:
+        request = f13.post(url, headers=request_headers, json=new_temp, session="thermia")
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         info = "thermia_api_set_indoor_temperature:\n\t"+g_ui_text["t15"]
         f0.log_action(info, True)
 